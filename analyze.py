@@ -1,10 +1,49 @@
 import os
-import sqlite3
 import re
+import json
+import mmap
+import codecs
+import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import rules
+import hashcache
+import hooktargets
+import metrics
+
+BATCH_SIZE = 5000          # Analyses written per transaction
+SQL_VARIABLE_BATCH = 500   # Bound parameters per IN (...) lookup
+CACHE_SIZE_KB = 64 * 1024  # SQLite page cache
+SCAN_CHUNK = 1024 * 1024   # Bytes of a mapped script hashed and scanned per step
+MADV_DONTNEED = getattr(mmap, "MADV_DONTNEED", None)
+JOB_CHUNK = 64             # Scripts handed to a worker process at a time
+TEXT_BATCH_BYTES = 64 * 1024 * 1024  # Script text written per full-text transaction
+TEXT_CHUNK = 1024 * 1024   # Characters per full-text row
+TEXT_OVERLAP = 256         # Characters repeated between consecutive full-text rows
+TEXT_CHUNK_SHIFT = 20      # Full-text rowid = (Scripts id << TEXT_CHUNK_SHIFT) + chunk number
+FTS_TOKENIZER = "unicode61 tokenchars '_$'"  # Keep JS identifiers such as _super or $init whole
+
+def add_missing_columns(cursor, table, columns):
+    """Add columns introduced after a database was first created."""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for column, declaration in columns.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+def connect(db_path="scripts/scripts.db"):
+    """Open the script database in WAL mode with pragmas tuned for bulk writes."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
 
 def setup_database(db_path="scripts/scripts.db"):
     """Initialize the SQLite database with necessary tables."""
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
 
     # Create Scripts table
@@ -15,9 +54,17 @@ def setup_database(db_path="scripts/scripts.db"):
         filepath TEXT,
         tags TEXT,
         original_name TEXT,
-        size INTEGER
+        size INTEGER,
+        rules_version TEXT,
+        sha256 TEXT,
+        rule_hits TEXT,
+        targets_version INTEGER
     )
     """)
+    add_missing_columns(cursor, "Scripts", {"rules_version": "TEXT", "sha256": "TEXT", "rule_hits": "TEXT",
+                                            "targets_version": "INTEGER"})
+    # Scripts are keyed by content; rows from before this column existed stay NULL.
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_scripts_sha256 ON Scripts(sha256)")
 
     # Create Actions table
     cursor.execute("""
@@ -30,114 +77,601 @@ def setup_database(db_path="scripts/scripts.db"):
     )
     """)
 
+    # Tags normalized out of Scripts.tags, which is kept for display
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Tags (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ScriptTags (
+        tag_id INTEGER,
+        script_id INTEGER,
+        PRIMARY KEY(tag_id, script_id),
+        FOREIGN KEY(tag_id) REFERENCES Tags(id),
+        FOREIGN KEY(script_id) REFERENCES Scripts(id)
+    ) WITHOUT ROWID
+    """)
+    # Classes, methods and native symbols each script hooks (see hooktargets.py);
+    # member is '' for a class itself, target is '' for a symbol in any module
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS HookTargets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT,
+        target TEXT,
+        member TEXT,
+        script_id INTEGER,
+        UNIQUE(kind, target, member, script_id),
+        FOREIGN KEY(script_id) REFERENCES Scripts(id)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_hooktargets_target ON HookTargets(target, script_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_hooktargets_member ON HookTargets(member, script_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_hooktargets_script ON HookTargets(script_id)")
+
+    # UNIQUE(action_name, script_id) already indexes lookups by action;
+    # these cover lookups by script and by name.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scripttags_script ON ScriptTags(script_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_actions_script ON Actions(script_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scripts_filename ON Scripts(filename)")
+    if not cursor.execute("SELECT 1 FROM ScriptTags LIMIT 1").fetchone():
+        _backfill_tags(cursor)
+
+    # Full-text index over script bodies, stored in TEXT_CHUNK pieces so a
+    # large script never has to be held in memory whole. The rowid is
+    # (Scripts id << TEXT_CHUNK_SHIFT) + chunk number.
+    try:
+        cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS ScriptText USING fts5(body, tokenize="{FTS_TOKENIZER}")
+        """)
+        if cursor.execute("SELECT 1 FROM ScriptText WHERE rowid < ? LIMIT 1",
+                          (1 << TEXT_CHUNK_SHIFT,)).fetchone():
+            # One row per script (rowid = Scripts id); rebuilt by index_missing_text
+            cursor.execute("DELETE FROM ScriptText")
+    except sqlite3.OperationalError as e:
+        print(f"[ERROR] Full-text search unavailable (SQLite without FTS5): {e}")
+
+    # Every rule set that produced stored results, so a later rule change
+    # can work out which scripts it affects
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS RuleSets (
+        version TEXT PRIMARY KEY,
+        rules TEXT
+    )
+    """)
+
+    # Rows from before scripts were keyed by sha256 were inserted again on
+    # every run; analyze_scripts recreates them keyed by content.
+    legacy = [row[0] for row in cursor.execute("SELECT id FROM Scripts WHERE sha256 IS NULL")]
+    if legacy:
+        _delete_scripts(conn, legacy)
+        print(f"[INFO] Removed {len(legacy)} script rows without a content hash; they are re-analyzed.")
+
     conn.commit()
     conn.close()
     print("[INFO] Database setup completed.")
 
+def _backfill_tags(cursor):
+    """Fill ScriptTags from the comma-joined Scripts.tags of existing rows."""
+    rows = [(script_id, tag) for script_id, tags in cursor.execute(
+                "SELECT id, tags FROM Scripts WHERE tags IS NOT NULL AND tags != ''").fetchall()
+            for tag in tags.split(", ")]
+    if not rows:
+        return
+    tag_ids = _tag_ids(cursor, {tag for _, tag in rows})
+    cursor.executemany("INSERT OR IGNORE INTO ScriptTags (tag_id, script_id) VALUES (?, ?)",
+                       [(tag_ids[tag], script_id) for script_id, tag in rows])
+
+def _tag_ids(conn, names):
+    """Return {tag name: Tags id}, creating tags that do not exist yet."""
+    names = sorted(names)
+    conn.executemany("INSERT OR IGNORE INTO Tags (name) VALUES (?)", [(name,) for name in names])
+    tag_ids = {}
+    for start in range(0, len(names), SQL_VARIABLE_BATCH):
+        chunk = names[start:start + SQL_VARIABLE_BATCH]
+        marks = ",".join("?" * len(chunk))
+        tag_ids.update(conn.execute(f"SELECT name, id FROM Tags WHERE name IN ({marks})", chunk))
+    return tag_ids
+
+def has_text_index(conn):
+    """Whether the database has the FTS5 ScriptText table."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'ScriptText'").fetchone() is not None
+
+def _select_by_ids(conn, sql, ids):
+    """Run sql (with an {ids} placeholder) over ids in chunks and yield the rows."""
+    ids = list(ids)
+    for start in range(0, len(ids), SQL_VARIABLE_BATCH):
+        chunk = ids[start:start + SQL_VARIABLE_BATCH]
+        yield from conn.execute(sql.format(ids=",".join("?" * len(chunk))), chunk)
+
+def _delete_scripts(conn, script_ids):
+    """Delete Scripts rows with their Actions, ScriptTags, HookTargets and full-text rows."""
+    for table in ("Actions", "ScriptTags", "HookTargets"):
+        conn.executemany(f"DELETE FROM {table} WHERE script_id = ?", [(script_id,) for script_id in script_ids])
+    if has_text_index(conn):
+        conn.executemany("DELETE FROM ScriptText WHERE rowid >= ? AND rowid < ?",
+                         [(script_id << TEXT_CHUNK_SHIFT, (script_id + 1) << TEXT_CHUNK_SHIFT)
+                          for script_id in script_ids])
+    conn.executemany("DELETE FROM Scripts WHERE id = ?", [(script_id,) for script_id in script_ids])
+
+def _sync_links(conn, table, columns, existing_sql, wanted):
+    """
+    Make the (*columns, script_id) rows of table match wanted, which maps
+    script_id to the set of column value tuples it should have. Only
+    differences are written.
+    """
+    existing = {}
+    for row in _select_by_ids(conn, existing_sql, wanted):
+        existing.setdefault(row[0], set()).add(row[1:])
+
+    to_insert = []
+    to_delete = []
+    for script_id, values in wanted.items():
+        have = existing.get(script_id, set())
+        to_insert.extend((*value, script_id) for value in values - have)
+        to_delete.extend((*value, script_id) for value in have - values)
+
+    names = ", ".join(columns)
+    match = " AND ".join(f"{column} = ?" for column in columns)
+    conn.executemany(f"DELETE FROM {table} WHERE {match} AND script_id = ?", to_delete)
+    conn.executemany(f"""
+    INSERT INTO {table} ({names}, script_id) VALUES ({", ".join("?" * (len(columns) + 1))})
+    ON CONFLICT({names}, script_id) DO NOTHING
+    """, to_insert)
+
+def _text_chunks(pieces):
+    """
+    Regroup decoded text pieces into TEXT_CHUNK-character chunks. Each chunk
+    starts with the last TEXT_OVERLAP characters of the one before, so
+    words and short phrases on a boundary are still found whole.
+    """
+    pending = ""
+    for piece in pieces:
+        pending += piece
+        start = 0
+        while len(pending) - start >= TEXT_CHUNK + TEXT_OVERLAP:
+            yield pending[start:start + TEXT_CHUNK + TEXT_OVERLAP]
+            start += TEXT_CHUNK
+        pending = pending[start:]
+    if pending:
+        yield pending
+
+def _read_text(script_path):
+    """Yield the decoded text of a script SCAN_CHUNK bytes at a time."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open(script_path, "rb") as script_file:
+        for data in iter(lambda: script_file.read(SCAN_CHUNK), b""):
+            yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+def _index_script_text(conn, script_id, pieces):
+    """Insert one script's text chunks; returns the number of characters written."""
+    written = 0
+    for number, chunk in enumerate(_text_chunks(pieces)):
+        conn.execute("INSERT INTO ScriptText (rowid, body) VALUES (?, ?)",
+                     ((script_id << TEXT_CHUNK_SHIFT) + number, chunk))
+        written += len(chunk)
+    return written
+
+def index_text(conn, bodies):
+    """
+    Add script bodies ({script_id: text}) to the full-text index.
+    Content never changes for a Scripts id (rows are keyed by sha256), so
+    ids that are already indexed are left alone.
+    """
+    if not bodies or not has_text_index(conn):
+        return 0
+    indexed = {row[0] >> TEXT_CHUNK_SHIFT for row in _select_by_ids(
+        conn, "SELECT rowid FROM ScriptText WHERE rowid IN ({ids})",
+        [script_id << TEXT_CHUNK_SHIFT for script_id in bodies])}
+    added = 0
+    for script_id, body in bodies.items():
+        if script_id not in indexed:
+            _index_script_text(conn, script_id, [body])
+            added += 1
+    return added
+
+@metrics.timed("text_index_seconds")
+def index_missing_text(conn):
+    """
+    Index the bodies of scripts whose text is not in the full-text index yet.
+    Scripts are streamed chunk by chunk and committed every TEXT_BATCH_BYTES,
+    so memory does not grow with the size of a script or of the library.
+    """
+    if not has_text_index(conn):
+        return 0
+    missing = conn.execute("""
+    SELECT id, filepath FROM Scripts
+    WHERE NOT EXISTS (SELECT 1 FROM ScriptText WHERE ScriptText.rowid = Scripts.id << ?)
+    """, (TEXT_CHUNK_SHIFT,)).fetchall()
+    total = 0
+    held = 0
+    try:
+        for script_id, script_path in missing:
+            try:
+                held += _index_script_text(conn, script_id, _read_text(script_path))
+            except OSError as e:
+                conn.execute("DELETE FROM ScriptText WHERE rowid >= ? AND rowid < ?",
+                             (script_id << TEXT_CHUNK_SHIFT, (script_id + 1) << TEXT_CHUNK_SHIFT))
+                print(f"[ERROR] Failed to index script {script_path}: {e}")
+                continue
+            total += 1
+            if held >= TEXT_BATCH_BYTES:
+                conn.commit()
+                held = 0
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if total:
+        print(f"[INFO] Added {total} scripts to the full-text index.")
+    return total
+
+def save_rule_set(conn, compiled):
+    """Remember the rules behind a rules_version."""
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO RuleSets (version, rules) VALUES (?, ?)",
+                     (compiled.version, json.dumps(compiled.rules, sort_keys=True)))
+
+def load_rule_set(conn, version):
+    """Return the rules stored for a rules_version, or None if unknown."""
+    row = conn.execute("SELECT rules FROM RuleSets WHERE version = ?", (version,)).fetchone()
+    return json.loads(row[0]) if row else None
+
 def extract_actions_from_script(script_path):
     """
     Analyze a script and extract actions based on patterns.
     Returns a dictionary with tags and actions.
     """
-    actions = set()
-    tags = set()
+    return analyze_file(script_path)
 
-    try:
-        with open(script_path, "r") as script_file:
-            content = script_file.read()
-
-            # Example: Detect Java Hooks
-            if "Java.perform" in content or "Java.use" in content:
-                tags.add("Java Hooks")
-                actions.add("Java.perform")
-                actions.add("Java.use")
-
-            # Example: Detect Interceptor hooks
-            if "Interceptor.attach" in content:
-                tags.add("Interceptor Hooks")
-                actions.add("Interceptor.attach")
-
-            # Example: Detect SSL Pinning Bypass
-            if "SSLContext" in content or "TrustManager" in content:
-                tags.add("SSL Pinning Bypass")
-                actions.add("SSLContext Hook")
-                actions.add("TrustManager Hook")
-
-            # Add more patterns here for additional tags/actions
-            if "recv" in content or "send" in content:
-                tags.add("Data Communication")
-                actions.add("recv")
-                actions.add("send")
-
-            # General hooks or interesting keywords
-            generic_keywords = ["hook", "bypass", "trace"]
-            for keyword in generic_keywords:
-                if keyword in content.lower():
-                    tags.add(f"Generic-{keyword.capitalize()}")
-                    actions.add(f"Generic-{keyword.capitalize()}")
+def _mapped_chunks(script_path):
+    """
+    Yield a script SCAN_CHUNK bytes at a time from a read-only mmap.
+    Pages are dropped from this process once their chunk has been used, so
+    memory stays flat however large the script is.
+    """
+    with open(script_path, "rb") as script_file:
+        size = os.fstat(script_file.fileno()).st_size
+        if size == 0:
+            return  # Empty files cannot be mapped
+        with mmap.mmap(script_file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            for offset in range(0, size, SCAN_CHUNK):
+                yield content[offset:offset + SCAN_CHUNK]
+                if MADV_DONTNEED is not None:
+                    content.madvise(MADV_DONTNEED, offset, min(SCAN_CHUNK, size - offset))
+
+@metrics.timed("analyze_file_seconds")
+def analyze_file(script_path, with_text=True):
+    """
+    Hash and scan a script in one pass over a read-only mmap.
+    Returns the analysis dictionary with the script's sha256, size and hook
+    targets added (None if the script could not be read). With with_text the
+    decoded text is added for the full-text index; that is the only copy of
+    the whole file.
+    """
+    scanner = rules.ActionScanner()
+    extractor = hooktargets.TargetExtractor()
+    digest = hashlib.sha256()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = [] if with_text else None
+    sha256 = None
+    size = None
 
+    try:
+        size = 0
+        for chunk in _mapped_chunks(script_path):
+            scanner.feed(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+            piece = decoder.decode(chunk)
+            extractor.feed(piece)
+            if with_text:
+                text.append(piece)
+        piece = decoder.decode(b"", final=True)
+        extractor.feed(piece)
+        if with_text:
+            text.append(piece)
+        targets = extractor.result()
+        sha256 = digest.hexdigest()
     except Exception as e:
         print(f"[ERROR] Failed to analyze script {script_path}: {e}")
+        size = None
+        text = None
+        targets = None
 
-    return {
-        "tags": list(tags),
-        "actions": list(actions)
-    }
+    analysis = scanner.result()
+    analysis["sha256"] = sha256
+    analysis["size"] = size
+    analysis["hook_targets"] = targets
+    analysis["text"] = "".join(text) if sha256 and with_text else None
+    return analysis
 
-def analyze_scripts(organized_dir="scripts/organized/general", db_path="scripts/scripts.db"):
-    """Analyze all scripts in the organized directory and update the database."""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+_subsets = {}  # frozenset of rule indexes -> (CompiledRules, index mapping), per process
 
-    # Get all scripts in the directory
-    scripts = [f for f in os.listdir(organized_dir) if f.endswith(".js")]
-    if not scripts:
-        print("[INFO] No scripts found in the organized directory.")
-        return
+@metrics.timed("scan_rules_seconds")
+def scan_rules(script_path, rule_indexes):
+    """
+    Scan a script for only the given rules of the default rule set, and
+    extract its hook targets in the same pass.
+    Returns (matching rule indexes, hook targets).
+    """
+    key = frozenset(rule_indexes)
+    if key not in _subsets:
+        _subsets[key] = rules.default_rules().subset(key)
+    subset, mapping = _subsets[key]
+    scanner = rules.ActionScanner(subset)
+    extractor = hooktargets.TargetExtractor()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in _mapped_chunks(script_path):
+        scanner.feed(chunk)
+        extractor.feed(decoder.decode(chunk))
+    extractor.feed(decoder.decode(b"", final=True))
+    return {mapping[index] for index in scanner.matched}, extractor.result()
 
-    for script in scripts:
-        script_path = os.path.join(organized_dir, script)
+def _run_job(job):
+    """
+    Worker entry point. job is (script_path, rule_indexes): a full analysis
+    when rule_indexes is None, otherwise a scan_rules() for just those rules.
+    Text is left to index_missing_text so results stay small to send back.
+    """
+    script_path, rule_indexes = job
+    if rule_indexes is None:
+        return analyze_file(script_path, with_text=False)
+    try:
+        return scan_rules(script_path, rule_indexes)
+    except OSError as e:
+        print(f"[ERROR] Failed to analyze script {script_path}: {e}")
+        return None
+
+@metrics.timed("db_write_seconds", db="scripts")
+def write_analyses(conn, rows):
+    """
+    Upsert a batch of analyses keyed by content hash.
+    rows is a list of (script, script_path, analysis) where analysis carries
+    sha256 and size, and optionally the script text for the full-text index
+    and its hook targets.
+    Scripts rows are only rewritten when something about them changed, and
+    Actions/ScriptTags/HookTargets rows are diffed so unchanged ones are left alone;
+    re-running with the same input writes nothing.
+    A path whose content changed loses its row for the old content, with
+    everything linked to it, so a script is never listed under a version
+    it no longer has.
+    Returns {sha256: script_id} for the batch.
+    """
+    rows = [row for row in rows if row[2].get("sha256")]
+    if not rows:
+        return {}
 
-        # Extract features and tags
-        analysis = extract_actions_from_script(script_path)
-        tags = ", ".join(analysis["tags"])
-        actions = analysis["actions"]
+    with conn:
+        shas = {analysis["sha256"] for _, _, analysis in rows}
+        stale = [script_id for script_id, sha256 in _select_by_ids(
+            conn, "SELECT id, sha256 FROM Scripts WHERE filepath IN ({ids})",
+            {script_path for _, script_path, _ in rows}) if sha256 not in shas]
+        _delete_scripts(conn, stale)
 
-        # Insert script metadata into the Scripts table
-        cursor.execute("""
-        INSERT INTO Scripts (filename, filepath, tags, original_name, size)
-        VALUES (?, ?, ?, ?, ?)
-        """, (
+        conn.executemany("""
+        INSERT INTO Scripts (filename, filepath, tags, original_name, size, rules_version, sha256, rule_hits,
+                             targets_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(sha256) DO UPDATE SET
+            filename = excluded.filename,
+            filepath = excluded.filepath,
+            tags = excluded.tags,
+            size = excluded.size,
+            rules_version = excluded.rules_version,
+            rule_hits = excluded.rule_hits,
+            targets_version = COALESCE(excluded.targets_version, Scripts.targets_version)
+        WHERE Scripts.filename IS NOT excluded.filename
+           OR Scripts.filepath IS NOT excluded.filepath
+           OR Scripts.tags IS NOT excluded.tags
+           OR Scripts.size IS NOT excluded.size
+           OR Scripts.rules_version IS NOT excluded.rules_version
+           OR Scripts.rule_hits IS NOT excluded.rule_hits
+           OR Scripts.targets_version IS NOT COALESCE(excluded.targets_version, Scripts.targets_version)
+        """, [(
             script,
             script_path,
-            tags,
+            ", ".join(analysis["tags"]),
             script,  # Using the current name as the original name
-            os.path.getsize(script_path)
-        ))
+            analysis["size"],
+            analysis.get("rules_version"),
+            analysis["sha256"],
+            ",".join(analysis["rule_hits"]) if "rule_hits" in analysis else None,
+            hooktargets.EXTRACTOR_VERSION if analysis.get("hook_targets") is not None else None
+        ) for script, script_path, analysis in rows])
 
-        script_id = cursor.lastrowid  # Get the ID of the inserted script
+        script_ids = dict(_select_by_ids(
+            conn, "SELECT sha256, id FROM Scripts WHERE sha256 IN ({ids})",
+            [analysis["sha256"] for _, _, analysis in rows]))
 
-        # Insert actions into the Actions table
-        for action in actions:
-            try:
-                cursor.execute("""
-                INSERT INTO Actions (action_name, script_id)
-                VALUES (?, ?)
-                """, (action, script_id))
-            except sqlite3.IntegrityError:
-                # Skip duplicates
-                pass
+        _sync_links(conn, "Actions", ("action_name",),
+                    "SELECT script_id, action_name FROM Actions WHERE script_id IN ({ids})",
+                    {script_ids[analysis["sha256"]]: {(action,) for action in analysis["actions"]}
+                     for _, _, analysis in rows})
 
-        print(f"[INFO] Processed script: {script} (Tags: {tags})")
+        tag_ids = _tag_ids(conn, {tag for _, _, analysis in rows for tag in analysis["tags"]})
+        _sync_links(conn, "ScriptTags", ("tag_id",),
+                    "SELECT script_id, tag_id FROM ScriptTags WHERE script_id IN ({ids})",
+                    {script_ids[analysis["sha256"]]: {(tag_ids[tag],) for tag in analysis["tags"]}
+                     for _, _, analysis in rows})
 
-    conn.commit()
+        # Analyses reused from the cache carry no targets; theirs are kept.
+        _sync_links(conn, "HookTargets", ("kind", "target", "member"),
+                    "SELECT script_id, kind, target, member FROM HookTargets WHERE script_id IN ({ids})",
+                    {script_ids[analysis["sha256"]]: set(analysis["hook_targets"])
+                     for _, _, analysis in rows if analysis.get("hook_targets") is not None})
+
+        index_text(conn, {script_ids[analysis["sha256"]]: analysis["text"]
+                          for _, _, analysis in rows if analysis.get("text") is not None})
+
+    return script_ids
+
+class AnalysisCache:
+    """
+    Previous analyses keyed by content hash, and what a rule change means for them.
+    A stored result is reused as-is when its rules_version is current. When
+    the rules changed, only the rules whose patterns changed are scanned
+    again (see rules.plan_rescan); a script is not read at all if none of
+    them can change its result.
+    """
+
+    def __init__(self, conn, compiled):
+        self.conn = conn
+        self.compiled = compiled
+        self.stored = {row[0]: row[1:] for row in conn.execute(
+            "SELECT sha256, filename, filepath, rules_version, rule_hits, size, targets_version "
+            "FROM Scripts WHERE sha256 IS NOT NULL")}
+        self.plans = {}  # old rules_version -> plan, or None if the old rules are unknown
+
+    def lookup(self, script, script_path, sha256):
+        """
+        Return one of
+          ("current", None)   the stored row needs no change at all,
+          ("reuse", analysis) the result is known without reading the script,
+          ("rescan", (found, to_scan)) only the rules in to_scan have to be
+                              checked against the script (see finish()),
+          ("miss", None)      the script has to be analyzed from scratch.
+        """
+        row = self.stored.get(sha256)
+        if row is None or row[3] is None:
+            return "miss", None
+        filename, filepath, version, hits, size, targets_version = row
+        hit_ids = set(hits.split(",")) if hits else set()
+        targets_current = targets_version == hooktargets.EXTRACTOR_VERSION
+
+        if version == self.compiled.version:
+            if filename == script and filepath == script_path and targets_current:
+                return "current", None
+            found = {index for index, rule in enumerate(self.compiled.rules) if rule["id"] in hit_ids}
+            to_scan = set()
+        else:
+            plan = self._plan(version)
+            if plan is None:
+                return "miss", None
+            found, to_scan = rules.resolve_plan(plan, self.compiled.rules, hit_ids)
+        if to_scan or not targets_current:
+            # Hook targets are re-extracted whenever the script is read anyway.
+            return "rescan", (found, to_scan)
+        return "reuse", self.finish(sha256, found)
+
+    def finish(self, sha256, found, targets=None):
+        """Build the analysis of a stored script from its matched rule indexes."""
+        analysis = self.compiled.result(found)
+        analysis["sha256"] = sha256
+        analysis["size"] = self.stored[sha256][4]
+        analysis["hook_targets"] = targets
+        return analysis
+
+    def _plan(self, version):
+        if version not in self.plans:
+            old_rules = load_rule_set(self.conn, version)
+            self.plans[version] = None if old_rules is None else \
+                rules.plan_rescan(old_rules, self.compiled.rules)
+        return self.plans[version]
+
+def analyze_scripts(organized_dir="scripts/organized/general", db_path="scripts/scripts.db", workers=1):
+    """
+    Analyze all scripts in the organized directory and update the database.
+    Scripts whose content and rule set are unchanged since the last run are
+    only stat()ed, using the hash cache next to the database. With workers
+    above 1 the scripts that do need reading are scanned in a process pool;
+    results come back to this process, which does all database writes.
+    """
+    conn = connect(db_path)
+    compiled = rules.default_rules()
+    save_rule_set(conn, compiled)
+    cache = AnalysisCache(conn, compiled)
+
+    base_dir = os.path.dirname(db_path) or "."
+    hashes = hashcache.open_hash_cache(os.path.join(base_dir, "hashcache.db"))
+    known = hashcache.cached_hashes(hashes, base_dir, organized_dir)
+
+    # Get all scripts in the directory
+    scripts = sorted(f for f in os.listdir(organized_dir) if f.endswith(".js"))
+    if not scripts:
+        print("[INFO] No scripts found in the organized directory.")
+        hashes.close()
+        conn.close()
+        return
+
+    counts = {"current": 0, "reuse": 0, "rescan": 0, "miss": 0}
+    batch = []
+
+    def add(script, script_path, analysis):
+        batch.append((script, script_path, analysis))
+        print(f"[INFO] Processed script: {script} (Tags: {', '.join(analysis['tags'])})")
+        if len(batch) >= BATCH_SIZE:
+            write_analyses(conn, batch)
+            with metrics.timer("db_commit_seconds", db="hashcache"):
+                hashes.commit()
+            batch.clear()
+
+    jobs = []     # (script_path, rule indexes or None) to run in the pool
+    waiting = []  # (script, script_path, sha256, rule indexes known to match) per job
+    for script in scripts:
+        script_path = os.path.join(organized_dir, script)
+
+        status, result = "miss", None
+        sha256 = known.get(script_path)
+        if sha256 is not None:
+            status, result = cache.lookup(script, script_path, sha256)
+        counts[status] += 1
+        if status == "reuse":
+            add(script, script_path, result)
+        elif status == "rescan":
+            found, to_scan = result
+            jobs.append((script_path, sorted(to_scan)))
+            waiting.append((script, script_path, sha256, found))
+        elif status == "miss":
+            jobs.append((script_path, None))
+            waiting.append((script, script_path, None, None))
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(jobs) > 1 else None
+    try:
+        results = pool.map(_run_job, jobs, chunksize=JOB_CHUNK) if pool else map(_run_job, jobs)
+        for (script, script_path, sha256, found), result in zip(waiting, results):
+            if found is not None:
+                if result is None:
+                    continue
+                # Extract features and tags for the rules that changed
+                analysis = cache.finish(sha256, found | result[0], result[1])
+            else:
+                analysis = result
+                if analysis["sha256"]:
+                    hashcache.record_file(hashes, base_dir, os.path.relpath(script_path, base_dir),
+                                          analysis["sha256"], "organized")
+            add(script, script_path, analysis)
+    finally:
+        if pool:
+            pool.shutdown()
+    write_analyses(conn, batch)
+    with metrics.timer("db_commit_seconds", db="hashcache"):
+        hashes.commit()
+    index_missing_text(conn)
+    for status, scripts_seen in counts.items():
+        metrics.count("analysis_lookups_total", scripts_seen, status=status)
+
+    hashes.close()
     conn.close()
-    print("[INFO] Analysis completed and database updated.")
+    print(f"[INFO] Analysis completed and database updated: {counts['miss']} analyzed, "
+          f"{counts['rescan']} partly rescanned, {counts['reuse']} updated from "
+          f"cached results, {counts['current']} unchanged.")
 
 def main():
     """Main function to run the script analysis and tagging."""
+    parser = argparse.ArgumentParser(description="Analyze and tag organized scripts.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="worker processes for scanning (0 for one per CPU)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.start("analyze", args.metrics, args.profile)
+
     setup_database()  # Set up the database structure
-    analyze_scripts()  # Analyze scripts in the organized/general directory
+    # Analyze scripts in the organized/general directory
+    analyze_scripts(workers=args.jobs or os.cpu_count() or 1)
 
 if __name__ == "__main__":
     main()
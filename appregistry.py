@@ -0,0 +1,197 @@
+import time
+import bisect
+import argparse
+import threading
+from collections import namedtuple
+
+import device
+import metrics
+
+APP_TTL = 10.0  # Seconds a snapshot is served before a background refresh is started
+
+AppDiff = namedtuple("AppDiff", "started stopped installed removed")
+
+def diff_snapshots(old, new):
+    """Compare two {identifier: App} snapshots. Returns an AppDiff of App lists."""
+    started = [app for identifier, app in new.items()
+               if app.pid is not None and (identifier not in old or old[identifier].pid != app.pid)]
+    stopped = [app for identifier, app in old.items()
+               if app.pid is not None and (identifier not in new or new[identifier].pid != app.pid)]
+    installed = [app for identifier, app in new.items() if identifier not in old]
+    removed = [app for identifier, app in old.items() if identifier not in new]
+    return AppDiff(started, stopped, installed, removed)
+
+class AppRegistry:
+    """
+    The app list of one device, cached for APP_TTL seconds.
+    A stale snapshot is still served at once while a background thread
+    fetches a new one, so only the very first lookup (and the first one
+    after invalidate()) waits for the device.
+    Each snapshot is indexed by PID, by identifier and by lowercased name
+    and identifier suffixes (bank, example.bank, com.example.bank) for
+    prefix lookups.
+    """
+
+    def __init__(self, session_factory, ttl=APP_TTL):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.apps = None       # Sorted App list of the current snapshot
+        self.fetched = 0.0     # time.monotonic() of the current snapshot
+        self.by_identifier = {}
+        self.by_pid = {}
+        self.keys = []         # Sorted (lowercased key, identifier) pairs
+        self.generation = 1    # Bumped by invalidate(); older snapshots are not served
+        self.fetched_generation = 0  # Generation the current snapshot was fetched in
+        self.error = None      # Exception of the last failed refresh
+        self.refresher = None  # Running refresh thread, if any
+
+    def snapshot(self):
+        """
+        Return the current App list, starting a background refresh when it is
+        older than the TTL. Blocks when there is no snapshot yet or it was
+        invalidated; if that refresh fails, the old snapshot is served.
+        """
+        with self.lock:
+            apps, age, generation = self.apps, time.monotonic() - self.fetched, self.generation
+            current = self.fetched_generation >= generation
+        if not current:
+            metrics.count("app_registry_lookups_total", result="miss")
+            # A refresh already running may have started before the invalidate; then one more is needed
+            for _ in range(2):
+                self.refresh()
+                self.wait()
+                with self.lock:
+                    if self.fetched_generation >= generation:
+                        break
+            with self.lock:
+                if self.apps is None:
+                    raise self.error or device.AdbError("no app list available")
+                return self.apps
+        metrics.count("app_registry_lookups_total", result="hit" if age <= self.ttl else "stale")
+        if age > self.ttl:
+            self.refresh()
+        return apps
+
+    def refresh(self):
+        """Start a background refresh unless one is already running."""
+        with self.lock:
+            if self.refresher is not None:
+                return
+            self.refresher = threading.Thread(target=self._refresh, name="app-registry", daemon=True)
+            self.refresher.start()
+
+    def invalidate(self):
+        """
+        Mark the snapshot out of date (after a spawn or kill) and refresh it in
+        the background; the next snapshot() waits for a refresh started from here on.
+        """
+        with self.lock:
+            self.generation += 1
+        self.refresh()
+
+    def wait(self):
+        """Wait for a running background refresh to finish."""
+        refresher = self.refresher
+        if refresher is not None:
+            refresher.join()
+
+    def _refresh(self):
+        with self.lock:
+            generation = self.generation
+        try:
+            with metrics.timer("app_registry_refresh_seconds"):
+                apps = self.session_factory().applications()
+        except device.AdbError as e:
+            with self.lock:
+                self.error = e
+                self.refresher = None
+            return
+        apps = sorted(apps, key=lambda app: app.identifier)
+        by_identifier = {app.identifier: app for app in apps}
+        keys = []
+        for app in apps:
+            parts = app.identifier.lower().split(".")
+            for index in range(len(parts)):
+                keys.append((".".join(parts[index:]), app.identifier))
+            keys.append((app.name.lower(), app.identifier))
+        keys.sort()
+        with self.lock:
+            self.apps = apps
+            self.fetched = time.monotonic()
+            self.fetched_generation = generation
+            self.by_identifier = by_identifier
+            self.by_pid = {app.pid: app for app in apps if app.pid is not None}
+            self.keys = keys
+            self.error = None
+            self.refresher = None
+
+    def get(self, identifier):
+        """The App with this package identifier, or None."""
+        self.snapshot()
+        return self.by_identifier.get(identifier)
+
+    def pid(self, pid):
+        """The running App with this PID, or None."""
+        self.snapshot()
+        return self.by_pid.get(pid)
+
+    def find(self, text, apps=None):
+        """
+        Look an app up by part of its package or name: an exact identifier,
+        then identifiers or names with a component starting with text
+        ("bank" finds com.example.bank), then any substring match.
+        Returns matching Apps, limited to apps if given.
+        """
+        self.snapshot()
+        text = text.strip().lower()
+        allowed = None if apps is None else {app.identifier for app in apps}
+        with self.lock:
+            by_identifier, keys = self.by_identifier, self.keys
+        if not text:
+            return []
+        exact = by_identifier.get(text)
+        if exact is not None and (allowed is None or exact.identifier in allowed):
+            return [exact]
+        found = []
+        index = bisect.bisect_left(keys, (text,))
+        while index < len(keys) and keys[index][0].startswith(text):
+            identifier = keys[index][1]
+            if identifier not in found and (allowed is None or identifier in allowed):
+                found.append(identifier)
+            index += 1
+        if not found:
+            found = [app.identifier for app in by_identifier.values()
+                     if (text in app.identifier.lower() or text in app.name.lower())
+                     and (allowed is None or app.identifier in allowed)]
+        return sorted((by_identifier[identifier] for identifier in found), key=lambda app: app.identifier)
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_registry(serial=None):
+    """Return the shared AppRegistry for a device (see device.get_session)."""
+    with _registries_lock:
+        registry = _registries.get(serial)
+        if registry is None:
+            registry = _registries[serial] = AppRegistry(lambda: device.get_session(serial))
+        return registry
+
+def main():
+    """Command line entry point: appregistry.py [--serial S] [TEXT] looks apps up by part of their name."""
+    parser = argparse.ArgumentParser(description="Look up apps on a device.")
+    parser.add_argument("text", nargs="?", help="part of a package or app name (default: list all)")
+    parser.add_argument("--serial", help="device serial")
+    args = parser.parse_args()
+
+    registry = get_registry(args.serial)
+    try:
+        apps = registry.find(args.text) if args.text else registry.snapshot()
+    except device.AdbError as e:
+        print(f"[ERROR] {e}")
+        return
+    for app in apps:
+        print(f"{app.pid or '-':>6}  {app.name:30}  {app.identifier}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import itertools
+import threading
+from collections import namedtuple
+
+try:
+    import yaml
+except ImportError:  # JSON manifests work without PyYAML
+    yaml = None
+
+import bundle
+import device
+import farm
+import metrics
+
+DEFAULT_TIMEOUT = 30  # Seconds a job's scripts run unless the manifest says otherwise
+DEFAULT_RETRIES = 1
+DEFAULT_REPORT = "batch-report.json"
+JOB_FIELDS = {"name", "package", "pid", "serial", "scripts", "timeout", "expect", "retries"}
+
+BatchJob = namedtuple("BatchJob", "name package pid serial scripts timeout expect retries")
+
+class ManifestError(Exception):
+    """The manifest cannot be read or a job in it is invalid."""
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, (str, int)) else list(value)
+
+def _make_job(spec, base_dir, where):
+    unknown = set(spec) - JOB_FIELDS
+    if unknown:
+        raise ManifestError(f"{where}: unknown fields {', '.join(sorted(unknown))}")
+    package, pid = spec.get("package"), spec.get("pid")
+    if (package is None) == (pid is None):
+        raise ManifestError(f"{where}: give exactly one of package or pid")
+    if pid is not None and not str(pid).isdigit():
+        raise ManifestError(f"{where}: pid must be a number, not {pid!r}")
+    if pid is not None and not spec.get("serial"):
+        # A pid only means something on the device it was read from.
+        raise ManifestError(f"{where}: a pid job needs the serial of its device")
+    scripts = []
+    for script in _as_list(spec.get("scripts")):
+        script = str(script)
+        if not script.startswith("codeshare:"):
+            script = os.path.normpath(os.path.join(base_dir, os.path.expanduser(script)))
+            if not os.path.isfile(script):
+                raise ManifestError(f"{where}: script {script} does not exist")
+        scripts.append(script)
+    if not scripts:
+        raise ManifestError(f"{where}: no scripts")
+    try:
+        timeout = float(spec.get("timeout", DEFAULT_TIMEOUT))
+        retries = int(spec.get("retries", DEFAULT_RETRIES))
+    except (TypeError, ValueError) as e:
+        raise ManifestError(f"{where}: {e}")
+    if timeout <= 0 or retries < 0:
+        raise ManifestError(f"{where}: timeout must be positive and retries not negative")
+    name = spec.get("name") or f"{package or pid}:{'+'.join(os.path.basename(script) for script in scripts)}"
+    return BatchJob(str(name), package, int(pid) if pid is not None else None, spec.get("serial"),
+                    scripts, timeout, [str(marker) for marker in _as_list(spec.get("expect"))], retries)
+
+def load_manifest(path):
+    """
+    Read a YAML or JSON manifest and return its BatchJobs. The manifest
+    is a list of jobs or a mapping with any of:
+      defaults: fields every job starts from
+      jobs:     list of jobs (package or pid, scripts, timeout, expect, retries, serial, name);
+                a pid job must also name its serial
+      matrix:   packages + scripts (and any other job fields), expanded into
+                one job per package and script; may also be a list of such blocks
+    Script paths are relative to the manifest.
+    """
+    try:
+        with open(path) as f:
+            text = f.read()
+        if path.endswith(".json") or yaml is None:
+            data = json.loads(text)
+        else:
+            try:
+                data = yaml.safe_load(text)
+            except yaml.YAMLError as e:
+                raise ValueError(e)
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"cannot read {path}: {e}")
+    if isinstance(data, list):
+        data = {"jobs": data}
+    if not isinstance(data, dict):
+        raise ManifestError(f"{path}: expected a list of jobs or a mapping")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = data.get("defaults") or {}
+    specs = []
+    for index, spec in enumerate(data.get("jobs") or []):
+        specs.append((f"job {index + 1}", {**defaults, **spec}))
+    matrices = data.get("matrix") or []
+    for index, matrix in enumerate([matrices] if isinstance(matrices, dict) else matrices):
+        matrix = {**defaults, **matrix}
+        packages, scripts = _as_list(matrix.pop("packages", None)), _as_list(matrix.pop("scripts", None))
+        if not packages or not scripts:
+            raise ManifestError(f"matrix {index + 1}: needs packages and scripts")
+        for package, script in itertools.product(packages, scripts):
+            specs.append((f"matrix {index + 1} ({package}, {script})",
+                          {**matrix, "package": package, "scripts": [script]}))
+
+    jobs = [_make_job(spec, base_dir, where) for where, spec in specs]
+    names = [job.name for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ManifestError(f"duplicate job names: {', '.join(duplicates)}")
+    return jobs
+
+class Report:
+    """
+    The machine-readable results of a batch run. Rewritten atomically after
+    every finished job, so an interrupted run still leaves a valid report
+    with the unfinished jobs marked "pending".
+    """
+
+    def __init__(self, path, manifest, jobs):
+        self.path = path
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.data = {
+            "manifest": os.path.abspath(manifest),
+            "started": self.started,
+            "finished": None,
+            "wall_seconds": None,
+            "summary": {},
+            "devices": [],
+            "jobs": [{"name": job.name, "package": job.package, "pid": job.pid, "serial": job.serial,
+                      "scripts": job.scripts, "timeout": job.timeout, "expect": job.expect,
+                      "status": "pending"} for job in jobs],
+        }
+        with self.lock:
+            self._write()
+
+    def record(self, index, result):
+        """Store one farm.JobResult and rewrite the report."""
+        output = result.value if isinstance(result.value, farm.FridaOutput) else getattr(result.error, "output", None)
+        expect = self.data["jobs"][index]["expect"]
+        found = output.found if output else []
+        entry = {
+            "status": {"done": "passed"}.get(result.status, result.status),
+            "serial": result.serial,
+            "attempts": result.attempts,
+            "seconds": round(result.seconds, 3),
+            "exit_code": output.exit_code if output else None,
+            "markers_found": found,
+            "markers_missing": [marker for marker in expect if marker not in found] if output else expect,
+            "error": None if result.error is None else str(result.error),
+            "output_tail": output.tail if output else [],
+        }
+        with self.lock:
+            self.data["jobs"][index].update(entry)
+            self._write()
+
+    def finish(self, devices):
+        with self.lock:
+            self.data["finished"] = time.time()
+            self.data["wall_seconds"] = round(self.data["finished"] - self.started, 3)
+            self.data["devices"] = devices
+            self._write()
+
+    def summary(self):
+        """{status: number of jobs}."""
+        with self.lock:
+            return self._counts()
+
+    def _counts(self):
+        counts = {}
+        for job in self.data["jobs"]:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+    def _write(self):
+        self.data["summary"] = self._counts()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+def agent_scripts(job):
+    """The scripts to load for a job: several script files become one cached bundle (see bundle.py)."""
+    files = [script for script in job.scripts if not script.startswith("codeshare:")]
+    if len(files) < 2:
+        return job.scripts
+    return [bundle.build(files).path] + [script for script in job.scripts if script.startswith("codeshare:")]
+
+def run_batch(jobs, device_farm, report, fail_fast=False):
+    """
+    Run BatchJobs on the farm (at most devices x slots at a time), recording
+    each result in the report as it finishes. fail_fast cancels the rest of
+    the batch after the first failed job. Returns the farm.JobResults.
+    """
+    farm_jobs = [farm.frida_job(job.name, agent_scripts(job), package=job.package, pid=job.pid, timeout=job.timeout,
+                                expect=job.expect, serial=job.serial, cancelled=device_farm.cancelled)
+                 ._replace(attempts=job.retries + 1) for job in jobs]
+
+    def on_result(index, result):
+        report.record(index, result)
+        metrics.count("batch_jobs_total", status=result.status)
+        if result.status == "done":
+            print(f"[INFO] {result.name}: passed on {result.serial} in {result.seconds:.1f} s.")
+        elif result.status == "failed":
+            print(f"[ERROR] {result.name}: failed after {result.attempts} attempts: {result.error}")
+            if fail_fast:
+                device_farm.cancel()
+
+    return device_farm.run_jobs(farm_jobs, on_result=on_result)
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    """Command line entry point: batch.py MANIFEST [--report PATH] [--slots N] [--fail-fast] [--dry-run]."""
+    parser = argparse.ArgumentParser(description="Run spawn/inject jobs from a YAML or JSON manifest.")
+    parser.add_argument("manifest", help="manifest of jobs (.yaml, .yml or .json)")
+    parser.add_argument("--report", default=DEFAULT_REPORT, help=f"results file (default: {DEFAULT_REPORT})")
+    parser.add_argument("--slots", type=int, default=farm.SLOTS_PER_DEVICE, help="jobs per device at a time")
+    parser.add_argument("--fail-fast", action="store_true", help="cancel the remaining jobs after a failure")
+    parser.add_argument("--dry-run", action="store_true", help="only list the jobs")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except ManifestError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(2)
+    print(f"[INFO] {len(jobs)} jobs in {args.manifest}.")
+    if args.dry_run:
+        for job in jobs:
+            target = job.package or f"pid {job.pid}"
+            print(f"  - {job.name}: {target} with {', '.join(job.scripts)} "
+                  f"({job.timeout:g} s, {job.retries} retries, expect {job.expect or 'exit 0'})")
+        return
+
+    metrics.start("batch", args.metrics, args.profile)
+    signal.signal(signal.SIGTERM, _interrupt)  # A killed overnight run still cancels cleanly
+    device_farm = farm.DeviceFarm(slots=args.slots)
+    try:
+        serials = device_farm.discover()
+    except device.AdbError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    if not serials:
+        print("[ERROR] No devices attached.")
+        sys.exit(1)
+    device_farm.bootstrap()
+
+    report = Report(args.report, args.manifest, jobs)
+    try:
+        run_batch(jobs, device_farm, report, args.fail_fast)
+    except bundle.BundleError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(2)
+    except KeyboardInterrupt:
+        print("[INFO] Cancelled; unfinished jobs are marked in the report.")
+    report.finish([{"serial": state.serial, "healthy": state.healthy, "completed": state.completed,
+                    "failed": state.failed} for state in device_farm.devices.values()])
+    counts = report.summary()
+    print(f"[INFO] {', '.join(f'{count} {status}' for status, count in sorted(counts.items()))}. "
+          f"Report written to {args.report}.")
+    device_farm.status()
+    sys.exit(0 if counts.get("passed", 0) == len(jobs) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import subprocess
+
+BENCH_DIR = "bench"
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+STAGES = ["handle_duplicates", "process_scripts", "extract_actions_from_script",
+          "analyze_scripts", "analyze_scripts_warm"]
+DEFAULT_TOLERANCE = 0.2  # Allowed slowdown / RSS growth against the baseline
+
+def _link_tree(source_dir, dest_dir):
+    """Populate dest_dir with hardlinks (or copies) of the .js files in source_dir."""
+    os.makedirs(dest_dir, exist_ok=True)
+    for name in os.listdir(source_dir):
+        if name.endswith(".js"):
+            source = os.path.join(source_dir, name)
+            dest = os.path.join(dest_dir, name)
+            try:
+                os.link(source, dest)
+            except OSError:
+                shutil.copy2(source, dest)
+
+def _tree_size(directory):
+    """Return (files, bytes) for the .js files directly in directory."""
+    files = 0
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".js"):
+            files += 1
+            total += entry.stat().st_size
+    return files, total
+
+def _peak_rss_mb():
+    """Peak RSS of this process or any worker process it waited for, in MB."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024  # ru_maxrss is in KB on Linux
+
+def run_stage(stage, work_dir, workers):
+    """
+    Run one stage inside work_dir (a prepared scripts/ tree) and return its
+    measurements. Called in a fresh process so peak RSS belongs to the stage.
+    """
+    import handler
+    import analyze
+
+    raw_dir = os.path.join(work_dir, "raw")
+    organized_dir = os.path.join(work_dir, "organized", "general")
+    db_path = os.path.join(work_dir, "scripts.db")
+
+    if stage in ("handle_duplicates", "process_scripts"):
+        files, total = _tree_size(raw_dir)
+    else:
+        files, total = _tree_size(organized_dir)
+
+    started = time.perf_counter()
+    if stage == "handle_duplicates":
+        handler.handle_duplicates(raw_dir, os.path.join(work_dir, "dupe"), workers=workers)
+    elif stage == "process_scripts":
+        handler.process_scripts(work_dir, workers=workers)
+    elif stage == "extract_actions_from_script":
+        for name in sorted(os.listdir(organized_dir)):
+            if name.endswith(".js"):
+                analyze.extract_actions_from_script(os.path.join(organized_dir, name))
+    elif stage in ("analyze_scripts", "analyze_scripts_warm"):
+        analyze.analyze_scripts(organized_dir, db_path, workers=workers or 1)
+    else:
+        raise ValueError(f"unknown stage {stage!r}")
+    elapsed = time.perf_counter() - started
+
+    return {
+        "seconds": elapsed,
+        "files": files,
+        "mb": total / (1024 * 1024),
+        "files_per_s": files / elapsed if elapsed else 0.0,
+        "mb_per_s": total / (1024 * 1024) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def _prepare(stage, corpus_dir, work_root):
+    """
+    Build the scripts/ tree a stage starts from and return its path.
+    Ingest stages start from a fresh raw/; the analysis stages run on the
+    tree process_scripts left behind, with a fresh database for the cold
+    run and the database of the cold run for the warm one.
+    """
+    import handler
+
+    if stage in ("handle_duplicates", "process_scripts"):
+        work_dir = os.path.join(work_root, stage)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        handler.setup_directories(work_dir)
+        _link_tree(corpus_dir, os.path.join(work_dir, "raw"))
+        return work_dir
+
+    work_dir = os.path.join(work_root, "process_scripts")
+    if not os.path.isdir(os.path.join(work_dir, "organized", "general")):
+        raise RuntimeError(f"stage {stage} needs process_scripts to run first")
+    if stage == "analyze_scripts":
+        for suffix in ("", "-wal", "-shm"):
+            path = os.path.join(work_dir, "scripts.db" + suffix)
+            if os.path.exists(path):
+                os.unlink(path)
+    if stage.startswith("analyze_scripts"):
+        import analyze
+        analyze.setup_database(os.path.join(work_dir, "scripts.db"))
+    return work_dir
+
+def run_benchmarks(corpus_dir, work_root, stages, workers=None, repeat=1):
+    """
+    Run each stage repeat times in its own process and keep the fastest run.
+    Returns {stage: measurements}.
+    """
+    results = {}
+    for stage in stages:
+        best = None
+        for attempt in range(repeat):
+            if stage == "analyze_scripts_warm" and attempt == 0 and "analyze_scripts" not in results:
+                # The warm run needs a database filled by a cold run.
+                run_benchmarks(corpus_dir, work_root, ["analyze_scripts"], workers)
+            work_dir = _prepare(stage, corpus_dir, work_root)
+            result_path = os.path.join(work_root, f"{stage}.json")
+            with open(os.path.join(work_root, f"{stage}.log"), "w") as log:
+                command = [sys.executable, os.path.abspath(__file__), "--run-stage", stage,
+                           "--work", work_dir, "--result", result_path]
+                if workers:
+                    command += ["--workers", str(workers)]
+                subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, check=True)
+            with open(result_path) as f:
+                result = json.load(f)
+            if best is None or result["seconds"] < best["seconds"]:
+                best = result
+        results[stage] = best
+        print(f"[INFO] {stage:28} {best['files']:>8} files  {best['seconds']:8.2f} s  "
+              f"{best['files_per_s']:10.0f} files/s  {best['mb_per_s']:8.1f} MB/s  "
+              f"{best['peak_rss_mb']:7.0f} MB RSS")
+    return results
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results with a baseline. Returns a list of regression messages:
+    throughput more than tolerance below, or peak RSS more than tolerance
+    above, the baseline.
+    """
+    regressions = []
+    for stage, result in results.items():
+        base = baseline["stages"].get(stage)
+        if base is None:
+            print(f"[INFO] {stage}: no baseline yet.")
+            continue
+        for metric in ("files_per_s", "mb_per_s"):
+            if base[metric] and result[metric] < base[metric] * (1 - tolerance):
+                regressions.append(f"{stage}: {metric} {result[metric]:.1f} vs baseline {base[metric]:.1f} "
+                                   f"({result[metric] / base[metric] - 1:+.0%})")
+        if base["peak_rss_mb"] and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{stage}: peak_rss_mb {result['peak_rss_mb']:.0f} vs baseline "
+                               f"{base['peak_rss_mb']:.0f} ({result['peak_rss_mb'] / base['peak_rss_mb'] - 1:+.0%})")
+        if not any(message.startswith(stage + ":") for message in regressions):
+            print(f"[INFO] {stage}: {result['files_per_s'] / base['files_per_s'] - 1:+.0%} files/s "
+                  f"against the baseline.")
+    return regressions
+
+def main():
+    """
+    Command line entry point.
+    bench.py [--count N] [--stages a,b] [--save-baseline] generates (or reuses)
+    a corpus under bench/, times every stage and compares with the baseline.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the ingest and analyze stages.")
+    parser.add_argument("--count", type=int, default=10000, help="scripts in the generated corpus")
+    parser.add_argument("--corpus", help="existing corpus directory (default: generate under bench/)")
+    parser.add_argument("--work", default=BENCH_DIR, help="scratch directory for the runs")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to run")
+    parser.add_argument("--workers", type=int, help="worker processes for stages that use a pool")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the fastest is kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative regression before failing")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed")
+    parser.add_argument("--run-stage", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        result = run_stage(args.run_stage, args.work, args.workers)
+        with open(args.result, "w") as f:
+            json.dump(result, f)
+        return
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"[ERROR] Unknown stages: {', '.join(sorted(unknown))} (known: {', '.join(STAGES)})")
+        sys.exit(2)
+    if any(stage != "handle_duplicates" for stage in stages) and "process_scripts" not in stages:
+        stages.insert(0, "process_scripts")  # Builds the tree the analysis stages read
+    stages.sort(key=STAGES.index)
+
+    import corpus
+    corpus_dir = args.corpus or os.path.join(args.work, f"corpus-{args.count}-{args.seed}")
+    manifest_path = os.path.join(corpus_dir, "corpus.json")
+    if not os.path.exists(manifest_path):
+        corpus.generate_corpus(corpus_dir, args.count, seed=args.seed)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    results = run_benchmarks(corpus_dir, os.path.join(args.work, "runs"), stages, args.workers, args.repeat)
+    record = {"corpus": manifest, "workers": args.workers, "stages": results}
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(record, f, indent=2, sort_keys=True)
+        print(f"[INFO] Saved baseline to {args.baseline}.")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"[INFO] No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["corpus"] != manifest or baseline.get("workers") != args.workers:
+        print("[ERROR] Baseline was recorded with a different corpus or worker count; "
+              "re-run with the same options or --save-baseline.")
+        sys.exit(2)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("[ERROR] " + "=" * 60)
+        print(f"[ERROR] PERFORMANCE REGRESSION (tolerance {args.tolerance:.0%}):")
+        for message in regressions:
+            print(f"[ERROR]   {message}")
+        print("[ERROR] " + "=" * 60)
+        sys.exit(1)
+    print("[INFO] No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+
+DEFAULT_WORKERS = 4
+POLL_FIRST = 0.05  # First delay of wait_until; doubles up to POLL_MAX
+POLL_MAX = 0.5
+
+# action(values) does the work; check(values) returns None when the step
+# still has to run, or the step's value when its postcondition already holds.
+# values maps each required step to its value.
+Step = namedtuple("Step", "name action requires check", defaults=((), None))
+StepResult = namedtuple("StepResult", "status value seconds error")  # done, skipped, failed or blocked
+
+class BootstrapError(Exception):
+    """The step graph is malformed (unknown dependency or a cycle)."""
+
+def wait_until(predicate, timeout, first_delay=POLL_FIRST, max_delay=POLL_MAX):
+    """
+    Call predicate with exponential backoff until it returns something
+    truthy, and return that. Raises TimeoutError after timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    delay = first_delay
+    while True:
+        result = predicate()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"condition not met after {timeout} s")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+def _check_graph(steps):
+    names = {step.name for step in steps}
+    if len(names) != len(steps):
+        raise BootstrapError("duplicate step names")
+    for step in steps:
+        unknown = set(step.requires) - names
+        if unknown:
+            raise BootstrapError(f"step {step.name} requires unknown steps {', '.join(sorted(unknown))}")
+    # Kahn's algorithm: anything left over is on a cycle.
+    remaining = {step.name: set(step.requires) for step in steps}
+    while True:
+        ready = [name for name, requires in remaining.items() if not requires]
+        if not ready:
+            break
+        for name in ready:
+            del remaining[name]
+        for requires in remaining.values():
+            requires.difference_update(ready)
+    if remaining:
+        raise BootstrapError(f"dependency cycle among {', '.join(sorted(remaining))}")
+
+def _run_step(step, values):
+    started = time.perf_counter()
+    try:
+        with metrics.timer("bootstrap_step_seconds", step=step.name):
+            if step.check is not None:
+                value = step.check(values)
+                if value is not None:
+                    return StepResult("skipped", value, time.perf_counter() - started, None)
+            value = step.action(values)
+        return StepResult("done", value, time.perf_counter() - started, None)
+    except Exception as e:
+        return StepResult("failed", None, time.perf_counter() - started, e)
+
+def run_steps(steps, workers=DEFAULT_WORKERS, label=None):
+    """
+    Run a graph of Steps: each starts as soon as everything it requires has
+    finished, so independent steps run concurrently on a thread pool. A
+    step whose requirement failed is not run and ends up "blocked".
+    label (e.g. a device serial) prefixes the progress lines.
+    Returns {name: StepResult} in the order the steps were given.
+    """
+    _check_graph(steps)
+    prefix = f"[{label}] " if label else ""
+    results = {}
+    waiting = list(steps)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while waiting or running:
+            for step in list(waiting):
+                if not all(name in results for name in step.requires):
+                    continue
+                waiting.remove(step)
+                failed = [name for name in step.requires if results[name].status in ("failed", "blocked")]
+                if failed:
+                    results[step.name] = StepResult("blocked", None, 0.0, None)
+                    print(f"[ERROR] {prefix}Step {step.name} skipped: {', '.join(failed)} did not complete.")
+                    continue
+                values = {name: results[name].value for name in step.requires}
+                running[pool.submit(_run_step, step, values)] = step
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                result = results[step.name] = future.result()
+                if result.status == "failed":
+                    print(f"[ERROR] {prefix}Step {step.name} failed after {result.seconds:.2f} s: {result.error}")
+                elif result.status == "skipped":
+                    print(f"[INFO] {prefix}Step {step.name} already satisfied ({result.seconds:.2f} s).")
+                else:
+                    print(f"[INFO] {prefix}Step {step.name} done in {result.seconds:.2f} s.")
+    return {step.name: results[step.name] for step in steps}
+
+def report(results, wall_seconds):
+    """Print a one-line-per-step summary and the wall time against the summed step time."""
+    print(f"[INFO] Bootstrap finished in {wall_seconds:.2f} s "
+          f"(steps took {sum(result.seconds for result in results.values()):.2f} s in total):")
+    for name, result in results.items():
+        print(f"  - {name:16} {result.status:8} {result.seconds:6.2f} s")
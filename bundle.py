@@ -0,0 +1,346 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from collections import namedtuple
+
+import analyze
+import hooktargets
+import metrics
+
+BUNDLER_VERSION = 1  # Bump when the output changes so cached bundles are rebuilt
+BUNDLE_DIR = "scripts/bundles"
+SCRIPT_DB = "scripts/scripts.db"
+INDEX_NAME = "index.json"
+INDEX_LIMIT = 1000  # Selections remembered in the index before the oldest are dropped
+
+Source = namedtuple("Source", "path name sha256 text")
+Bundle = namedtuple("Bundle", "path sha256 scripts helpers cached")  # scripts: names; helpers: hoisted names
+
+class BundleError(Exception):
+    """A selection cannot be resolved or read."""
+
+OPEN, CLOSE = "([{", ")]}"
+DECLARATIONS = {"var", "let", "const", "function", "class"}
+
+# The rest of a regex literal after its opening slash (classes may contain a slash).
+REGEX_REST = re.compile(r"(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[A-Za-z]*")
+REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw"}
+
+def _tokens(text):
+    """
+    (start, end, token, is_comment) for each token, using the tokenizer of
+    hooktargets.py plus regex literals: a slash where a value is expected
+    (start, after an operator, bracket or keyword) starts a regex.
+    """
+    position = 0
+    previous = None
+    while True:
+        match = hooktargets.TOKEN_RE.search(text, position)
+        if match is None:
+            return
+        start, end = match.span()
+        if match.group(1) is not None:
+            yield start, end, match.group(1), True
+            position = end
+            continue
+        token = match.group(2)
+        if token == "/" and (previous is None or previous in REGEX_KEYWORDS
+                             or not (previous[0].isalnum() or previous[0] in "_$\"'`)]}")):
+            rest = REGEX_REST.match(text, end)
+            if rest is not None:
+                end = rest.end()
+                token = text[start:end]
+        yield start, end, token, False
+        previous = token
+        position = end
+
+def _top_level(text):
+    """
+    Return (functions, names) for a script: functions maps each top-level
+    function declaration name to (start, end, key), where key hashes its
+    tokens without comments or whitespace; names are every top-level
+    declared name. Returns None when the brackets do not balance (e.g. a
+    regex literal confused the tokenizer), so the script is left untouched.
+    """
+    tokens = [(start, end, token) for start, end, token, comment in _tokens(text) if not comment]
+    functions, names = {}, set()
+    depth = 0
+    index = 0
+    while index < len(tokens):
+        start, _, token = tokens[index]
+        if depth == 0 and token in DECLARATIONS and index + 1 < len(tokens):
+            name = tokens[index + 1][2]
+            if hooktargets.IDENTIFIER_RE.match(name):
+                names.add(name)
+            if token == "function" and (index == 0 or tokens[index - 1][2] in (";", "}")):
+                end_index = _function_end(tokens, index + 2)
+                if end_index is not None:
+                    key = hashlib.sha256(" ".join(t[2] for t in tokens[index:end_index + 1]).encode()).hexdigest()
+                    functions[name] = (start, tokens[end_index][1], key, tokens[index:end_index + 1])
+                    index = end_index + 1
+                    continue
+        if token in OPEN:
+            depth += 1
+        elif token in CLOSE:
+            depth -= 1
+            if depth < 0:
+                return None
+        index += 1
+    if depth != 0:
+        return None
+    return functions, names
+
+def _function_end(tokens, index):
+    """Index of the closing brace of a function whose parameter list starts at index, or None."""
+    if index >= len(tokens) or tokens[index][2] != "(":
+        return None
+    depth = 0
+    seen_body = False
+    for position in range(index, len(tokens)):
+        token = tokens[position][2]
+        if token in OPEN:
+            if token == "{" and depth == 0:
+                seen_body = True
+            depth += 1
+        elif token in CLOSE:
+            depth -= 1
+            if depth == 0 and seen_body:
+                return position
+            if depth < 0:
+                return None
+    return None
+
+def _free_names(function_tokens):
+    """Identifiers a function refers to, ignoring property names (after a dot)."""
+    names = set()
+    previous = None
+    for _, _, token in function_tokens:
+        if previous != "." and hooktargets.IDENTIFIER_RE.match(token):
+            names.add(token)
+        previous = token
+    return names
+
+def find_shared_helpers(sources):
+    """
+    Top-level functions that are identical (same name, same tokens) in two
+    or more scripts and only refer to names that are still visible once
+    hoisted out of the script, i.e. not to the script's other top-level
+    variables. Returns {name: (key, text)} and the parsed scripts.
+    """
+    parsed = {source.path: _top_level(source.text) for source in sources}
+    counts = {}
+    for source in sources:
+        if parsed[source.path] is None:
+            continue
+        for name, (_, _, key, _) in parsed[source.path][0].items():
+            counts[name, key] = counts.get((name, key), 0) + 1
+    by_name = {}
+    for (name, key), count in counts.items():
+        if count > 1:
+            by_name.setdefault(name, []).append(key)
+    helpers = {name: keys[0] for name, keys in by_name.items() if len(keys) == 1}  # Same name, different bodies: keep local
+
+    # Dropping one helper can strand another that calls it, so repeat until stable.
+    changed = True
+    while changed:
+        changed = False
+        for source in sources:
+            if parsed[source.path] is None:
+                continue
+            functions, names = parsed[source.path]
+            for name, key in list(helpers.items()):
+                entry = functions.get(name)
+                if entry is None or entry[2] != key:
+                    continue
+                local = names - set(helpers)
+                if _free_names(entry[3]) & local:
+                    del helpers[name]
+                    changed = True
+
+    shared = {}
+    for source in sources:
+        if parsed[source.path] is None:
+            continue
+        for name, (start, end, key, _) in parsed[source.path][0].items():
+            if helpers.get(name) == key and name not in shared:
+                shared[name] = (key, source.text[start:end])
+    return shared, parsed
+
+def minify(text):
+    """Drop comments and blank lines. Line breaks are kept so automatic semicolon insertion is unchanged."""
+    out = []
+    position = 0
+    for start, end, token, comment in _tokens(text):
+        if comment:
+            out.append(text[position:start])
+            out.append("\n" if "\n" in token else " ")
+            position = end
+    out.append(text[position:])
+    return "\n".join(line.rstrip() for line in "".join(out).splitlines() if line.strip())
+
+def render(sources, shared, parsed, key):
+    """The bundle text: shared helpers first, then each script in its own function scope."""
+    lines = [f"// Bundle of {len(sources)} scripts (sha256 {key}, bundler {BUNDLER_VERSION})"]
+    lines += [f"// - {source.name} ({source.sha256[:12]})" for source in sources]
+    if shared:
+        lines.append("\n// Helpers shared by several scripts")
+        lines += [text for _, text in sorted(shared.values(), key=lambda item: item[0])]
+    for source in sources:
+        text = source.text
+        if parsed[source.path] is not None:
+            # Cut hoisted helpers out back to front so earlier offsets stay valid.
+            spans = sorted(((start, end, name) for name, (start, end, key, _) in parsed[source.path][0].items()
+                            if name in shared and shared[name][0] == key), reverse=True)
+            for start, end, name in spans:
+                text = text[:start] + f"/* {name}: shared helper */" + text[end:]
+        label = json.dumps(source.name)
+        lines.append(f"\n// === {source.name} ===")
+        lines.append("(function () {\ntry {")
+        lines.append(text.rstrip())
+        lines.append(f"}} catch (e) {{\n    console.error({label} + \": \" + (e.stack || e));\n}}\n}})();")
+    return "\n".join(lines) + "\n"
+
+def resolve(selections, db_path=SCRIPT_DB):
+    """
+    Turn selections into script paths. A selection is a file path, id:N
+    (a Scripts row) or a file name known to the script DB.
+    """
+    paths = []
+    conn = None
+    try:
+        for selection in selections:
+            if os.path.isfile(selection):
+                paths.append(os.path.abspath(selection))
+                continue
+            if conn is None:
+                if not os.path.exists(db_path):
+                    raise BundleError(f"{selection} is not a file and there is no script DB at {db_path}")
+                conn = analyze.connect(db_path)
+            try:
+                if selection.startswith("id:") and selection[3:].isdigit():
+                    row = conn.execute("SELECT filepath FROM Scripts WHERE id = ?", (int(selection[3:]),)).fetchone()
+                else:
+                    row = conn.execute("SELECT filepath FROM Scripts WHERE filename = ? ORDER BY id DESC",
+                                       (selection,)).fetchone()
+            except sqlite3.Error as e:
+                raise BundleError(f"script DB lookup failed: {e}")
+            if row is None or not os.path.isfile(row[0]):
+                raise BundleError(f"no script found for {selection}")
+            paths.append(os.path.abspath(row[0]))
+    finally:
+        if conn is not None:
+            conn.close()
+    return paths
+
+def _selection_key(paths, minified):
+    """Identifies a selection by path, size and mtime, so a repeat launch needs no file reads."""
+    parts = [str(BUNDLER_VERSION), "min" if minified else "full"]
+    for path in paths:
+        st = os.stat(path)
+        parts.append(f"{path}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+def _load_index(bundle_dir):
+    try:
+        with open(os.path.join(bundle_dir, INDEX_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_index(bundle_dir, index):
+    if len(index) > INDEX_LIMIT:
+        index = dict(list(index.items())[-INDEX_LIMIT:])
+    path = os.path.join(bundle_dir, INDEX_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+def build(selections, bundle_dir=BUNDLE_DIR, minified=False, db_path=SCRIPT_DB):
+    """
+    Bundle the selected scripts into one agent under bundle_dir, named by
+    the hash of everything that goes into it. A selection seen before with
+    unchanged files is answered from the index with nothing but stat calls;
+    the same contents under other paths reuse the existing bundle file.
+    Returns a Bundle.
+    """
+    paths = list(dict.fromkeys(resolve(selections, db_path)))
+    if not paths:
+        raise BundleError("no scripts selected")
+    os.makedirs(bundle_dir, exist_ok=True)
+    selection_key = _selection_key(paths, minified)
+    index = _load_index(bundle_dir)
+    entry = index.get(selection_key)
+    if entry is not None and os.path.isfile(os.path.join(bundle_dir, entry["file"])):
+        metrics.count("bundle_cache_total", result="hit")
+        return Bundle(os.path.join(bundle_dir, entry["file"]), entry["sha256"], entry["scripts"],
+                      entry["helpers"], True)
+
+    with metrics.timer("bundle_build_seconds"):
+        sources = []
+        seen = set()
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                raise BundleError(f"cannot read {path}: {e}")
+            sha256 = hashlib.sha256(data).hexdigest()
+            if sha256 in seen:
+                continue  # Same script selected twice under different names
+            seen.add(sha256)
+            sources.append(Source(path, os.path.basename(path), sha256, data.decode("utf-8", "replace")))
+        content_key = hashlib.sha256(
+            "\n".join([str(BUNDLER_VERSION), "min" if minified else "full"]
+                      + [source.sha256 for source in sources]).encode()).hexdigest()
+        file_name = f"{content_key}.js"
+        bundle_path = os.path.join(bundle_dir, file_name)
+        cached = os.path.isfile(bundle_path)
+        if cached:
+            helpers = next((entry["helpers"] for entry in index.values() if entry["sha256"] == content_key), [])
+        else:
+            shared, parsed = find_shared_helpers(sources)
+            helpers = sorted(shared)
+            text = render(sources, shared, parsed, content_key)
+            if minified:
+                text = minify(text) + "\n"
+            tmp_path = bundle_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(text)
+            os.replace(tmp_path, bundle_path)
+    metrics.count("bundle_cache_total", result="content" if cached else "miss")
+
+    bundle = Bundle(bundle_path, content_key, [source.name for source in sources], helpers, cached)
+    index.pop(selection_key, None)
+    index[selection_key] = {"file": file_name, "sha256": content_key, "scripts": bundle.scripts,
+                            "helpers": bundle.helpers, "built": time.time()}
+    _save_index(bundle_dir, index)
+    return bundle
+
+def main():
+    """Command line entry point: bundle.py SCRIPT... [--minify] [--bundle-dir D] prints the bundle path."""
+    parser = argparse.ArgumentParser(description="Bundle several Frida scripts into one agent.")
+    parser.add_argument("scripts", nargs="+", help="script paths, id:N or script names from the script DB")
+    parser.add_argument("--minify", action="store_true", help="drop comments and blank lines")
+    parser.add_argument("--bundle-dir", default=BUNDLE_DIR, help=f"bundle cache directory (default: {BUNDLE_DIR})")
+    parser.add_argument("--db", default=SCRIPT_DB, help=f"script DB (default: {SCRIPT_DB})")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        bundle = build(args.scripts, args.bundle_dir, args.minify, args.db)
+    except BundleError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    state = "cached" if bundle.cached else "built"
+    print(f"[INFO] Bundle of {len(bundle.scripts)} scripts {state} in {(time.perf_counter() - started) * 1000:.1f} ms"
+          + (f"; shared helpers: {', '.join(bundle.helpers)}" if bundle.helpers else "") + ".")
+    print(bundle.path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import math
+import random
+import argparse
+
+# Snippet families and their default share of the hooks in a script.
+DEFAULT_MIX = {"java": 4, "ssl": 2, "native": 2, "objc": 1, "trace": 1, "comm": 1}
+JAVA_CLASSES = [
+    "okhttp3.CertificatePinner", "okhttp3.OkHttpClient$Builder", "javax.net.ssl.SSLContext",
+    "javax.net.ssl.X509TrustManager", "com.android.org.conscrypt.TrustManagerImpl",
+    "android.app.Activity", "android.content.Intent", "java.security.MessageDigest",
+    "javax.crypto.Cipher", "android.util.Base64", "java.io.File", "android.webkit.WebView",
+    "com.scottyab.rootbeer.RootBeer", "android.content.pm.PackageManager",
+    "android.os.Build", "java.net.URL", "android.telephony.TelephonyManager",
+]
+JAVA_METHODS = ["check", "init", "doFinal", "getInstance", "onCreate", "loadUrl", "exists",
+                "isRooted", "digest", "decode", "openConnection", "getDeviceId", "checkServerTrusted",
+                "verifyChain", "getPackageInfo", "$init", "update", "build"]
+NATIVE_SYMBOLS = [("libc.so", "open"), ("libc.so", "read"), ("libc.so", "connect"), ("libc.so", "fopen"),
+                  ("libssl.so", "SSL_read"), ("libssl.so", "SSL_write"), ("libc.so", "strcmp"),
+                  (None, "ptrace"), (None, "dlopen"), ("libart.so", "_ZN3art9ArtMethod6InvokeEPNS_6ThreadEPjjPNS_6JValueEPKc")]
+OBJC_CLASSES = [("NSURLSession", "- dataTaskWithRequest:completionHandler:"),
+                ("NSURLConnection", "+ sendSynchronousRequest:returningResponse:error:"),
+                ("SecTrustEvaluate", "- evaluate"), ("NSFileManager", "- fileExistsAtPath:"),
+                ("UIApplication", "- canOpenURL:"), ("NSUserDefaults", "- objectForKey:")]
+WORDS = ["value", "result", "args", "buffer", "payload", "target", "retval", "handle", "config",
+         "session", "client", "request", "response", "token", "key", "data", "path", "flag"]
+
+def _ident(rng):
+    return rng.choice(WORDS) + rng.choice(["", "Hook", "Impl", "Ref", "2", "_", "Ptr"])
+
+def _java(rng):
+    cls = rng.choice(JAVA_CLASSES)
+    var = cls.rsplit(".", 1)[-1].replace("$", "_")
+    method = rng.choice(JAVA_METHODS)
+    arg = _ident(rng)
+    return (f'    var {var} = Java.use("{cls}");\n'
+            f'    {var}.{method}.overload("java.lang.String").implementation = function ({arg}) {{\n'
+            f'        console.log("[*] {var}.{method} called with " + {arg});\n'
+            f'        return this.{method}({arg});\n'
+            f'    }};\n')
+
+def _ssl(rng):
+    var = _ident(rng)
+    return (f'    var TrustManager = Java.registerClass({{\n'
+            f'        name: "com.bypass.TrustManager{rng.randrange(1000)}",\n'
+            f'        implements: [Java.use("javax.net.ssl.X509TrustManager")],\n'
+            f'        methods: {{\n'
+            f'            checkClientTrusted: function (chain, authType) {{}},\n'
+            f'            checkServerTrusted: function (chain, authType) {{}},\n'
+            f'            getAcceptedIssuers: function () {{ return []; }}\n'
+            f'        }}\n'
+            f'    }});\n'
+            f'    var SSLContext = Java.use("javax.net.ssl.SSLContext");\n'
+            f'    SSLContext.init.overload("[Ljavax.net.ssl.KeyManager;", "[Ljavax.net.ssl.TrustManager;", '
+            f'"java.security.SecureRandom").implementation = function (km, tm, {var}) {{\n'
+            f'        console.log("[+] SSL pinning bypass: replacing TrustManager");\n'
+            f'        this.init(km, [TrustManager.$new()], {var});\n'
+            f'    }};\n')
+
+def _native(rng):
+    module, symbol = rng.choice(NATIVE_SYMBOLS)
+    module = f'"{module}"' if module else "null"
+    var = _ident(rng)
+    return (f'Interceptor.attach(Module.findExportByName({module}, "{symbol}"), {{\n'
+            f'    onEnter: function (args) {{\n'
+            f'        this.{var} = args[0];\n'
+            f'        console.log("{symbol}(" + args[0] + ")");\n'
+            f'    }},\n'
+            f'    onLeave: function (retval) {{\n'
+            f'        if (this.{var}) {{ console.log("{symbol} -> " + retval); }}\n'
+            f'    }}\n'
+            f'}});\n')
+
+def _objc(rng):
+    cls, selector = rng.choice(OBJC_CLASSES)
+    return (f'if (ObjC.available) {{\n'
+            f'    var {cls}Hook = ObjC.classes.{cls}["{selector}"];\n'
+            f'    Interceptor.attach({cls}Hook.implementation, {{\n'
+            f'        onEnter: function (args) {{ console.log("{cls} {selector}"); }}\n'
+            f'    }});\n'
+            f'}}\n')
+
+def _trace(rng):
+    var = _ident(rng)
+    return (f'function trace{rng.randrange(10000)}({var}) {{\n'
+            f'    // Trace every call into the target and dump a backtrace\n'
+            f'    console.log(Thread.backtrace(this.context, Backtracer.ACCURATE)\n'
+            f'        .map(DebugSymbol.fromAddress).join("\\n"));\n'
+            f'    return {var};\n'
+            f'}}\n')
+
+def _comm(rng):
+    var = _ident(rng)
+    return (f'recv("config", function (message) {{\n'
+            f'    var {var} = message.payload;\n'
+            f'    send({{ type: "ack", {var}: {var} }});\n'
+            f'}});\n')
+
+SNIPPETS = {"java": _java, "ssl": _ssl, "native": _native, "objc": _objc, "trace": _trace, "comm": _comm}
+JAVA_FAMILIES = {"java", "ssl"}
+
+def _filler(rng, size):
+    """Helper functions and comments that pad a script to roughly size characters."""
+    parts = []
+    total = 0
+    while total < size:
+        name = _ident(rng)
+        part = (f"// {' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 10)))}\n"
+                f"function {name}{rng.randrange(1 << 20)}(a, b) {{\n"
+                f"    var {rng.choice(WORDS)} = a + b * {rng.randrange(1000)};\n"
+                f"    return {rng.choice(['a', 'b', 'a ^ b', 'String(a)'])};\n"
+                f"}}\n")
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)
+
+def _target_size(rng, median, max_size):
+    """Log-normal script size: most scripts are small, bundled agents are large."""
+    return int(min(max_size, max(200, rng.lognormvariate(math.log(median), 1.0))))
+
+def generate_script(rng, mix, median, max_size):
+    """Return the text of one synthetic Frida script."""
+    families = list(mix)
+    weights = [mix[family] for family in families]
+    chosen = rng.choices(families, weights, k=rng.randint(1, 5))
+    java = [SNIPPETS[family](rng) for family in chosen if family in JAVA_FAMILIES]
+    other = [SNIPPETS[family](rng) for family in chosen if family not in JAVA_FAMILIES]
+    body = ""
+    if java:
+        body += "Java.perform(function () {\n" + "".join(java) + "});\n"
+    body += "".join(other)
+    header = f"/*\n * {rng.choice(['SSL pinning bypass', 'Root detection bypass', 'API tracer', 'Crypto dump', 'Network logger'])}\n * generated sample {rng.randrange(1 << 30)}\n */\n"
+    padding = _target_size(rng, median, max_size) - len(header) - len(body)
+    return header + (_filler(rng, padding) if padding > 0 else "") + body
+
+def mutate_script(rng, text):
+    """Make a near-duplicate: a changed comment, a renamed identifier and an extra line."""
+    lines = text.split("\n")
+    for _ in range(rng.randint(1, 3)):
+        index = rng.randrange(len(lines))
+        choice = rng.randrange(3)
+        if choice == 0:
+            lines.insert(index, f"// tweaked by {rng.choice(WORDS)} {rng.randrange(1000)}")
+        elif choice == 1:
+            old = rng.choice(WORDS)
+            lines[index] = lines[index].replace(old, old + "X")
+        else:
+            lines.insert(index, f'console.log("{rng.choice(WORDS)} {rng.randrange(1000)}");')
+    return "\n".join(lines)
+
+def parse_mix(text):
+    """Parse 'java=4,native=2' into a mix dictionary."""
+    mix = {}
+    for item in text.split(","):
+        family, _, weight = item.partition("=")
+        if family not in SNIPPETS:
+            raise ValueError(f"unknown snippet family {family!r} (known: {', '.join(SNIPPETS)})")
+        mix[family] = float(weight or 1)
+    return mix
+
+def generate_corpus(out_dir, count, dup_rate=0.05, near_dup_rate=0.1, median_kb=4, max_kb=1024,
+                    mix=None, seed=0):
+    """
+    Write count synthetic scripts into out_dir and a corpus.json manifest.
+    dup_rate of the scripts are byte-for-byte copies and near_dup_rate are
+    lightly mutated copies of earlier scripts. The same arguments always
+    produce the same corpus. Returns the manifest dictionary.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    median = median_kb * 1024
+    max_size = max_kb * 1024
+    os.makedirs(out_dir, exist_ok=True)
+
+    originals = []  # Text of recent unique scripts, for copies
+    counts = {"unique": 0, "duplicate": 0, "near_duplicate": 0}
+    total_bytes = 0
+    for index in range(count):
+        roll = rng.random()
+        if originals and roll < dup_rate:
+            text = rng.choice(originals)
+            counts["duplicate"] += 1
+        elif originals and roll < dup_rate + near_dup_rate:
+            text = mutate_script(rng, rng.choice(originals))
+            counts["near_duplicate"] += 1
+        else:
+            text = generate_script(rng, mix, median, max_size)
+            counts["unique"] += 1
+            if len(originals) < 1000:
+                originals.append(text)
+            else:
+                originals[rng.randrange(len(originals))] = text
+        data = text.encode()
+        total_bytes += len(data)
+        with open(os.path.join(out_dir, f"script_{index:07d}.js"), "wb") as f:
+            f.write(data)
+        if (index + 1) % 100000 == 0:
+            print(f"[INFO] Generated {index + 1} scripts...")
+
+    manifest = {
+        "count": count, "dup_rate": dup_rate, "near_dup_rate": near_dup_rate,
+        "median_kb": median_kb, "max_kb": max_kb, "mix": mix, "seed": seed,
+        "bytes": total_bytes, **counts,
+    }
+    with open(os.path.join(out_dir, "corpus.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"[INFO] Generated {count} scripts ({total_bytes / (1024 * 1024):.1f} MB) in {out_dir}: "
+          f"{counts['unique']} unique, {counts['duplicate']} duplicates, "
+          f"{counts['near_duplicate']} near-duplicates.")
+    return manifest
+
+def main():
+    """Command line entry point: corpus.py OUT_DIR [--count N] [...]."""
+    parser = argparse.ArgumentParser(description="Generate a synthetic Frida script corpus.")
+    parser.add_argument("out_dir", help="directory to write the scripts into (e.g. scripts/raw)")
+    parser.add_argument("--count", type=int, default=1000, help="number of scripts (1k to 1M)")
+    parser.add_argument("--dup-rate", type=float, default=0.05, help="share of exact duplicates")
+    parser.add_argument("--near-dup-rate", type=float, default=0.1, help="share of near-duplicates")
+    parser.add_argument("--median-kb", type=float, default=4, help="median script size in KB")
+    parser.add_argument("--max-kb", type=float, default=1024, help="largest script size in KB")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="snippet weights, e.g. java=4,ssl=2,native=2,objc=1,trace=1,comm=1")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(2)
+    generate_corpus(args.out_dir, args.count, args.dup_rate, args.near_dup_rate,
+                    args.median_kb, args.max_kb, mix, args.seed)
+
+if __name__ == "__main__":
+    main()
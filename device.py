@@ -0,0 +1,425 @@
+import os
+import sys
+import time
+import atexit
+import socket
+import argparse
+import threading
+import itertools
+from collections import namedtuple
+
+import metrics
+
+try:
+    import frida
+except ImportError:  # The adb paths below work without the bindings
+    frida = None
+
+ADB_HOST = os.environ.get("ANDROID_ADB_SERVER_ADDRESS", "127.0.0.1")
+ADB_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", "5037"))
+FRIDA_SERVER_PATH = "/data/local/tmp/frida-server"
+FRIDA_PORT = 27042     # frida-server's default listening port
+CONNECT_TIMEOUT = 5    # Seconds to reach the adb server
+SHELL_TIMEOUT = 30     # Seconds a shell command may run before the channel is dropped
+FRIDA_TIMEOUT = 5      # Seconds frida waits for the device
+STATE_POLL = 0.1       # First delay between get-state polls after adbd restarts
+RECV_SIZE = 64 * 1024
+
+App = namedtuple("App", "pid name identifier")  # pid is None when the app is not running
+Process = namedtuple("Process", "pid name")
+ShellResult = namedtuple("ShellResult", "output exit_code")
+DeviceInfo = namedtuple("DeviceInfo", "serial state properties")
+
+class AdbError(Exception):
+    """The adb server refused a request or the device connection broke."""
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise AdbError("connection closed by the adb server")
+        data += chunk
+    return data
+
+def _recv_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(RECV_SIZE)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+class AdbClient:
+    """
+    Client for the adb server's smart-socket protocol: a request is a
+    4-digit hex length and the service name, the answer OKAY or FAIL plus a
+    length-prefixed message. Host services (host:...) talk to the server;
+    after host:transport:<serial> the same socket talks to adbd on the device.
+    """
+
+    def __init__(self, host=ADB_HOST, port=ADB_PORT):
+        self.host = host
+        self.port = port
+
+    def _connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        except OSError as e:
+            raise AdbError(f"cannot reach the adb server at {self.host}:{self.port} ({e})") from e
+        # Requests are small writes followed by a read; don't let Nagle hold them back.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _send(sock, service):
+        data = service.encode()
+        sock.sendall(b"%04x" % len(data) + data)
+
+    @staticmethod
+    def _status(sock):
+        status = _recv_exactly(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            length = int(_recv_exactly(sock, 4), 16)
+            raise AdbError(_recv_exactly(sock, length).decode("utf-8", "replace"))
+        raise AdbError(f"unexpected adb reply {status!r}")
+
+    def _host_query(self, service):
+        """Run a host service that answers with one length-prefixed message."""
+        with self._connect() as sock:
+            self._send(sock, service)
+            self._status(sock)
+            length = int(_recv_exactly(sock, 4), 16)
+            return _recv_exactly(sock, length).decode("utf-8", "replace")
+
+    def version(self):
+        """Protocol version of the adb server."""
+        return int(self._host_query("host:version"), 16)
+
+    def devices(self):
+        """Return a DeviceInfo for every device the server knows about."""
+        devices = []
+        for line in self._host_query("host:devices-l").splitlines():
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            properties = dict(field.split(":", 1) for field in fields[2:] if ":" in field)
+            devices.append(DeviceInfo(fields[0], fields[1], properties))
+        return devices
+
+    def get_state(self, serial):
+        """Return "device", "offline", "unauthorized"... for serial."""
+        return self._host_query(f"host-serial:{serial}:get-state")
+
+    def open(self, serial, service):
+        """Open service on the device and return the connected socket."""
+        sock = self._connect()
+        try:
+            self._send(sock, f"host:transport:{serial}" if serial else "host:transport-any")
+            self._status(sock)
+            self._send(sock, service)
+            self._status(sock)
+        except (AdbError, OSError):
+            sock.close()
+            raise
+        return sock
+
+    def run(self, serial, service, timeout=SHELL_TIMEOUT):
+        """Open service on the device and return everything it writes until it closes."""
+        with self.open(serial, service) as sock:
+            sock.settimeout(timeout)
+            return _recv_all(sock).decode("utf-8", "replace")
+
+    def command(self, serial, service):
+        """Run a device service that answers with a second status (reverse:..., etc.)."""
+        with self.open(serial, service) as sock:
+            self._status(sock)
+
+    def query(self, serial, service):
+        """Run a device service that answers with a status and a length-prefixed message."""
+        with self.open(serial, service) as sock:
+            reply = _recv_exactly(sock, 4)
+            if reply in (b"OKAY", b"FAIL"):
+                if reply == b"FAIL":
+                    length = int(_recv_exactly(sock, 4), 16)
+                    raise AdbError(_recv_exactly(sock, length).decode("utf-8", "replace"))
+                reply = _recv_exactly(sock, 4)
+            return _recv_exactly(sock, int(reply, 16)).decode("utf-8", "replace")
+
+class ShellChannel:
+    """
+    One long-lived `sh` on the device. Each command is followed by a printf
+    of a unique marker and its exit status, so many commands share one adb
+    connection and one shell process instead of paying for both every time.
+    """
+
+    def __init__(self, client, serial):
+        self.sock = client.open(serial, "shell:sh")
+        self.buffer = bytearray()
+        self.markers = itertools.count(1)
+        self.prefix = f"__sasha_{os.getpid()}_{id(self):x}"
+
+    def run(self, command, timeout=SHELL_TIMEOUT):
+        """Run command and return a ShellResult with its combined output."""
+        marker = f"{self.prefix}_{next(self.markers)}__".encode()
+        self.sock.settimeout(timeout)
+        self.sock.sendall(f"{command} </dev/null 2>&1\nprintf '\\n%s:%s\\n' {marker.decode()} \"$?\"\n".encode())
+        end = b"\n" + marker + b":"
+        searched = 0  # Only look at new data (plus a marker's length) after each recv
+        while True:
+            start = self.buffer.find(end, searched)
+            if start >= 0:
+                newline = self.buffer.find(b"\n", start + len(end))
+                if newline >= 0:
+                    break
+            else:
+                searched = max(0, len(self.buffer) - len(end))
+            chunk = self.sock.recv(RECV_SIZE)
+            if not chunk:
+                raise AdbError("device shell closed")
+            self.buffer += chunk
+        output = self.buffer[:start].decode("utf-8", "replace").replace("\r\n", "\n")
+        exit_code = int(self.buffer[start + len(end):newline].strip() or 0)
+        del self.buffer[:newline + 1]
+        return ShellResult(output.rstrip("\n"), exit_code)
+
+    def close(self):
+        try:
+            self.sock.sendall(b"exit\n")
+        except OSError:
+            pass
+        self.sock.close()
+
+class DeviceSession:
+    """
+    A persistent connection to one device. Shell commands share a single
+    ShellChannel, adb host services go straight to the adb server and app
+    and process lists come from frida's Python bindings when they are
+    installed (adb otherwise). Everything returns structured values.
+    Sessions are pooled by serial; use get_session() instead of creating them.
+    """
+
+    def __init__(self, serial=None, client=None, frida_device=None):
+        self.client = client or AdbClient()
+        self.serial = serial or os.environ.get("ANDROID_SERIAL") or self._only_device()
+        self.lock = threading.RLock()
+        self.channel = None
+        self._frida_device = frida_device
+        self._frida_failed = False
+
+    def _only_device(self):
+        devices = [info.serial for info in self.client.devices() if info.state == "device"]
+        if len(devices) != 1:
+            raise AdbError(f"{len(devices)} devices attached; pass a serial (or set ANDROID_SERIAL)")
+        return devices[0]
+
+    def shell(self, command, timeout=SHELL_TIMEOUT):
+        """Run a shell command on the device and return a ShellResult."""
+        with self.lock, metrics.timer("device_call_seconds", op="shell"):
+            for attempt in range(2):
+                try:
+                    if self.channel is None:
+                        self.channel = ShellChannel(self.client, self.serial)
+                    return self.channel.run(command, timeout)
+                except (AdbError, OSError) as e:
+                    # The shell died (adbd restarted, device reconnected) or hung; start over once.
+                    if self.channel is not None:
+                        self.channel.sock.close()
+                        self.channel = None
+                    if attempt or isinstance(e, TimeoutError):
+                        raise AdbError(f"shell command failed on {self.serial}: {e}") from e
+
+    def state(self):
+        return self.client.get_state(self.serial)
+
+    def properties(self):
+        """Device properties from getprop as a dictionary."""
+        values = {}
+        for line in self.shell("getprop").output.splitlines():
+            key, _, value = line.partition("]: [")
+            if key.startswith("[") and value.endswith("]"):
+                values[key[1:]] = value[:-1]
+        return values
+
+    def reverse(self, local, remote):
+        """adb reverse local remote, e.g. reverse("tcp:8080", "tcp:8080")."""
+        with metrics.timer("device_call_seconds", op="reverse"):
+            self.client.command(self.serial, f"reverse:forward:{local};{remote}")
+
+    def reverse_list(self):
+        """Active adb reverse rules as (local, remote) pairs."""
+        rules = []
+        for line in self.client.query(self.serial, "reverse:list-forward").splitlines():
+            fields = line.split()
+            if len(fields) >= 3:
+                rules.append((fields[1], fields[2]))
+        return rules
+
+    def listening_ports(self):
+        """TCP ports something listens on, read from /proc/net/tcp and tcp6."""
+        ports = set()
+        for line in self.shell("cat /proc/net/tcp /proc/net/tcp6").output.splitlines():
+            fields = line.split()
+            # sl local_address rem_address st ...; state 0A is LISTEN
+            if len(fields) > 3 and fields[3] == "0A" and ":" in fields[1]:
+                ports.add(int(fields[1].rsplit(":", 1)[1], 16))
+        return ports
+
+    def root(self, timeout=30):
+        """Restart adbd as root and wait until the device is back. Returns adbd's message."""
+        with self.lock, metrics.timer("device_call_seconds", op="root"):
+            message = self.client.run(self.serial, "root:").strip()
+            if "already running as root" in message:
+                return message
+            self._drop_channel()
+            deadline = time.monotonic() + timeout
+            delay = STATE_POLL
+            while True:
+                try:
+                    if self.state() == "device":
+                        return message
+                except AdbError:
+                    pass  # The device is briefly gone while adbd restarts
+                if time.monotonic() > deadline:
+                    raise AdbError(f"{self.serial} did not come back after adb root")
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+
+    def processes(self):
+        """Running processes as Process tuples."""
+        device = self.frida_device()
+        if device is not None:
+            with metrics.timer("device_call_seconds", op="frida_processes"):
+                return [Process(p.pid, p.name) for p in device.enumerate_processes()]
+        result = self.shell("ps -A -o PID,NAME")
+        if result.exit_code != 0:  # Older toolbox ps takes no options
+            result = self.shell("ps")
+        processes = []
+        lines = result.output.splitlines()
+        header = lines[0].split() if lines else []
+        for line in lines[1:]:
+            fields = line.split()
+            if len(fields) >= 2 and "PID" in header:
+                pid = fields[header.index("PID")]
+                if pid.isdigit():
+                    processes.append(Process(int(pid), fields[-1]))
+        return processes
+
+    def applications(self):
+        """Installed apps as App tuples (what `frida-ps -Uia` lists)."""
+        device = self.frida_device()
+        if device is not None:
+            with metrics.timer("device_call_seconds", op="frida_applications"):
+                return [App(app.pid or None, app.name, app.identifier)
+                        for app in device.enumerate_applications()]
+        running = {process.name: process.pid for process in self.processes()}
+        apps = []
+        for line in self.shell("pm list packages").output.splitlines():
+            if line.startswith("package:"):
+                identifier = line[len("package:"):].strip()
+                apps.append(App(running.get(identifier), identifier, identifier))
+        return sorted(apps, key=lambda app: (app.pid is None, app.identifier))
+
+    def frida_server_pids(self, path=FRIDA_SERVER_PATH):
+        name = os.path.basename(path)
+        return [process.pid for process in self.processes() if process.name == name]
+
+    def frida_server_running(self, path=FRIDA_SERVER_PATH):
+        return bool(self.frida_server_pids(path))
+
+    def frida_server_version(self, path=FRIDA_SERVER_PATH):
+        """Version of the frida-server binary on the device, or None if it is missing."""
+        result = self.shell(f"{path} --version")
+        return result.output.strip() if result.exit_code == 0 else None
+
+    def start_frida_server(self, path=FRIDA_SERVER_PATH):
+        """Launch frida-server in the background; it outlives the shell channel."""
+        self.shell(f"nohup {path} >/dev/null 2>&1 &")
+        self._frida_device = None
+        self._frida_failed = False
+
+    def kill(self, name):
+        """pkill a process by name. Returns True if something was killed."""
+        return self.shell(f"pkill {name}").exit_code == 0
+
+    def frida_device(self):
+        """The frida Device for this serial, or None without bindings or a reachable server."""
+        if self._frida_device is None and frida is not None and not self._frida_failed:
+            try:
+                self._frida_device = frida.get_device(self.serial, timeout=FRIDA_TIMEOUT)
+            except Exception as e:
+                print(f"[DEBUG] frida bindings cannot reach {self.serial} ({e}); using adb instead.")
+                self._frida_failed = True
+        return self._frida_device
+
+    def frida_args(self):
+        """Device selection options for the frida command line tools."""
+        return f"-D {self.serial}"
+
+    def _drop_channel(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+    def close(self):
+        with self.lock:
+            self._drop_channel()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(serial=None, client=None):
+    """
+    Return the pooled DeviceSession for serial (ANDROID_SERIAL or the only
+    attached device when None), opening it on first use.
+    """
+    serial = serial or os.environ.get("ANDROID_SERIAL")
+    with _sessions_lock:
+        session = _sessions.get(serial)
+        if session is None:
+            session = DeviceSession(serial, client)
+            _sessions[serial] = session
+            _sessions[session.serial] = session
+        return session
+
+def close_sessions():
+    """Close every pooled session."""
+    with _sessions_lock:
+        for session in set(_sessions.values()):
+            session.close()
+        _sessions.clear()
+
+atexit.register(close_sessions)
+
+def main():
+    """Command line entry point: device.py [--serial S] devices|apps|ps|shell CMD."""
+    parser = argparse.ArgumentParser(description="Query a device over a persistent adb/frida session.")
+    parser.add_argument("command", choices=["devices", "apps", "ps", "shell"])
+    parser.add_argument("args", nargs="*", help="shell command")
+    parser.add_argument("--serial", help="device serial (default: ANDROID_SERIAL or the only device)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "devices":
+            for info in AdbClient().devices():
+                print(f"{info.serial}\t{info.state}\t{' '.join(f'{k}:{v}' for k, v in info.properties.items())}")
+            return
+        session = get_session(args.serial)
+        if args.command == "apps":
+            for app in session.applications():
+                print(f"{app.pid or '-':>6}  {app.name:30}  {app.identifier}")
+        elif args.command == "ps":
+            for process in session.processes():
+                print(f"{process.pid:>6}  {process.name}")
+        else:
+            result = session.shell(" ".join(args.args))
+            print(result.output)
+            sys.exit(result.exit_code)
+    except AdbError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
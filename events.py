@@ -0,0 +1,392 @@
+import os
+import ast
+import sys
+import json
+import time
+import atexit
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import deque
+
+import metrics
+
+EVENTS_DB = "scripts/events.db"
+SCRIPT_DB = "scripts/scripts.db"
+EVENTS_ENV = "SASHA_EVENTS"  # Path of an events DB; when set, the launchers record hook output there
+FLUSH_INTERVAL = 0.05        # Seconds between group commits while events keep coming
+COMMIT_EVENTS = 20000        # Events written per transaction at most
+RETRY_MAX_DELAY = 2.0        # Longest wait before retrying a batch that failed to commit
+STOP_RETRIES = 5             # Attempts left for a failing batch once the sink is closing
+
+def _make_encoder():
+    """
+    A compact JSON encoder for payloads. json's C encoder is built once and
+    reused; JSONEncoder.encode builds a new one per call, which costs a third
+    of the time for small payloads. Falls back to that where there is no C encoder.
+    Payloads come from JSON, so there are no cycles to check for.
+    """
+    c_make_encoder = getattr(json.encoder, "c_make_encoder", None)
+    if c_make_encoder is None:
+        return json.JSONEncoder(separators=(",", ":"), default=str, check_circular=False).encode
+    encoder = c_make_encoder(None, str, json.encoder.encode_basestring_ascii, None, ":", ",", False, False, True)
+    return lambda payload: "".join(encoder(payload, 0))
+
+_encode = _make_encoder()
+
+def connect(db_path=EVENTS_DB):
+    """Open (and create) the events DB in WAL mode, tuned for appends."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    # Where an event came from: one row per (run, script). script_id is Scripts.id
+    # in the script DB when the script is known there (matched by sha256).
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS EventSources (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started REAL,
+        pid INTEGER,
+        target TEXT,
+        path TEXT,
+        sha256 TEXT,
+        script_id INTEGER
+    )
+    """)
+    # Append-only; no secondary indexes so inserts stay sequential.
+    # payload is the JSON of a send() payload or the text of a log line.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS Events (
+        id INTEGER PRIMARY KEY,
+        ts REAL,
+        source_id INTEGER,
+        kind TEXT,
+        payload TEXT,
+        data BLOB,
+        FOREIGN KEY(source_id) REFERENCES EventSources(id)
+    )
+    """)
+    conn.commit()
+    return conn
+
+def script_id_for(sha256, script_db=SCRIPT_DB):
+    """The Scripts.id of a script with this content hash, or None."""
+    if not sha256 or not os.path.exists(script_db):
+        return None
+    try:
+        conn = sqlite3.connect(script_db)
+        try:
+            row = conn.execute("SELECT id FROM Scripts WHERE sha256 = ?", (sha256,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def file_sha256(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+class EventSink:
+    """
+    Collects hook events from any number of threads and appends them to the
+    events DB from one writer thread. record() only appends a tuple to a
+    deque, so the frida message thread (and through it the app) never waits
+    on the disk; the writer takes everything pending every FLUSH_INTERVAL
+    and writes it in one transaction (group commit). Nothing is dropped: a
+    writer that falls behind only makes the next batch bigger, and a batch
+    that fails to commit (say, the DB is locked) is retried with backoff.
+    """
+
+    def __init__(self, db_path=EVENTS_DB, script_db=SCRIPT_DB):
+        self.db_path = db_path
+        self.script_db = script_db
+        self.conn = connect(db_path)
+        self.conn_lock = threading.Lock()  # One transaction at a time on conn (writer and source())
+        self.pending = deque()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.sources = {}  # (pid, path, sha256) -> EventSources.id
+        self.sources_lock = threading.Lock()
+        self.written = 0
+        self.max_pending = 0
+        self.writer = threading.Thread(target=self._write_loop, name="event-sink", daemon=True)
+        self.writer.start()
+
+    def source(self, pid=None, target=None, path=None, sha256=None):
+        """The EventSources id for events of one script in one process, created on first use."""
+        key = (pid, path, sha256)
+        source_id = self.sources.get(key)
+        if source_id is not None:
+            return source_id
+        with self.sources_lock:
+            source_id = self.sources.get(key)
+            if source_id is None:
+                script_id = script_id_for(sha256, self.script_db)
+                # The writer thread shares conn, so its batches must not interleave with this one.
+                with self.conn_lock, self.conn:
+                    source_id = self.conn.execute(
+                        "INSERT INTO EventSources (started, pid, target, path, sha256, script_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", (time.time(), pid, target, path, sha256, script_id)).lastrowid
+                self.sources[key] = source_id
+        return source_id
+
+    def script_source(self, pid, target, script):
+        """The source for a script given as a file path (hashed to find its Scripts.id) or codeshare: name."""
+        if script.startswith("codeshare:"):
+            return self.source(pid, target, script)
+        return self.source(pid, target, os.path.abspath(script), file_sha256(script))
+
+    def record(self, source_id, kind, payload, data=None, ts=None):
+        """
+        Queue one event. payload is stored as given if it is a str, as JSON
+        otherwise; the encoding happens on the writer thread.
+        """
+        self.pending.append((ts or time.time(), source_id, kind, payload, data))
+
+    def _session_source(self, session, path):
+        loaded = session.scripts.get(path)
+        if loaded is None:  # Still loading: messages sent from the script's top level
+            return self.script_source(session.pid, session.identifier, path)
+        return self.source(session.pid, session.identifier, path, loaded.sha256)
+
+    def on_message(self, session, path, message, data):
+        """A sessions.py on_message handler: stores send() payloads and script errors (also printed)."""
+        source_id = self._session_source(session, path)
+        if message.get("type") == "send":
+            self.record(source_id, "send", message.get("payload"), data)
+        else:
+            self.record(source_id, "error", message)
+            print(f"[ERROR] [{session.pid}] [{os.path.basename(path)}] {message.get('stack') or message.get('description')}")
+
+    def on_log(self, session, path, level, text):
+        """A sessions.py on_log handler: stores console output (JSON lines as they are) without printing it."""
+        self.record(self._session_source(session, path), "log" if level == "info" else level, text)
+
+    def line_handler(self, source_id, echo=None):
+        """
+        An outpump on_line handler for the frida CLI: stores `message: {...}`
+        lines and JSON console lines; other lines go to echo (if given).
+        """
+        def on_line(stream_name, text):
+            event = parse_line(text)
+            if event is None:
+                if echo is not None:
+                    echo(stream_name, text)
+                return
+            self.record(source_id, *event)
+        return on_line
+
+    def _write_loop(self):
+        insert = "INSERT INTO Events (ts, source_id, kind, payload, data) VALUES (?, ?, ?, ?, ?)"
+        batch = None  # Popped but not committed yet
+        failures = 0
+        while True:
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            stopping = self.stopping
+            pending = self.pending
+            while batch or pending:
+                if batch is None:
+                    count = min(len(pending), COMMIT_EVENTS)
+                    self.max_pending = max(self.max_pending, len(pending))
+                    popleft = pending.popleft
+                    batch = [_row(popleft()) for _ in range(count)]  # Only this thread pops, so count items are there
+                try:
+                    with self.conn_lock, metrics.timer("event_commit_seconds"), self.conn:
+                        self.conn.executemany(insert, batch)
+                except sqlite3.Error as e:
+                    failures += 1
+                    metrics.count("event_write_errors_total")
+                    if stopping and failures >= STOP_RETRIES:
+                        print(f"[ERROR] Giving up on {len(batch) + len(pending)} events after {failures} "
+                              f"failed writes to {self.db_path}: {e}")
+                        return
+                    delay = min(RETRY_MAX_DELAY, FLUSH_INTERVAL * 2 ** failures)
+                    print(f"[ERROR] Could not write {len(batch)} events to {self.db_path} ({e}); "
+                          f"retrying in {delay:.2f} s.")
+                    time.sleep(delay)
+                    continue
+                self.written += len(batch)
+                metrics.count("events_written_total", len(batch))
+                batch = None
+                failures = 0
+            if stopping:
+                return
+
+    def flush(self):
+        """Wait until everything recorded so far is committed."""
+        target = self.written + len(self.pending)
+        while self.written < target and self.writer.is_alive():
+            self.wakeup.set()
+            time.sleep(0.001)
+
+    def close(self):
+        self.stopping = True
+        self.wakeup.set()
+        self.writer.join()
+        with self.conn_lock:
+            self.conn.close()
+
+def _row(event):
+    ts, source_id, kind, payload, data = event
+    return ts, source_id, kind, payload if payload.__class__ is str else _encode(payload), data
+
+def parse_line(text):
+    """
+    Turn a line of frida CLI output into (kind, payload) or None. Handles
+    the CLI's `message: {'type': 'send', 'payload': ...} data: None` lines
+    and console lines that are JSON objects or arrays.
+    """
+    if text.startswith("message: "):
+        body = text[len("message: "):].rsplit(" data: ", 1)[0]
+        try:
+            message = ast.literal_eval(body)
+        except (ValueError, SyntaxError):
+            return None
+        if isinstance(message, dict) and message.get("type") == "send":
+            return "send", message.get("payload")
+        return "error", message
+    stripped = text.strip()
+    if stripped[:1] in ("{", "[") and stripped[-1:] in ("}", "]"):
+        try:
+            json.loads(stripped)
+        except ValueError:
+            return None
+        return "log", stripped
+    return None
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_sink():
+    """The shared EventSink when SASHA_EVENTS names an events DB, otherwise None."""
+    global _sink
+    db_path = os.environ.get(EVENTS_ENV)
+    if not db_path:
+        return None
+    with _sink_lock:
+        if _sink is None:
+            _sink = EventSink(db_path)
+        return _sink
+
+def close_sink():
+    """Commit what is still queued and stop the shared sink."""
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+atexit.register(close_sink)
+
+HOOKS = ["open", "read", "write", "connect", "SSL_write", "SSL_read", "javax.crypto.Cipher.doFinal",
+         "okhttp3.OkHttpClient.newCall", "java.io.File.exists"]
+
+def generate(count, seed):
+    """count synthetic send() payloads shaped like what tracing scripts send."""
+    rng = random.Random(seed)
+    return [{"hook": rng.choice(HOOKS), "seq": index, "tid": rng.randrange(1000, 1100),
+             "args": [f"0x{rng.getrandbits(40):x}", rng.randrange(4096)], "ret": rng.randrange(-1, 65536)}
+            for index in range(count)]
+
+def _produce(sink, source_id, payloads, latencies):
+    record = sink.record
+    worst = 0
+    for payload in payloads:
+        started = time.perf_counter()
+        record(source_id, "send", payload)
+        worst = max(worst, time.perf_counter() - started)
+    latencies.append(worst)
+
+def bench(db_path, events, producers):
+    """
+    Feed generated events from producer threads (standing in for frida's
+    message threads, which hand over parsed payloads) through a sink and
+    print the sustained rate, end to end from the first record() to the
+    last commit.
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    per_producer = events // producers
+    batches = [generate(per_producer, seed) for seed in range(producers)]
+    sink = EventSink(db_path, script_db=os.devnull)
+    source_id = sink.source(pid=4242, target="bench", path="generator.js")
+    latencies = []
+    threads = [threading.Thread(target=_produce, args=(sink, source_id, payloads, latencies)) for payloads in batches]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    produced = time.perf_counter() - started
+    sink.flush()
+    total = time.perf_counter() - started
+    sink.close()
+    conn = sqlite3.connect(db_path)
+    stored = conn.execute("SELECT COUNT(*) FROM Events").fetchone()[0]
+    conn.close()
+    expected = per_producer * producers
+    size = sum(os.path.getsize(db_path + suffix) for suffix in ("", "-wal") if os.path.exists(db_path + suffix))
+    print(f"[INFO] {stored} of {expected} events stored in {total:.2f} s: {stored / total:,.0f} events/s end to end. "
+          f"Producers finished in {produced:.2f} s ({expected / produced:,.0f} events/s), "
+          f"slowest record() {max(latencies) * 1000:.2f} ms. Largest backlog {sink.max_pending} events, "
+          f"DB {size / 1024 / 1024:.1f} MB.")
+    if stored != expected:
+        print(f"[ERROR] {expected - stored} events lost.")
+        sys.exit(1)
+
+def summary(db_path, script_db=SCRIPT_DB):
+    """Print event counts per source script (with its script DB name when linked)."""
+    conn = connect(db_path)
+    scripts = {}
+    if os.path.exists(script_db):
+        try:
+            script_conn = sqlite3.connect(script_db)
+            scripts = dict(script_conn.execute("SELECT id, filename FROM Scripts"))
+            script_conn.close()
+        except sqlite3.Error:
+            pass
+    rows = conn.execute("""
+    SELECT EventSources.id, EventSources.pid, EventSources.target, EventSources.path, EventSources.script_id,
+           Events.kind, COUNT(*), MIN(Events.ts), MAX(Events.ts)
+    FROM Events JOIN EventSources ON EventSources.id = Events.source_id
+    GROUP BY Events.source_id, Events.kind ORDER BY EventSources.id, Events.kind
+    """).fetchall()
+    conn.close()
+    for source_id, pid, target, path, script_id, kind, count, first, last in rows:
+        name = scripts.get(script_id) or os.path.basename(path or "") or "-"
+        print(f"{source_id:>5}  {pid or '-':>6}  {target or '-':30}  {name:30}  {kind:6} {count:>10}  "
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first))} .. "
+              f"{time.strftime('%H:%M:%S', time.localtime(last))}")
+
+def main():
+    """Command line entry point: events.py summary [--db D] | bench [--events N] [--producers P]."""
+    parser = argparse.ArgumentParser(description="Store and inspect hook events.")
+    parser.add_argument("command", choices=["summary", "bench"])
+    parser.add_argument("--db", default=EVENTS_DB, help=f"events DB (default: {EVENTS_DB}; bench: bench/events.db)")
+    parser.add_argument("--script-db", default=SCRIPT_DB, help=f"script DB to name scripts (default: {SCRIPT_DB})")
+    parser.add_argument("--events", type=int, default=1000000, help="events to generate (bench)")
+    parser.add_argument("--producers", type=int, default=4, help="threads generating events (bench)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.start("events", args.metrics, args.profile)
+
+    if args.command == "bench":
+        db_path = args.db if args.db != EVENTS_DB else os.path.join("bench", "events.db")
+        bench(db_path, args.events, args.producers)
+    else:
+        if not os.path.exists(args.db):
+            print(f"[ERROR] No events DB at {args.db}.")
+            sys.exit(1)
+        summary(args.db, args.script_db)
+
+if __name__ == "__main__":
+    main()
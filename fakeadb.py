@@ -0,0 +1,420 @@
+import re
+import sys
+import time
+import shlex
+import argparse
+import threading
+import socketserver
+from collections import namedtuple
+
+import device
+
+DEFAULT_PACKAGES = ["com.android.settings", "com.google.android.gms", "com.example.bank",
+                    "com.example.shop", "org.example.notes"]
+FRIDA_VERSION = "16.2.1"
+
+FakeApp = namedtuple("FakeApp", "identifier name pid")
+FakeProcess = namedtuple("FakeProcess", "pid name")
+
+class FakeDevice:
+    """
+    State of one emulated device: installed packages, running processes,
+    files, settings and whether adbd runs as root. run() interprets the
+    handful of shell commands the launchers send.
+    """
+
+    def __init__(self, serial, packages=None, running=(), rooted=False, frida_version=FRIDA_VERSION,
+                 server_startup=0.0):
+        self.serial = serial
+        self.server_startup = server_startup  # Seconds frida-server takes to start listening
+        self.server_started = None
+        self.packages = list(DEFAULT_PACKAGES if packages is None else packages)
+        self.rooted = rooted
+        self.frida_version = frida_version
+        self.files = {device.FRIDA_SERVER_PATH}
+        self.settings = {}
+        self.reverses = {}
+        self.properties = {"ro.product.model": "sdk_gphone64_x86_64", "ro.serialno": serial}
+        self.lock = threading.Lock()
+        self.next_pid = 1000
+        self.processes = {}  # pid -> name
+        self.sessions = []   # Attached FakeSessions
+        self.suspended = set()  # Spawned PIDs not resumed yet
+        for name in ("init", "zygote64", "system_server", *running):
+            self.start(name)
+        if "frida-server" in running:
+            self.server_started = time.monotonic() - server_startup
+
+    def start(self, name):
+        with self.lock:
+            self.next_pid += 1
+            self.processes[self.next_pid] = name
+            return self.next_pid
+
+    def kill(self, pid):
+        with self.lock:
+            killed = self.processes.pop(pid, None) is not None
+            sessions = [session for session in self.sessions if session.pid == pid]
+        for session in sessions:
+            session._detach("process-terminated")
+        return killed
+
+    def pids(self, name):
+        with self.lock:
+            return [pid for pid, other in self.processes.items() if other == name]
+
+    def run(self, line, last_status=0):
+        """Run one shell line. Returns (output, exit status)."""
+        try:
+            words = shlex.split(line.replace("$?", str(last_status)))
+        except ValueError:
+            return "sh: syntax error\n", 2
+        words = [word for word in words if word not in ("</dev/null", "2>&1", ">/dev/null", "&")]
+        if words[:1] == ["nohup"]:
+            words = words[1:]
+        if not words:
+            return "", last_status
+        name, args = words[0], words[1:]
+
+        if name == "printf":
+            fmt = args[0].replace("\\n", "\n") if args else ""
+            return fmt % tuple(args[1:1 + fmt.count("%s")]), 0
+        if name == "echo":
+            return " ".join(args) + "\n", 0
+        if name in ("true", "exit"):
+            return "", 0
+        if name == "id" and args == ["-u"]:
+            return ("0" if self.rooted else "2000") + "\n", 0
+        if name == "getprop":
+            if args:
+                return self.properties.get(args[0], "") + "\n", 0
+            return "".join(f"[{key}]: [{value}]\n" for key, value in sorted(self.properties.items())), 0
+        if name == "ps":
+            with self.lock:
+                rows = sorted(self.processes.items())
+            return "PID NAME\n" + "".join(f"{pid} {process}\n" for pid, process in rows), 0
+        if name == "pm" and args[:2] == ["list", "packages"]:
+            return "".join(f"package:{package}\n" for package in self.packages), 0
+        if name == "settings" and len(args) >= 3 and args[0] == "put":
+            self.settings[args[1], args[2]] = " ".join(args[3:])
+            return "", 0
+        if name == "settings" and len(args) == 3 and args[0] == "get":
+            return self.settings.get((args[1], args[2]), "null") + "\n", 0
+        if name == "cat" and args and all(arg.startswith("/proc/net/tcp") for arg in args):
+            lines = "  sl  local_address rem_address   st\n"
+            listening = (self.pids("frida-server") and self.server_started is not None
+                         and time.monotonic() - self.server_started >= self.server_startup)
+            if listening:
+                lines += f"   0: 0100007F:{device.FRIDA_PORT:04X} 00000000:0000 0A\n"
+            return lines, 0
+        if name == "pkill" and args:
+            pids = self.pids(args[-1])
+            for pid in pids:
+                self.kill(pid)
+            return "", 0 if pids else 1
+        if name == "ls" and args:
+            if args[-1] in self.files:
+                return args[-1] + "\n", 0
+            return f"ls: {args[-1]}: No such file or directory\n", 1
+        if name == "am" and args[:1] == ["force-stop"] and len(args) == 2:
+            for pid in self.pids(args[1]):
+                self.kill(pid)
+            return "", 0
+        if name in self.files and name.endswith("frida-server"):
+            if args == ["--version"]:
+                return self.frida_version + "\n", 0
+            if not self.pids("frida-server"):
+                self.start("frida-server")
+                self.server_started = time.monotonic()
+            return "", 0
+        return f"sh: {name}: not found\n", 127
+
+class FakeFridaDevice:
+    """
+    The part of frida's Device API the launchers use, answered from a
+    FakeDevice so frida-backed code paths run without a phone.
+    """
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.id = fake.serial
+        self.type = "usb"
+
+    def enumerate_processes(self):
+        with self.fake.lock:
+            rows = sorted(self.fake.processes.items())
+        return [FakeProcess(pid, name) for pid, name in rows]
+
+    def enumerate_applications(self):
+        running = {process.name: process.pid for process in self.enumerate_processes()}
+        return [FakeApp(package, package.rsplit(".", 1)[-1].title(), running.get(package, 0))
+                for package in self.fake.packages]
+
+    def spawn(self, program):
+        if isinstance(program, (list, tuple)):
+            program = program[0]
+        if program not in self.fake.packages:
+            raise RuntimeError(f"unable to find application with identifier '{program}'")
+        pid = self.fake.start(program)
+        self.fake.suspended.add(pid)
+        return pid
+
+    def resume(self, pid):
+        self.fake.suspended.discard(pid)
+
+    def attach(self, pid):
+        with self.fake.lock:
+            if pid not in self.fake.processes:
+                raise RuntimeError(f"unable to find process with pid {pid}")
+            session = FakeSession(self.fake, pid)
+            self.fake.sessions.append(session)
+        return session
+
+    def kill(self, pid):
+        self.fake.kill(pid)
+
+SCRIPT_CALL = re.compile(r"""\b(send|console\.log|console\.warn|console\.error)\(\s*(["'])(.*?)\2\s*\)""")
+SCRIPT_THROW = re.compile(r"""^throw new Error\(\s*(["'])(.*?)\1\s*\)""", re.M)  # At the top level: load() fails
+
+class FakeSession:
+    """A frida Session stand-in: creates FakeScripts and reports detaching."""
+
+    def __init__(self, fake, pid):
+        self.fake = fake
+        self.pid = pid
+        self.scripts = []
+        self.detached = False
+        self.handlers = {"detached": []}
+
+    def on(self, signal, callback):
+        self.handlers.setdefault(signal, []).append(callback)
+
+    def create_script(self, source, name=None):
+        if self.detached:
+            raise RuntimeError("session is gone")
+        # Unbalanced brackets stand in for a compilation error.
+        if any(source.count(left) != source.count(right) for left, right in ("()", "{}", "[]")):
+            raise RuntimeError(f"{name or 'script'}: could not parse: SyntaxError")
+        script = FakeScript(self, source, name)
+        self.scripts.append(script)
+        return script
+
+    def detach(self):
+        self._detach("application-requested")
+
+    def _detach(self, reason):
+        if self.detached:
+            return
+        self.detached = True
+        for script in self.scripts:
+            script.loaded = False
+        with self.fake.lock:
+            if self in self.fake.sessions:
+                self.fake.sessions.remove(self)
+        for callback in self.handlers.get("detached", []):
+            callback(reason, None)
+
+class FakeScript:
+    """
+    A frida Script stand-in. load() "runs" the source by delivering every
+    send("...") as a message and every console.log("...") to the log handler;
+    a line starting with throw new Error("...") makes it fail.
+    """
+
+    def __init__(self, session, source, name):
+        self.session = session
+        self.source = source
+        self.name = name
+        self.loaded = False
+        self.unloaded = False
+        self.handlers = {"message": [], "destroyed": []}
+        self.log_handler = None
+
+    def on(self, signal, callback):
+        self.handlers.setdefault(signal, []).append(callback)
+
+    def set_log_handler(self, handler):
+        self.log_handler = handler
+
+    def load(self):
+        if self.session.detached or self.unloaded:
+            raise RuntimeError("script is destroyed")
+        thrown = SCRIPT_THROW.search(self.source)
+        if thrown:
+            raise RuntimeError(f"Error: {thrown.group(2)}")
+        self.loaded = True
+        for call, _, text in SCRIPT_CALL.findall(self.source):
+            if call == "send":
+                for callback in self.handlers["message"]:
+                    callback({"type": "send", "payload": text}, None)
+            elif self.log_handler is not None:
+                self.log_handler({"console.log": "info"}.get(call, call.split(".")[1]), text)
+
+    def unload(self):
+        if self.unloaded:
+            raise RuntimeError("script is destroyed")
+        self.loaded = False
+        self.unloaded = True
+        for callback in self.handlers["destroyed"]:
+            callback()
+
+    def post(self, message, data=None):
+        pass
+
+def _read_request(rfile):
+    header = rfile.read(4)
+    if len(header) < 4:
+        return None
+    return rfile.read(int(header, 16)).decode()
+
+class _AdbHandler(socketserver.StreamRequestHandler):
+
+    disable_nagle_algorithm = True
+
+    def _okay(self, payload=None):
+        self.wfile.write(b"OKAY")
+        if payload is not None:
+            data = payload.encode()
+            self.wfile.write(b"%04x" % len(data) + data)
+        self.wfile.flush()
+
+    def _fail(self, message):
+        data = message.encode()
+        self.wfile.write(b"FAIL" + b"%04x" % len(data) + data)
+        self.wfile.flush()
+
+    def handle(self):
+        devices = self.server.devices
+        target = None
+        while True:
+            request = _read_request(self.rfile)
+            if request is None:
+                return
+            if target is None:
+                if request == "host:version":
+                    self._okay("0029")
+                elif request in ("host:devices", "host:devices-l"):
+                    long_form = request.endswith("-l")
+                    self._okay("".join(
+                        f"{serial}\tdevice" + (f" model:{fake.properties['ro.product.model']}" if long_form else "")
+                        + "\n" for serial, fake in devices.items()))
+                    return
+                elif request.startswith("host-serial:") and request.endswith(":get-state"):
+                    serial = request[len("host-serial:"):-len(":get-state")]
+                    if serial in devices:
+                        self._okay("device")
+                    else:
+                        self._fail(f"device '{serial}' not found")
+                    return
+                elif request == "host:transport-any" and len(devices) == 1:
+                    target = next(iter(devices.values()))
+                    self._okay()
+                elif request.startswith("host:transport:") and request[len("host:transport:"):] in devices:
+                    target = devices[request[len("host:transport:"):]]
+                    self._okay()
+                else:
+                    self._fail(f"unsupported or unknown: {request}")
+                    return
+                continue
+
+            if request.startswith("shell:"):
+                self._okay()
+                command = request[len("shell:"):]
+                if command == "sh":
+                    self._interactive(target)
+                else:
+                    output, _ = target.run(command)
+                    self.wfile.write(output.encode())
+            elif request.startswith("reverse:forward:"):
+                local, _, remote = request[len("reverse:forward:"):].partition(";")
+                target.reverses[local] = remote
+                self._okay()
+                self._okay()
+            elif request == "reverse:list-forward":
+                self._okay()
+                self._okay("".join(f"{target.serial} {local} {remote}\n"
+                                   for local, remote in target.reverses.items()))
+            elif request == "root:":
+                self._okay()
+                message = "adbd is already running as root\n" if target.rooted else "restarting adbd as root\n"
+                if not target.rooted:
+                    target.reverses.clear()  # Reverse rules die with the old adbd
+                target.rooted = True
+                self.wfile.write(message.encode())
+            else:
+                self._fail(f"unsupported service: {request}")
+            return
+
+    def _interactive(self, target):
+        status = 0
+        for line in self.rfile:
+            line = line.decode("utf-8", "replace").strip()
+            if line == "exit":
+                return
+            output, status = target.run(line, status)
+            self.wfile.write(output.encode())
+            self.wfile.flush()
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """
+    A local stand-in for the adb server and its devices, speaking the
+    smart-socket protocol on 127.0.0.1. Use as a context manager; port 0
+    picks a free port (see .port). client() and frida_device() give
+    the matching device.AdbClient and frida stand-in.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, devices=None, port=0):
+        super().__init__(("127.0.0.1", port), _AdbHandler)
+        devices = devices or [FakeDevice("emulator-5554")]
+        self.devices = {fake.serial: fake for fake in devices}
+        self.port = self.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="fakeadb", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def client(self):
+        return device.AdbClient("127.0.0.1", self.port)
+
+    def frida_device(self, serial):
+        return FakeFridaDevice(self.devices[serial])
+
+def main():
+    """Command line entry point: fakeadb.py [--port 5037] [--devices N] serves fake devices until Ctrl-C."""
+    parser = argparse.ArgumentParser(description="Serve fake devices over the adb protocol.")
+    parser.add_argument("--port", type=int, default=device.ADB_PORT, help="port to listen on")
+    parser.add_argument("--devices", type=int, default=1, help="number of fake emulators")
+    args = parser.parse_args()
+
+    fakes = [FakeDevice(f"emulator-{5554 + 2 * index}") for index in range(args.devices)]
+    try:
+        server = FakeAdbServer(fakes, args.port)
+    except OSError as e:
+        print(f"[ERROR] Cannot listen on port {args.port}: {e}")
+        sys.exit(1)
+    print(f"[INFO] Fake adb server with {len(fakes)} devices on 127.0.0.1:{server.port}. "
+          f"Point the launchers at it with ANDROID_ADB_SERVER_PORT={server.port}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[INFO] Stopped.")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
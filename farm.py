@@ -0,0 +1,382 @@
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bootstrap
+import device
+import fridasetup
+import metrics
+
+SLOTS_PER_DEVICE = 1  # Jobs a device runs at the same time
+MAX_ATTEMPTS = 3      # Tries per job, on another device each time where possible
+MAX_FAILURES = 3      # Consecutive job failures before a device is taken out of rotation
+JOB_TIMEOUT = 60      # Seconds a frida job may run
+FRIDA_GRACE = 30      # Extra seconds for spawning and loading before a frida job is killed
+STOP_GRACE = 3        # Seconds frida gets to exit after SIGTERM
+OUTPUT_TAIL = 50      # Output lines kept per frida job
+
+# run(session) does the work on the chosen device and returns its result; raising fails the attempt.
+# serial pins the job to one device (e.g. a PID only means something on its own device);
+# attempts overrides the tries run_job/run_jobs were given.
+FarmJob = namedtuple("FarmJob", "name run serial attempts", defaults=(None, None))
+JobResult = namedtuple("JobResult", "name status serial attempts value error seconds")  # done, failed or cancelled
+FridaOutput = namedtuple("FridaOutput", "exit_code found tail")
+
+class JobCancelled(Exception):
+    """The farm was cancelled while the job ran."""
+
+class JobFailed(RuntimeError):
+    """A frida job ran but did not pass; output is its FridaOutput."""
+
+    def __init__(self, message, output):
+        super().__init__(message)
+        self.output = output
+
+class DeviceState:
+    """Health and load of one farm device."""
+
+    def __init__(self, serial, session):
+        self.serial = serial
+        self.session = session
+        self.healthy = False       # Attached and frida-server listening
+        self.active = 0            # Jobs running right now
+        self.completed = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.server_version = None
+
+class DeviceFarm:
+    """
+    Every attached device or emulator as one pool. bootstrap() prepares
+    all of them concurrently with the fridasetup step graph, run_jobs()
+    hands each job to the least loaded healthy device and retries a failed
+    job on a device it has not failed on yet (the same one once every
+    device has been tried). A device that keeps failing jobs is taken out
+    of rotation until check_health() finds it working. cancel() stops
+    handing out jobs; waiting and later jobs end up "cancelled".
+    """
+
+    def __init__(self, client=None, session_factory=None, slots=SLOTS_PER_DEVICE):
+        self.client = client or device.AdbClient()
+        self.session_factory = session_factory or (lambda serial: device.get_session(serial, self.client))
+        self.slots = slots
+        self.devices = {}  # serial -> DeviceState
+        self.condition = threading.Condition()
+        self.cancelled = threading.Event()
+
+    def discover(self):
+        """Pick up attached devices and drop vanished ones. Returns the serials in the farm."""
+        attached = {info.serial for info in self.client.devices() if info.state == "device"}
+        with self.condition:
+            for serial in attached - set(self.devices):
+                self.devices[serial] = DeviceState(serial, self.session_factory(serial))
+            for serial in set(self.devices) - attached:
+                print(f"[INFO] [{serial}] Device is gone; removing it from the farm.")
+                self.devices[serial].healthy = False
+                del self.devices[serial]
+            self.condition.notify_all()
+            return sorted(self.devices)
+
+    def _each_device(self, function):
+        with self.condition:
+            states = list(self.devices.values())
+        if not states:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(states)) as pool:
+            return dict(zip((state.serial for state in states), pool.map(function, states)))
+
+    def bootstrap(self, proxy_port=None):
+        """
+        Run the fridasetup steps on every device at once. The local frida
+        version is checked once and shared. Returns {serial: {step: StepResult}}.
+        """
+        frida_version = fridasetup.check_frida_version()
+
+        def setup(state):
+            steps = fridasetup.setup_steps(state.session, proxy_port, frida_version)
+            results = bootstrap.run_steps(steps, label=state.serial)
+            server = results["frida_server"]
+            with self.condition:
+                state.healthy = server.status in ("done", "skipped")
+                state.consecutive_failures = 0
+                state.server_version = results["server_version"].value
+                state.last_error = None if state.healthy else (server.error or "frida-server not started")
+                self.condition.notify_all()
+            return results
+
+        with metrics.timer("farm_bootstrap_seconds"):
+            return self._each_device(setup)
+
+    def check_health(self):
+        """Recheck every device (attached, frida-server listening). Returns {serial: healthy}."""
+        def check(state):
+            try:
+                healthy = state.session.state() == "device" and bool(fridasetup.frida_server_ready(state.session))
+                error = None if healthy else "frida-server not listening"
+            except device.AdbError as e:
+                healthy, error = False, e
+            with self.condition:
+                state.healthy = healthy
+                state.last_error = error
+                if healthy:
+                    state.consecutive_failures = 0
+                self.condition.notify_all()
+            metrics.count("farm_health_checks_total", healthy=str(healthy).lower())
+            return healthy
+
+        return self._each_device(check)
+
+    def cancel(self):
+        """Stop handing out jobs and wake everything waiting for a device."""
+        self.cancelled.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    def _acquire(self, tried, serial=None):
+        """
+        Wait for a free slot on a healthy device (serial only, if given),
+        preferring devices not in tried. None once no device is usable or
+        the farm is cancelled.
+        """
+        with self.condition:
+            while True:
+                if self.cancelled.is_set():
+                    return None
+                usable = [state for state in self.devices.values()
+                          if state.healthy and serial in (None, state.serial)]
+                if not usable:
+                    return None
+                untried = [state for state in usable if state.serial not in tried]
+                free = [state for state in untried or usable if state.active < self.slots]
+                if free:
+                    state = min(free, key=lambda state: (state.active, state.completed + state.failed, state.serial))
+                    state.active += 1
+                    return state
+                self.condition.wait()
+
+    def _release(self, state, error=None, cancelled=False):
+        with self.condition:
+            state.active -= 1
+            self.condition.notify_all()
+            if cancelled:  # Not the device's fault; neither a success nor a failure
+                return
+            if error is None:
+                state.completed += 1
+                state.consecutive_failures = 0
+                return
+            state.failed += 1
+            state.last_error = error
+            if isinstance(error, JobFailed):
+                return  # The script or app misbehaved on a working device
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= MAX_FAILURES and state.healthy:
+                state.healthy = False
+                print(f"[ERROR] [{state.serial}] {state.consecutive_failures} failures in a row; "
+                      f"taking the device out of rotation.")
+
+    def run_job(self, job, attempts=MAX_ATTEMPTS):
+        """Run one FarmJob, moving to another device after each failure. Returns a JobResult."""
+        attempts = job.attempts or attempts
+        started = time.perf_counter()
+        tried = set()
+        error = None
+        serial = None
+        attempt = 0
+        while attempt < attempts:
+            state = self._acquire(tried, job.serial)
+            if state is None:
+                break
+            attempt += 1
+            serial = state.serial
+            try:
+                with metrics.timer("farm_job_seconds", serial=serial):
+                    value = job.run(state.session)
+            except Exception as e:
+                if self.cancelled.is_set():
+                    self._release(state, cancelled=True)
+                    metrics.count("farm_jobs_total", outcome="cancelled")
+                    return JobResult(job.name, "cancelled", serial, attempt, None, e, time.perf_counter() - started)
+                error = e
+                tried.add(serial)
+                self._release(state, e)
+                metrics.count("farm_jobs_total", outcome="retry" if attempt < attempts else "failed")
+                print(f"[ERROR] [{serial}] Job {job.name} failed (attempt {attempt}/{attempts}): {e}")
+                continue
+            self._release(state)
+            metrics.count("farm_jobs_total", outcome="done")
+            return JobResult(job.name, "done", serial, attempt, value, None, time.perf_counter() - started)
+        if self.cancelled.is_set():
+            metrics.count("farm_jobs_total", outcome="cancelled")
+            return JobResult(job.name, "cancelled", serial, attempt, None, error, time.perf_counter() - started)
+        if error is None:
+            error = device.AdbError(f"no healthy device {job.serial} available" if job.serial
+                                    else "no healthy device available")
+        return JobResult(job.name, "failed", serial, attempt, None, error, time.perf_counter() - started)
+
+    def run_jobs(self, jobs, attempts=MAX_ATTEMPTS, on_result=None):
+        """
+        Run FarmJobs spread over the healthy devices. on_result(index, JobResult)
+        is called as each job finishes. Returns JobResults in the order of jobs.
+        Ctrl-C cancels the farm, waits for the running jobs to stop and re-raises.
+        """
+        with self.condition:
+            workers = max(1, len(self.devices) * self.slots)
+
+        def run(index, job):
+            result = self.run_job(job, attempts)
+            if on_result is not None:
+                on_result(index, result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run, index, job) for index, job in enumerate(jobs)]
+            try:
+                return [future.result() for future in futures]
+            except KeyboardInterrupt:
+                self.cancel()  # Queued jobs come back "cancelled" at once; running ones stop
+                raise
+
+    def status(self):
+        """Print one line per device: health, load and the last error."""
+        with self.condition:
+            states = sorted(self.devices.values(), key=lambda state: state.serial)
+        for state in states:
+            health = "healthy" if state.healthy else "down"
+            line = (f"  - {state.serial:20} {health:8} server {state.server_version or '?':10} "
+                    f"active {state.active} done {state.completed} failed {state.failed}")
+            if state.last_error is not None:
+                line += f"  ({state.last_error})"
+            print(line)
+
+def frida_command(session, scripts, package=None, pid=None, timeout=JOB_TIMEOUT):
+    """
+    The frida CLI command line that spawns package (or attaches to pid) on
+    session's device, loads scripts and quits after timeout seconds.
+    A script named codeshare:author/name is fetched from Frida CodeShare.
+    """
+    command = ["frida", *session.frida_args().split()]
+    command += ["-f", package] if package else ["-p", str(pid)]
+    for script in scripts:
+        if script.startswith("codeshare:"):
+            command += ["--codeshare", script[len("codeshare:"):]]
+        else:
+            command += ["-l", script]
+    return command + ["-q", "-t", str(timeout)]
+
+def _stop(process):
+    process.terminate()
+    try:
+        process.wait(STOP_GRACE)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def frida_job(name, scripts, package=None, pid=None, timeout=JOB_TIMEOUT, expect=(), serial=None, cancelled=None):
+    """
+    A FarmJob running frida_command on whichever device picks it up.
+    With expect, the attempt succeeds as soon as every marker has shown up
+    in the output (frida is stopped early) and fails if any is missing;
+    without, it succeeds when frida exits with 0. Setting the cancelled
+    Event stops frida and raises JobCancelled. Returns a FridaOutput.
+    """
+    def run(session):
+        command = frida_command(session, scripts, package, pid, timeout)
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, errors="replace")
+        tail = deque(maxlen=OUTPUT_TAIL)
+        found = []
+        all_found = threading.Event()
+
+        def read():
+            # stderr is merged into stdout and drained here, so frida never blocks on a full pipe.
+            for line in process.stdout:
+                tail.append(line.rstrip("\n"))
+                for marker in expect:
+                    if marker not in found and marker in line:
+                        found.append(marker)
+                if expect and len(found) == len(expect):
+                    all_found.set()
+
+        reader = threading.Thread(target=read, name=f"frida-{name}", daemon=True)
+        reader.start()
+        deadline = time.monotonic() + timeout + FRIDA_GRACE
+        try:
+            while process.poll() is None:
+                if all_found.is_set():
+                    break
+                if cancelled is not None and cancelled.is_set():
+                    raise JobCancelled(f"{name} cancelled")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"frida did not exit within {timeout + FRIDA_GRACE} s")
+                all_found.wait(0.1)
+        finally:
+            if process.poll() is None:
+                _stop(process)
+            reader.join()
+        output = FridaOutput(process.returncode, found, list(tail))
+        missing = [marker for marker in expect if marker not in found]
+        if missing:
+            raise JobFailed(f"markers not seen: {', '.join(missing)}"
+                            + (f" (last output: {tail[-1]})" if tail else ""), output)
+        if not expect and process.returncode != 0:
+            raise JobFailed(tail[-1] if tail else f"frida exited with {process.returncode}", output)
+        return output
+
+    return FarmJob(name, run, serial)
+
+def main():
+    """Command line entry point: farm.py status|bootstrap|run --package P --script S [...]."""
+    parser = argparse.ArgumentParser(description="Set up and use every attached device as one pool.")
+    parser.add_argument("command", choices=["status", "bootstrap", "run"])
+    parser.add_argument("--package", action="append", default=[], help="package to spawn (run; repeatable)")
+    parser.add_argument("--script", action="append", default=[], help="Frida script to load (run; repeatable)")
+    parser.add_argument("--timeout", type=int, default=JOB_TIMEOUT, help="seconds each job runs")
+    parser.add_argument("--slots", type=int, default=SLOTS_PER_DEVICE, help="jobs per device at a time")
+    parser.add_argument("--proxy-port", type=int, help="also set up the reverse proxy (bootstrap)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.start("farm", args.metrics, args.profile)
+
+    farm = DeviceFarm(slots=args.slots)
+    try:
+        serials = farm.discover()
+    except device.AdbError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    if not serials:
+        print("[ERROR] No devices attached.")
+        sys.exit(1)
+    print(f"[INFO] {len(serials)} devices: {', '.join(serials)}")
+
+    if args.command == "status":
+        farm.check_health()
+    elif args.command == "bootstrap":
+        started = time.perf_counter()
+        farm.bootstrap(args.proxy_port)
+        print(f"[INFO] Bootstrapped {len(serials)} devices in {time.perf_counter() - started:.2f} s.")
+    else:
+        if not args.package or not args.script:
+            parser.error("run needs at least one --package and one --script")
+        farm.bootstrap()
+        jobs = [frida_job(package, args.script, package=package, timeout=args.timeout, cancelled=farm.cancelled)
+                for package in args.package]
+        try:
+            results = farm.run_jobs(jobs)
+        except KeyboardInterrupt:
+            print("[INFO] Cancelled.")
+            return
+        for result in results:
+            outcome = f"on {result.serial} after {result.attempts} attempts" if result.serial else "nowhere"
+            if result.status == "done":
+                print(f"[INFO] {result.name}: done {outcome} in {result.seconds:.2f} s.")
+            else:
+                print(f"[ERROR] {result.name}: failed {outcome}: {result.error}")
+    farm.status()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 import subprocess
 import os
+import time
 from pathlib import Path
 
+import bootstrap
+import device
+import metrics
+
 def bold(text):
     return f"\033[1m{text}\033[0m"
 
@@ -16,18 +21,28 @@ def colorize(text, color):
 
 def execute_command(command, shell=False):
     """Execute a command and return the result, with error handling."""
+    tool = (command.split() if isinstance(command, str) else command)[0]
     try:
-        result = subprocess.check_output(command, shell=shell).decode('utf-8').strip()
+        with metrics.timer("command_seconds", tool=tool):
+            result = subprocess.check_output(command, shell=shell).decode('utf-8').strip()
+        metrics.count("commands_total", tool=tool, outcome="ok")
         return result
     except subprocess.CalledProcessError as e:
+        metrics.count("commands_total", tool=tool, outcome="failed")
         print(f"[ERROR] Command failed: {e}")
         return e.output.decode('utf-8')  # Return the error output for better diagnostics
 
+SERVER_READY_TIMEOUT = 15  # Seconds frida-server gets to start listening
+
 def check_frida_version():
-    """Check the installed Frida version."""
-    print(f"[INFO] Executing: {colorize(bold('frida --version'), 'cyan')}")
-    frida_version = execute_command("frida --version", shell=True)
+    """Check the installed Frida version. Returns it, or None if frida is not installed."""
+    if device.frida is not None:
+        frida_version = device.frida.__version__
+    else:
+        print(f"[INFO] Executing: {colorize(bold('frida --version'), 'cyan')}")
+        frida_version = execute_command("frida --version", shell=True).strip() or None
     print(f"[INFO] Frida version: {frida_version}")
+    return frida_version
 
 def get_local_ip_address():
     """Retrieve the local machine IP address."""
@@ -36,56 +51,116 @@ def get_local_ip_address():
     print(f"[INFO] Local machine IP address: {ip_address}")
     return ip_address
 
-def setup_proxy(ip_address):
-    """Set up the reverse proxy for Frida communication."""
+def ask_proxy_port():
+    """Ask for the proxy port before the setup steps start."""
     print(f"[INFO] Enter Proxy Port (default 8080): ", end="")
-    proxy_port = input().strip() or "8080"
-    
+    return input().strip() or "8080"
+
+def setup_reverse_proxy(session, proxy_port):
+    """Set up the reverse proxy for Frida communication."""
     print(f"[INFO] Executing: {colorize(bold(f'adb reverse tcp:{proxy_port} tcp:{proxy_port}'), 'cyan')}")
-    execute_command(f"adb reverse tcp:{proxy_port} tcp:{proxy_port}", shell=True)
+    session.reverse(f"tcp:{proxy_port}", f"tcp:{proxy_port}")
     print(f"[INFO] Reverse proxy set up on port {proxy_port}.")
 
+def set_http_proxy(session, ip_address, proxy_port):
+    """Point the device's global HTTP proxy at this machine."""
     # Only set the local IP (filter out public IP)
-    print(f"[INFO] Executing: {colorize(bold(f'adb shell settings put global http_proxy {ip_address}:{proxy_port}'), 'cyan')}")
-    execute_command(f"adb shell settings put global http_proxy {ip_address}:{proxy_port}", shell=True)
+    print(f"[INFO] Executing: {colorize(bold(f'settings put global http_proxy {ip_address}:{proxy_port}'), 'cyan')}")
+    session.shell(f"settings put global http_proxy {ip_address}:{proxy_port}")
     print(f"[INFO] HTTP proxy set to {ip_address}:{proxy_port}.")
 
-def start_frida_server():
-    """Start Frida server on the emulator."""
-    print(f"[INFO] Executing: {colorize(bold('adb root'), 'cyan')}")
-    execute_command("adb root", shell=True)
+def frida_server_ready(session):
+    """PIDs of a frida-server that is listening on its port, or an empty list."""
+    if device.FRIDA_PORT not in session.listening_ports():
+        return []
+    return session.frida_server_pids()
 
-    print(f"[INFO] Executing: {colorize(bold('adb shell pkill frida-server'), 'cyan')}")
-    execute_command("adb shell pkill frida-server", shell=True)
+def start_frida_server(session, frida_version=None, server_version=None):
+    """(Re)start Frida server on the emulator and wait until it listens. Returns its PIDs."""
+    if frida_version and server_version and frida_version != server_version:
+        print(f"[ERROR] frida-server {server_version} on the device does not match frida {frida_version}; "
+              f"push a matching build to {device.FRIDA_SERVER_PATH}.")
+    print(f"[INFO] Executing: {colorize(bold('pkill frida-server'), 'cyan')}")
+    session.kill("frida-server")
 
     print(f"[INFO] Starting Frida server...")
-    command = "adb shell /data/local/tmp/frida-server &"
-    print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
-    
-    # Run the Frida server command in the background using subprocess.Popen
-    subprocess.Popen(command, shell=True)
-
-    print(f"[INFO] Frida server should now be running in the background.")
-
-def display_frida_server_details():
-    """Display Frida server session details."""
+    print(f"[INFO] Executing: {colorize(bold(device.FRIDA_SERVER_PATH + ' &'), 'cyan')}")
+    session.start_frida_server()
+
+    # Poll the server's port with backoff instead of assuming it is up.
+    pids = bootstrap.wait_until(lambda: frida_server_ready(session), SERVER_READY_TIMEOUT)
+    print(f"[INFO] Frida server is listening on port {device.FRIDA_PORT}.")
+    return pids
+
+def setup_steps(session, proxy_port=None, frida_version=None):
+    """
+    The Frida setup as a bootstrap graph. Local checks run next to the
+    device steps; every device step waits for adb root (restarting adbd
+    drops reverse rules and shells) and is skipped when its result is
+    already in place, e.g. a matching frida-server that is listening.
+    Without proxy_port the proxy steps are left out; a known frida_version
+    skips the local version check (the farm checks it once for all devices).
+    """
+    def rooted(values):
+        return "already root" if session.shell("id -u").output.strip() == "0" else None
+
+    def reverse_in_place(values):
+        return True if (f"tcp:{proxy_port}", f"tcp:{proxy_port}") in session.reverse_list() else None
+
+    def proxy_in_place(values):
+        wanted = f"{values['local_ip']}:{proxy_port}"
+        return True if session.shell("settings get global http_proxy").output.strip() == wanted else None
+
+    def server_in_place(values):
+        local, remote = values["frida_version"], values["server_version"]
+        if local and local != remote:
+            return None
+        return frida_server_ready(session) or None
+
+    def server_version(values):
+        version = session.frida_server_version()
+        if version is None:
+            raise device.AdbError(f"no frida-server binary at {device.FRIDA_SERVER_PATH}")
+        return version
+
+    Step = bootstrap.Step
+    steps = [
+        Step("frida_version", lambda values: frida_version or check_frida_version()),
+        Step("adb_root", lambda values: session.root(), check=rooted),
+        Step("server_version", server_version, ("adb_root",)),
+        Step("frida_server", lambda values: start_frida_server(session, values["frida_version"],
+                                                               values["server_version"]),
+             ("adb_root", "frida_version", "server_version"), server_in_place),
+    ]
+    if proxy_port:
+        steps += [
+            Step("local_ip", lambda values: get_local_ip_address()),
+            Step("reverse_proxy", lambda values: setup_reverse_proxy(session, proxy_port), ("adb_root",),
+                 reverse_in_place),
+            Step("http_proxy", lambda values: set_http_proxy(session, values["local_ip"], proxy_port),
+                 ("local_ip", "adb_root"), proxy_in_place),
+        ]
+    return steps
+
+def display_frida_server_details(results):
+    """Display Frida server session details from the setup step results."""
     print("\n=======================================================")
     print(bold("Frida Server Details"))
     print("=======================================================")
-    
-    # Displaying Frida version on server
-    print(f"[INFO] Executing: {colorize(bold('adb shell ls /data/local/tmp/frida-server'), 'cyan')}")
-    frida_server_location = execute_command("adb shell ls /data/local/tmp/frida-server", shell=True)
-    print(f"[INFO] Frida server binary found at: /data/local/tmp/frida-server")
-
-    print(f"[INFO] Executing: {colorize(bold('adb shell /data/local/tmp/frida-server --version'), 'cyan')}")
-    frida_server_version = execute_command("adb shell /data/local/tmp/frida-server --version", shell=True)
-    print(f"[INFO] Frida server version: {frida_server_version}")
-
-    print(f"[INFO] Executing: {colorize(bold('adb shell ps | grep frida-server'), 'cyan')}")
-    frida_server_pid = execute_command("adb shell ps | grep frida-server", shell=True)
-    print(f"[INFO] Frida server is running with PID: {frida_server_pid.split()[1]}")
-    
+
+    server_version = results["server_version"]
+    if server_version.status in ("done", "skipped"):
+        print(f"[INFO] Frida server binary found at: {device.FRIDA_SERVER_PATH}")
+        print(f"[INFO] Frida server version: {server_version.value}")
+    else:
+        print(f"[ERROR] Frida server binary not found at: {device.FRIDA_SERVER_PATH}")
+
+    server = results["frida_server"]
+    if server.status in ("done", "skipped"):
+        print(f"[INFO] Frida server is running with PID: {', '.join(map(str, server.value))}")
+    else:
+        print("[ERROR] Frida server is not running.")
+
     print("=======================================================")
 
 def show_main_menu():
@@ -129,39 +204,39 @@ def inject_app_with_pid():
 
 def list_running_apps(show_system_apps=False):
     """List all running apps on the emulator, with an option to exclude system apps."""
-    command = "frida-ps -Uia"
-    output = execute_command(command, shell=True)
-    apps = []
-    
-    if not output:
-        print("[ERROR] No apps found.")
-        return apps
-    
+    try:
+        found = device.get_session().applications()
+    except device.AdbError as e:
+        print(f"[ERROR] No apps found ({e}).")
+        return []
+
     print(f"[INFO] Running apps:")
-    for line in output.splitlines():
-        if "com.android" not in line and "com.google.android" not in line:
-            apps.append(line)
-            print(line)
-    
+    apps = []
+    for app in found:
+        if show_system_apps or not app.identifier.startswith(("com.android", "com.google.android")):
+            apps.append(app)
+            print(f"{app.pid or '-':>6}  {app.name:30}  {app.identifier}")
     return apps
 
 def main():
     """Main function to coordinate the Frida setup and script execution."""
-    
-    # Step 1: Check Frida version
-    check_frida_version()
-    
-    # Step 2: Get the local IP address
-    ip_address = get_local_ip_address()
-    
-    # Step 3: Set up reverse proxy
-    setup_proxy(ip_address)
-    
-    # Step 4: Start Frida server in the background
-    start_frida_server()
+    metrics.start("fridasetup")  # Off unless SASHA_METRICS or SASHA_PROFILE is set
+
+    # Step 1: Ask for everything interactive up front
+    proxy_port = ask_proxy_port()
+    try:
+        session = device.get_session()
+    except device.AdbError as e:
+        print(f"[ERROR] {e}")
+        return
+
+    # Steps 2-4: Version check, proxy and Frida server, independent steps in parallel
+    started = time.perf_counter()
+    results = bootstrap.run_steps(setup_steps(session, proxy_port))
+    bootstrap.report(results, time.perf_counter() - started)
 
     # Step 5: Display Frida server details
-    display_frida_server_details()
+    display_frida_server_details(results)
 
     # Step 6: Show the main menu
     show_main_menu()
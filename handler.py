@@ -1,42 +1,134 @@
 import os
 import shutil
 import hashlib
+from collections import defaultdict
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import hashcache
+import metrics
+import neardup
+import objstore
+
+MB = 1024 * 1024
+HASH_CHUNK_SIZE = 1 * MB         # Read buffer for full-file hashing
+PARTIAL_BLOCK_SIZE = 64 * 1024  # Size of the head/tail blocks for partial hashing
 
 # Helper functions...
 
 def setup_directories(base_dir="scripts"):
     """Set up the directory structure for organizing scripts."""
-    subdirs = ["raw", "backup", "organized", "dupe"]
+    subdirs = ["raw", "backup", "organized", "dupe", "objects"]
     for subdir in subdirs:
         os.makedirs(os.path.join(base_dir, subdir), exist_ok=True)
     print("[INFO] Directory structure set up.")
 
-def calculate_file_hash(file_path):
+@metrics.timed("file_hash_seconds")
+def calculate_file_hash(file_path, chunk_size=None):
     """Calculate the SHA256 hash of a file."""
+    chunk_size = chunk_size or HASH_CHUNK_SIZE
     hash_sha256 = hashlib.sha256()
+    read = 0
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
+        for chunk in iter(lambda: f.read(chunk_size), b""):
             hash_sha256.update(chunk)
+            read += len(chunk)
+    metrics.count("hashed_bytes_total", read)
     return hash_sha256.hexdigest()
 
-def handle_duplicates(raw_dir="scripts/raw", dupe_dir="scripts/dupe"):
+@metrics.timed("partial_hash_seconds")
+def calculate_partial_hash(file_path, size, block_size=PARTIAL_BLOCK_SIZE):
+    """
+    Hash the first and last block of a file.
+    Files no larger than two blocks are hashed in full, so for them the
+    result is the same SHA256 that calculate_file_hash would return.
+    """
+    if size <= 2 * block_size:
+        return calculate_file_hash(file_path)
+    hash_sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        hash_sha256.update(f.read(block_size))
+        f.seek(size - block_size)
+        hash_sha256.update(f.read(block_size))
+    return hash_sha256.hexdigest()
+
+def hash_files_parallel(paths, workers=None):
+    """Fully hash a list of files across a process pool. Returns {path: hash}."""
+    if len(paths) < 2 or workers == 1:
+        return {path: calculate_file_hash(path) for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(calculate_file_hash, paths, chunksize=8)))
+
+def find_duplicates(paths, workers=None):
+    """
+    Find byte-identical files using tiered comparison:
+    size, then a hash of the first and last blocks, then a full hash
+    only for files that still collide.
+    Returns (hashes, stats) where hashes maps every path that needed a
+    full comparison to its SHA256. Paths missing from hashes are unique.
+    """
+    stats = {"files": len(paths), "unique_size": 0, "unique_partial": 0,
+             "full_hashed": 0, "bytes_total": 0, "bytes_full": 0}
+
+    by_size = defaultdict(list)
+    for path in paths:
+        size = os.path.getsize(path)
+        by_size[size].append(path)
+        stats["bytes_total"] += size
+
+    hashes = {}
+    needs_full = []
+    for size, group in by_size.items():
+        if len(group) == 1:
+            stats["unique_size"] += 1
+            continue
+        by_partial = defaultdict(list)
+        for path in group:
+            by_partial[calculate_partial_hash(path, size)].append(path)
+        for partial_digest, candidates in by_partial.items():
+            if len(candidates) == 1:
+                stats["unique_partial"] += 1
+            elif size <= 2 * PARTIAL_BLOCK_SIZE:
+                # The partial hash already covered the whole file.
+                for path in candidates:
+                    hashes[path] = partial_digest
+            else:
+                needs_full.extend(candidates)
+                stats["full_hashed"] += len(candidates)
+                stats["bytes_full"] += size * len(candidates)
+
+    hashes.update(hash_files_parallel(needs_full, workers=workers))
+    return hashes, stats
+
+def handle_duplicates(raw_dir="scripts/raw", dupe_dir="scripts/dupe", workers=None):
     """Identify and handle duplicate scripts."""
     os.makedirs(dupe_dir, exist_ok=True)
     hashes = {}
     duplicates = []
 
-    for script in os.listdir(raw_dir):
-        if script.endswith(".js"):
-            script_path = os.path.join(raw_dir, script)
-            file_hash = calculate_file_hash(script_path)
+    scripts = [script for script in os.listdir(raw_dir) if script.endswith(".js")]
+    paths = [os.path.join(raw_dir, script) for script in scripts]
+    file_hashes, stats = find_duplicates(paths, workers=workers)
+
+    for script, script_path in zip(scripts, paths):
+        file_hash = file_hashes.get(script_path)
+        if file_hash is None:
+            continue
 
-            if file_hash in hashes:
-                duplicates.append((script, hashes[file_hash]))
-                dest_path = os.path.join(dupe_dir, script)
+        if file_hash in hashes:
+            duplicates.append((script, hashes[file_hash]))
+            dest_path = os.path.join(dupe_dir, script)
+            with metrics.timer("file_copy_seconds", op="move"):
                 shutil.move(script_path, dest_path)
-                print(f"[INFO] Moved duplicate script {script} to {dupe_dir}.")
-            else:
-                hashes[file_hash] = script
+            print(f"[INFO] Moved duplicate script {script} to {dupe_dir}.")
+        else:
+            hashes[file_hash] = script
+
+    print(f"[INFO] Dedup tiers: {stats['files']} files, "
+          f"{stats['unique_size']} ruled out by size, "
+          f"{stats['unique_partial']} by partial hash, "
+          f"{stats['full_hashed']} fully hashed "
+          f"({stats['bytes_full'] / MB:.1f} of {stats['bytes_total'] / MB:.1f} MB read in full).")
 
     if duplicates:
         print("[INFO] Duplicate scripts detected and moved:")
@@ -45,61 +137,142 @@ def handle_duplicates(raw_dir="scripts/raw", dupe_dir="scripts/dupe"):
     else:
         print("[INFO] No duplicate scripts found.")
 
-def backup_script(script, source_dir="scripts/raw", backup_dir="scripts/backup"):
-    """Backup the script to the backup directory."""
+def backup_script(script, source_dir="scripts/raw", backup_dir="scripts/backup",
+                  file_hash=None, objects_dir="scripts/objects"):
+    """
+    Backup the script to the backup directory.
+    When file_hash is given the backup is linked to the stored blob instead of copied.
+    """
     os.makedirs(backup_dir, exist_ok=True)
     source_path = os.path.join(source_dir, script)
     backup_path = os.path.join(backup_dir, script)
-    shutil.copy2(source_path, backup_path)
+    if file_hash:
+        objstore.link_blob(file_hash, backup_path, objects_dir)
+    else:
+        with metrics.timer("file_copy_seconds", op="copy2"):
+            shutil.copy2(source_path, backup_path)
     print(f"[INFO] Backed up {script} to {backup_dir}.")
 
-def clean_script(script, source_dir="scripts/raw", organized_dir="scripts/organized"):
-    """Clean the script and organize based on tags."""
+def clean_script(script, source_dir="scripts/raw", organized_dir="scripts/organized",
+                 file_hash=None, objects_dir="scripts/objects"):
+    """
+    Clean the script and organize based on tags. Returns the organized path, or None on failure.
+    When file_hash is given the organized copy is linked to the stored blob instead of copied.
+    """
     os.makedirs(organized_dir, exist_ok=True)
     source_path = os.path.join(source_dir, script)
 
-    try:
-        with open(source_path, "r") as f:
-            content = f.read()
-    except Exception as e:
-        print(f"[ERROR] Failed to read {script}: {e}")
+    # With file_hash the content is already stored; only a plain copy needs the source.
+    if not file_hash and not os.path.isfile(source_path):
+        print(f"[ERROR] Failed to read {script}: no such file")
         return
 
     dest_dir = os.path.join(organized_dir, "general")
     os.makedirs(dest_dir, exist_ok=True)
     dest_path = os.path.join(dest_dir, script)
-    shutil.copy2(source_path, dest_path)
+    if file_hash:
+        objstore.link_blob(file_hash, dest_path, objects_dir)
+    else:
+        with metrics.timer("file_copy_seconds", op="copy2"):
+            shutil.copy2(source_path, dest_path)
     print(f"[INFO] Organized {script} into {dest_dir}.")
+    return dest_path
 
-def process_scripts(base_dir="scripts"):
-    """Process all scripts in the raw directory."""
+def process_scripts(base_dir="scripts", workers=None, near_threshold=None):
+    """
+    Process all new or changed scripts in the raw directory.
+    When near_threshold is set, near-duplicate forks in raw are clustered
+    and moved to dupe first (see neardup.py).
+    """
     raw_dir = os.path.join(base_dir, "raw")
     backup_dir = os.path.join(base_dir, "backup")
     organized_dir = os.path.join(base_dir, "organized")
     dupe_dir = os.path.join(base_dir, "dupe")
+    objects_dir = os.path.join(base_dir, "objects")
 
     print(f"[DEBUG] Raw directory: {raw_dir}")
     print(f"[DEBUG] Backup directory: {backup_dir}")
     print(f"[DEBUG] Organized directory: {organized_dir}")
     print(f"[DEBUG] Dupe directory: {dupe_dir}")
+    print(f"[DEBUG] Objects directory: {objects_dir}")
 
-    # Step 1: Handle duplicates
-    print("[DEBUG] Handling duplicates...")
-    handle_duplicates(raw_dir, dupe_dir)
+    cache = hashcache.open_hash_cache(os.path.join(base_dir, "hashcache.db"))
+    if near_threshold:
+        print("[DEBUG] Clustering near-duplicates...")
+        neardup.handle_near_duplicates(raw_dir, dupe_dir, threshold=near_threshold, workers=workers, cache=cache)
+
+    # Step 1: Bring the hash cache up to date (stat only for unchanged files)
+    print("[DEBUG] Scanning script store...")
+    store = hashcache.scan_store(
+        cache, partial(hash_files_parallel, workers=workers), base_dir=base_dir)
+
+    # Index everything that has already left raw by content hash
+    stored = defaultdict(set)
+    for rel_path, (file_hash, placement) in store.items():
+        if placement != "raw":
+            stored[file_hash].add(os.path.basename(rel_path))
 
-    # Step 2: Proceed with backup and cleaning
     print("[DEBUG] Checking for scripts in raw directory...")
     scripts = [f for f in os.listdir(raw_dir) if f.endswith(".js")]
-    print(f"[DEBUG] Found {len(scripts)} scripts in raw directory: {scripts}")
+    print(f"[DEBUG] Found {len(scripts)} scripts in raw directory.")
     if not scripts:
         print("[INFO] No scripts found in the raw directory.")
+        cache.close()
         return
 
+    # Step 2: Handle duplicates across raw and the rest of the store
+    print("[DEBUG] Handling duplicates...")
+    os.makedirs(dupe_dir, exist_ok=True)
+    hashes = {}
+    duplicates = []
+    unchanged = 0
     for script in scripts:
-        print(f"[DEBUG] Processing script: {script}")
-        backup_script(script, source_dir=raw_dir, backup_dir=backup_dir)
-        clean_script(script, source_dir=raw_dir, organized_dir=organized_dir)
+        rel_path = os.path.join("raw", script)
+        file_hash = store[rel_path][0]
+
+        if file_hash in hashes:
+            original = hashes[file_hash]
+        elif script in stored[file_hash]:
+            # Already backed up and organized with this exact content.
+            hashes[file_hash] = script
+            unchanged += 1
+            continue
+        elif stored[file_hash]:
+            original = sorted(stored[file_hash])[0]
+        else:
+            hashes[file_hash] = script
+            # Step 3: Proceed with backup and cleaning
+            print(f"[DEBUG] Processing script: {script}")
+            objstore.store_blob(os.path.join(raw_dir, script), file_hash, objects_dir)
+            backup_script(script, source_dir=raw_dir, backup_dir=backup_dir,
+                          file_hash=file_hash, objects_dir=objects_dir)
+            hashcache.record_file(cache, base_dir, os.path.join("backup", script), file_hash, "backup")
+            if clean_script(script, source_dir=raw_dir, organized_dir=organized_dir,
+                            file_hash=file_hash, objects_dir=objects_dir):
+                hashcache.record_file(cache, base_dir, os.path.join("organized", "general", script),
+                                      file_hash, "organized")
+            continue
+
+        duplicates.append((script, original))
+        with metrics.timer("file_copy_seconds", op="move"):
+            shutil.move(os.path.join(raw_dir, script), os.path.join(dupe_dir, script))
+        hashcache.forget_file(cache, rel_path)
+        hashcache.record_file(cache, base_dir, os.path.join("dupe", script), file_hash, "dupe")
+        print(f"[INFO] Moved duplicate script {script} to {dupe_dir}.")
+
+    with metrics.timer("db_commit_seconds", db="hashcache"):
+        cache.commit()
+    cache.close()
+
+    if duplicates:
+        print("[INFO] Duplicate scripts detected and moved:")
+        for dup, original in duplicates:
+            print(f"  - Duplicate: {dup}, Original: {original}")
+    else:
+        print("[INFO] No duplicate scripts found.")
+    print(f"[INFO] {unchanged} scripts unchanged since the last run.")
 
 if __name__ == "__main__":
+    metrics.start("handler")  # Off unless SASHA_METRICS or SASHA_PROFILE is set
     setup_directories()  # Ensure directories exist
     process_scripts()    # Run the main processing
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+
+import metrics
+
+STORE_DIRS = ["raw", "backup", "organized", "dupe"]
+
+def open_hash_cache(db_path="scripts/hashcache.db"):
+    """Open (and create if needed) the on-disk hash/metadata cache."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS FileHashes (
+        path TEXT PRIMARY KEY,
+        inode INTEGER,
+        size INTEGER,
+        mtime_ns INTEGER,
+        sha256 TEXT,
+        placement TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_filehashes_sha256 ON FileHashes(sha256)")
+    # Near-duplicate fingerprints by content (see neardup.py); signature is a JSON list
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS Fingerprints (
+        sha256 TEXT PRIMARY KEY,
+        normalized TEXT,
+        signature TEXT
+    )
+    """)
+    conn.commit()
+    return conn
+
+def _walk_js(directory):
+    """Yield DirEntry objects for every .js file under directory."""
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk_js(entry.path)
+        elif entry.name.endswith(".js") and entry.is_file(follow_symlinks=False):
+            yield entry
+
+def stat_store(conn, base_dir="scripts"):
+    """
+    stat() every script under base_dir and compare it with the cache.
+    Returns (store, stale): store maps the store-relative path of every file
+    whose (path, inode, size, mtime_ns) key is unchanged to a
+    (sha256, placement) tuple; stale maps the rest to a
+    (full_path, key, placement) tuple. Vanished files are dropped from the cache.
+    """
+    cached = {row[0]: row[1:] for row in conn.execute(
+        "SELECT path, inode, size, mtime_ns, sha256, placement FROM FileHashes")}
+
+    prefix_len = len(os.path.join(base_dir, ""))
+    store = {}
+    stale = {}
+    for placement in STORE_DIRS:
+        for entry in _walk_js(os.path.join(base_dir, placement)):
+            rel_path = entry.path[prefix_len:]
+            st = entry.stat(follow_symlinks=False)
+            key = (entry.inode(), st.st_size, st.st_mtime_ns)
+            row = cached.get(rel_path)
+            if row is not None and row[:3] == key and row[4] == placement:
+                store[rel_path] = (row[3], placement)
+            else:
+                stale[rel_path] = (entry.path, key, placement)
+
+    vanished = [(path,) for path in cached if path not in store and path not in stale]
+    if vanished:
+        conn.executemany("DELETE FROM FileHashes WHERE path = ?", vanished)
+        conn.commit()
+    return store, stale
+
+def scan_store(conn, hash_files, base_dir="scripts"):
+    """
+    Bring the cache up to date with every script under base_dir.
+    Files whose (path, inode, size, mtime_ns) key is unchanged are only
+    stat()ed; new or modified files are hashed with hash_files, which takes
+    a list of paths and returns {path: sha256}. Returns a dict mapping the
+    store-relative path to a (sha256, placement) tuple.
+    """
+    store, stale = stat_store(conn, base_dir)
+
+    if stale:
+        print(f"[INFO] Hashing {len(stale)} new or changed scripts...")
+        full_paths = [item[0] for item in stale.values()]
+        hashes = hash_files(full_paths)
+        rows = []
+        for rel_path, (full_path, key, placement) in stale.items():
+            sha256 = hashes[full_path]
+            store[rel_path] = (sha256, placement)
+            rows.append((rel_path, *key, sha256, placement))
+        with metrics.timer("db_write_seconds", db="hashcache"):
+            conn.executemany("INSERT OR REPLACE INTO FileHashes VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+    return store
+
+def cached_hashes(conn, base_dir, directory):
+    """
+    Return {full_path: sha256} for the scripts directly in directory whose
+    (path, inode, size, mtime_ns) key still matches the cache. Only that
+    directory is stat()ed; nothing is read or hashed.
+    """
+    rel_dir = os.path.join(os.path.relpath(directory, base_dir), "")
+    cached = {row[0]: row[1:] for row in conn.execute(
+        "SELECT path, inode, size, mtime_ns, sha256 FROM FileHashes WHERE substr(path, 1, ?) = ?",
+        (len(rel_dir), rel_dir))}
+
+    known = {}
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".js") or not entry.is_file(follow_symlinks=False):
+            continue
+        row = cached.get(rel_dir + entry.name)
+        if row is None:
+            continue
+        st = entry.stat(follow_symlinks=False)
+        if row[:3] == (entry.inode(), st.st_size, st.st_mtime_ns):
+            known[entry.path] = row[3]
+    return known
+
+def record_file(conn, base_dir, rel_path, sha256, placement):
+    """Record a file whose hash is already known, without reading it."""
+    st = os.stat(os.path.join(base_dir, rel_path))
+    conn.execute("INSERT OR REPLACE INTO FileHashes VALUES (?, ?, ?, ?, ?, ?)",
+                 (rel_path, st.st_ino, st.st_size, st.st_mtime_ns, sha256, placement))
+
+def forget_file(conn, rel_path):
+    """Drop a file that has been moved or deleted from the cache."""
+    conn.execute("DELETE FROM FileHashes WHERE path = ?", (rel_path,))
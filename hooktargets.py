@@ -0,0 +1,176 @@
+import re
+import sys
+
+EXTRACTOR_VERSION = 1  # Bump when extraction changes so stored targets are rebuilt
+TOKEN_BATCH = 1024 * 1024  # Characters buffered before a large script is tokenized
+TOKEN_TAIL = 4096      # Characters kept back between batches so no token is cut in half
+LOOKAHEAD = 12         # Tokens a pattern may look ahead
+LOOKBACK = 2           # Tokens a pattern may look back
+
+# The tokens of neardup.TOKEN_RE as (comment, token) groups, so findall()
+# tokenizes a whole batch without a Python-level loop.
+TOKEN_RE = re.compile(r"""
+    ( //[^\n]*|/\*.*?(?:\*/|\Z) )
+  | ( "(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?|`(?:\\.|[^`\\])*`?
+    | [A-Za-z_$][\w$]*|\d[\w.]*
+    | \S )
+""", re.VERBOSE | re.DOTALL)
+
+# Scripts without any of these cannot contain a hook target.
+TRIGGER_RE = re.compile(r"Java|ObjC|ExportByName")
+HOOK_PROPERTIES = {"implementation", "overload", "overloads"}
+EXPORT_LOOKUPS = {"findExportByName", "getExportByName"}
+MODULE_LOOKUPS = {"findModuleByName", "getModuleByName"}
+START_WORDS = {"Java", "ObjC", "Module", "Process"}
+IDENTIFIER_RE = re.compile(r"[A-Za-z_$][\w$]*\Z")
+
+def _string(token):
+    """Return the value of a string literal token, or None if it is not one."""
+    if len(token) >= 2 and token[0] in "\"'`" and token[-1] == token[0]:
+        return token[1:-1]
+    return None
+
+class TargetExtractor:
+    """
+    Pull hook targets out of a script fed as text pieces.
+    Targets are (kind, target, member) tuples:
+      ("java", class, method)      Java.use("cls") and cls.method.implementation/overload
+      ("objc", class, selector)    ObjC.classes.Cls and Cls["- selector"]
+      ("native", module, symbol)   Module.findExportByName/getExportByName lookups
+    member is "" for the class itself and module is "" when any module is searched.
+    Variables bound to Java.use()/ObjC.classes results are followed, so
+    var Pinner = Java.use("..."); Pinner.check.overload(...) records check.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.tokens = []
+        self.position = 0
+        self.bindings = {}  # variable name -> (kind, class)
+        self.targets = set()
+        self.active = False
+
+    def feed(self, text):
+        """
+        Add the next piece of the script. Large scripts are tokenized in
+        batches, holding back a short tail that may end in a partial token.
+        """
+        self.buffer += text
+        if len(self.buffer) > TOKEN_BATCH + TOKEN_TAIL:
+            self._tokenize(len(self.buffer) - TOKEN_TAIL)
+
+    def result(self):
+        """Finish the script and return the sorted list of targets."""
+        self._tokenize(None)
+        return sorted(self.targets)
+
+    def _tokenize(self, limit):
+        if not self.active:
+            self.active = TRIGGER_RE.search(self.buffer) is not None
+            if not self.active and limit is None:
+                return  # Nothing in this script can match; skip tokenizing it
+        text = self.buffer if limit is None else self.buffer[:limit]
+        pieces = TOKEN_RE.findall(text)
+        self.buffer = self.buffer[len(text):]
+        if limit is not None and pieces and text.endswith(pieces[-1][0] or pieces[-1][1]):
+            # The last token reaches the cut and may continue past it; retry it next batch.
+            comment, token = pieces.pop()
+            self.buffer = text[len(text) - len(comment or token):] + self.buffer
+        self.tokens.extend(token for _, token in pieces if token)
+        if self.active:
+            self._match(final=limit is None)
+        else:
+            self.position = len(self.tokens)
+        # Keep only what the next patterns can still look back at.
+        drop = max(0, self.position - LOOKBACK)
+        del self.tokens[:drop]
+        self.position -= drop
+
+    def _match(self, final):
+        tokens = self.tokens
+        bindings = self.bindings
+        end = len(tokens) if final else len(tokens) - LOOKAHEAD
+        for i in range(self.position, end):
+            word = tokens[i]
+            if word in START_WORDS or word in bindings:
+                self._match_at(i)
+        self.position = max(self.position, end)
+
+    def _token(self, index):
+        return self.tokens[index] if 0 <= index < len(self.tokens) else ""
+
+    def _member(self, index, kind):
+        """Return the hooked member accessed at tokens[index:], if any."""
+        t = self._token
+        if t(index) == "." and IDENTIFIER_RE.match(t(index + 1)):
+            name, after = t(index + 1), index + 2
+        elif t(index) == "[" and _string(t(index + 1)) is not None and t(index + 2) == "]":
+            name, after = _string(t(index + 1)), index + 3
+        else:
+            return None
+        if kind == "objc":
+            # Selectors are looked up as strings; property access is class API.
+            return name if t(index) == "[" else None
+        if t(after) == "." and t(after + 1) in HOOK_PROPERTIES:
+            return name
+        return None
+
+    def _add_class(self, kind, cls, start, after):
+        """Record a class, its binding to a variable and a chained member."""
+        t = self._token
+        self.targets.add((kind, cls, ""))
+        if t(start - 1) == "=" and IDENTIFIER_RE.match(t(start - 2)):
+            self.bindings[t(start - 2)] = (kind, cls)
+        member = self._member(after, kind)
+        if member is not None:
+            self.targets.add((kind, cls, member))
+
+    def _match_at(self, i):
+        t = self._token
+        word = t(i)
+        if word == "Java" and t(i + 1) == "." and t(i + 2) == "use" and t(i + 3) == "(" \
+                and _string(t(i + 4)) is not None and t(i + 5) == ")":
+            self._add_class("java", _string(t(i + 4)), i, i + 6)
+        elif word == "ObjC" and t(i + 1) == "." and t(i + 2) == "classes":
+            if t(i + 3) == "." and IDENTIFIER_RE.match(t(i + 4)):
+                self._add_class("objc", t(i + 4), i, i + 5)
+            elif t(i + 3) == "[" and _string(t(i + 4)) is not None and t(i + 5) == "]":
+                self._add_class("objc", _string(t(i + 4)), i, i + 6)
+        elif word == "Module" and t(i + 1) == "." and t(i + 2) in EXPORT_LOOKUPS and t(i + 3) == "(":
+            module = _string(t(i + 4))
+            symbol = _string(t(i + 6))
+            if (module is not None or t(i + 4) == "null") and t(i + 5) == "," and symbol is not None:
+                self.targets.add(("native", module or "", symbol))
+        elif word == "Module" and t(i + 1) == "." and t(i + 2) == "getGlobalExportByName" \
+                and t(i + 3) == "(" and _string(t(i + 4)) is not None:
+            self.targets.add(("native", "", _string(t(i + 4))))
+        elif word == "Process" and t(i + 1) == "." and t(i + 2) in MODULE_LOOKUPS and t(i + 3) == "(" \
+                and _string(t(i + 4)) is not None and t(i + 5) == ")" and t(i + 6) == "." \
+                and t(i + 7) in EXPORT_LOOKUPS and t(i + 8) == "(" and _string(t(i + 9)) is not None:
+            self.targets.add(("native", _string(t(i + 4)), _string(t(i + 9))))
+        elif word in self.bindings and t(i - 1) != ".":
+            kind, cls = self.bindings[word]
+            member = self._member(i + 1, kind)
+            if member is not None:
+                self.targets.add((kind, cls, member))
+
+def extract_targets(text):
+    """Return the sorted (kind, target, member) hook targets of a script's text."""
+    extractor = TargetExtractor()
+    extractor.feed(text)
+    return extractor.result()
+
+def main():
+    """Command line entry point: hooktargets.py script.js [...] prints each script's targets."""
+    if len(sys.argv) < 2:
+        print("Usage: python hooktargets.py script.js [...]")
+        sys.exit(2)
+    for script_path in sys.argv[1:]:
+        with open(script_path, encoding="utf-8", errors="replace") as script_file:
+            targets = extract_targets(script_file.read())
+        print(f"{script_path}:")
+        for kind, target, member in targets:
+            print(f"  {kind:6} {target or '*'}{'.' + member if member else ''}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import os
+import shutil
+import tarfile
+import zipfile
+import argparse
+import codecs
+import hashlib
+import tempfile
+from collections import defaultdict
+
+import analyze
+import handler
+import hashcache
+import hooktargets
+import metrics
+import objstore
+import rules
+
+CHUNK_SIZE = 1024 * 1024  # Bytes read per step; the only read of each script
+
+def stream_script(fileobj, tmp_dir, chunk_size=CHUNK_SIZE):
+    """
+    Read a script once in chunks, feeding every chunk to the hasher, the
+    blob writer and the pattern scanner at the same time.
+    Returns (sha256, tmp_path, size, analysis, is_text) where tmp_path is
+    the written blob candidate and is_text tells whether the script decoded
+    as UTF-8 (scripts that do not are backed up but not organized). The
+    decoded text of UTF-8 scripts is kept in analysis["text"] for the
+    full-text index, and their hook targets in analysis["hook_targets"].
+    """
+    hasher = hashlib.sha256()
+    scanner = rules.ActionScanner()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    extractor = hooktargets.TargetExtractor()
+    is_text = True
+    text = []
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f"ingest-{os.getpid()}-", dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as blob:
+            for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+                size += len(chunk)
+                hasher.update(chunk)
+                blob.write(chunk)
+                scanner.feed(chunk)
+                if is_text:
+                    try:
+                        text.append(decoder.decode(chunk))
+                        extractor.feed(text[-1])
+                    except UnicodeDecodeError:
+                        is_text = False
+                        text = []
+            if is_text:
+                try:
+                    text.append(decoder.decode(b"", final=True))
+                    extractor.feed(text[-1])
+                except UnicodeDecodeError:
+                    is_text = False
+                    text = []
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    analysis = scanner.result()
+    analysis["text"] = "".join(text) if is_text else None
+    analysis["hook_targets"] = extractor.result() if is_text else None
+    return hasher.hexdigest(), tmp_path, size, analysis, is_text
+
+def sweep_tmp(tmp_dir):
+    """
+    Delete the blob candidates stream_script left in tmp_dir when an ingest
+    died before committing them. Files of ingests still running are kept.
+    """
+    removed = 0
+    for entry in os.scandir(tmp_dir):
+        if not entry.name.startswith("ingest-"):
+            continue
+        pid = entry.name.split("-")[1]
+        if pid.isdigit() and _pid_alive(int(pid)):
+            continue
+        try:
+            os.unlink(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        print(f"[INFO] Removed {removed} leftover temporary files from {tmp_dir}.")
+    return removed
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _member_name(member_path):
+    """
+    Flatten an archive member path into a script name. "%" and the path
+    separators are escaped (ssl/pin.js -> ssl%2Fpin.js), so members never
+    collide with each other or with a literal ssl_pin.js.
+    """
+    parts = [part for part in member_path.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    return "%2F".join(part.replace("%", "%25") for part in parts)
+
+class Ingestor:
+    """
+    Fused hash -> dedup -> store -> organize -> analyze pipeline.
+    Each script is read exactly once; the Scripts/Actions rows are written
+    in the same pass, so this replaces running handler.py and then analyze.py.
+    """
+
+    def __init__(self, base_dir="scripts", db_path=None):
+        self.base_dir = base_dir
+        self.raw_dir = os.path.join(base_dir, "raw")
+        self.backup_dir = os.path.join(base_dir, "backup")
+        self.organized_dir = os.path.join(base_dir, "organized", "general")
+        self.dupe_dir = os.path.join(base_dir, "dupe")
+        self.objects_dir = os.path.join(base_dir, "objects")
+        self.tmp_dir = os.path.join(self.objects_dir, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        sweep_tmp(self.tmp_dir)
+
+        self.db_path = db_path or os.path.join(base_dir, "scripts.db")
+        analyze.setup_database(self.db_path)
+        self.conn = analyze.connect(self.db_path)
+        analyze.save_rule_set(self.conn, rules.default_rules())
+        self.pending = []  # analyses waiting for the next batched write
+        self.cache = hashcache.open_hash_cache(os.path.join(base_dir, "hashcache.db"))
+
+        self.placed = defaultdict(set)  # sha256 -> names already outside raw
+        self.seen = {}                  # sha256 -> first name ingested this run
+        self.counts = defaultdict(int)
+        self.duplicates = []
+
+    def refresh(self):
+        """
+        Bring the hash cache up to date and return the raw scripts that
+        still need ingesting as (name, path) pairs.
+        """
+        store, stale = hashcache.stat_store(self.cache, self.base_dir)
+
+        # Files changed outside raw are rare; hash them the usual way.
+        outside = {rel_path: item for rel_path, item in stale.items() if item[2] != "raw"}
+        if outside:
+            hashes = handler.hash_files_parallel([item[0] for item in outside.values()])
+            for rel_path, (full_path, _, placement) in outside.items():
+                store[rel_path] = (hashes[full_path], placement)
+                hashcache.record_file(self.cache, self.base_dir, rel_path, hashes[full_path], placement)
+            self.cache.commit()
+
+        self.placed.clear()
+        for rel_path, (file_hash, placement) in store.items():
+            if placement != "raw":
+                self.placed[file_hash].add(os.path.basename(rel_path))
+
+        pending = []
+        for rel_path, (full_path, _, placement) in stale.items():
+            if placement == "raw" and os.path.dirname(rel_path) == "raw":
+                pending.append((os.path.basename(rel_path), full_path))
+        for rel_path, (file_hash, placement) in store.items():
+            name = os.path.basename(rel_path)
+            if placement == "raw" and os.path.dirname(rel_path) == "raw" \
+                    and name not in self.placed[file_hash]:
+                # Hashed by an earlier run that never placed it.
+                pending.append((name, os.path.join(self.base_dir, rel_path)))
+        return sorted(pending)
+
+    def ingest(self, fileobj, script, source_path=None):
+        """
+        Ingest one script from an open binary file object.
+        source_path is the raw file the data came from, if any; duplicates
+        read from raw are moved to dupe/ like handler.handle_duplicates does,
+        other duplicates are linked into dupe/ from the stored blob.
+        Returns "new", "duplicate" or "unchanged".
+        """
+        file_hash, tmp_path, size, analysis, is_text = stream_script(fileobj, self.tmp_dir)
+
+        if script in self.placed[file_hash]:
+            os.unlink(tmp_path)
+            self.seen.setdefault(file_hash, script)
+            self._record_source(source_path, file_hash)
+            self.counts["unchanged"] += 1
+            return "unchanged"
+        elif file_hash in self.seen:
+            original = self.seen[file_hash]
+        elif self.placed[file_hash]:
+            original = sorted(self.placed[file_hash])[0]
+        else:
+            original = None
+
+        objstore.commit_blob(tmp_path, file_hash, self.objects_dir)
+
+        if original is not None:
+            self._place_duplicate(script, source_path, file_hash)
+            self.placed[file_hash].add(script)
+            self.duplicates.append((script, original))
+            self.counts["duplicate"] += 1
+            return "duplicate"
+
+        self.seen[file_hash] = script
+        backup_path = os.path.join(self.backup_dir, script)
+        objstore.link_blob(file_hash, backup_path, self.objects_dir)
+        self._record(backup_path, file_hash, "backup")
+        print(f"[INFO] Backed up {script} to {self.backup_dir}.")
+
+        if is_text:
+            organized_path = os.path.join(self.organized_dir, script)
+            objstore.link_blob(file_hash, organized_path, self.objects_dir)
+            self._record(organized_path, file_hash, "organized")
+            print(f"[INFO] Organized {script} into {self.organized_dir}.")
+            analysis.update(sha256=file_hash, size=size)
+            self.pending.append((script, organized_path, analysis))
+            if len(self.pending) >= analyze.BATCH_SIZE:
+                self._flush()
+            print(f"[INFO] Processed script: {script} (Tags: {', '.join(analysis['tags'])})")
+        else:
+            print(f"[ERROR] Failed to read {script}: not valid UTF-8 text")
+
+        self.placed[file_hash].add(script)
+        self._record_source(source_path, file_hash)
+        self.counts["new"] += 1
+        return "new"
+
+    def ingest_path(self, script_path):
+        """Ingest one script file from raw/."""
+        with open(script_path, "rb") as f:
+            return self.ingest(f, os.path.basename(script_path), source_path=script_path)
+
+    def ingest_raw(self):
+        """Ingest every new or changed script in raw/."""
+        pending = self.refresh()
+        print(f"[DEBUG] Found {len(pending)} new or changed scripts in raw directory.")
+        for script, script_path in pending:
+            self.ingest_path(script_path)
+        self.commit()
+
+    def ingest_archive(self, archive_path):
+        """
+        Ingest every .js member of a zip or tar (optionally compressed) bundle.
+        Members are streamed straight from the archive; nothing is extracted
+        to disk and memory use is bounded by CHUNK_SIZE, not the archive size.
+        Member paths are flattened into the script name (see _member_name).
+        """
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not info.filename.endswith(".js"):
+                        continue
+                    with archive.open(info) as member:
+                        self.ingest(member, _member_name(info.filename))
+        elif tarfile.is_tarfile(archive_path):
+            # "r|*" reads the tar as a stream, so compressed bundles are never seeked.
+            with tarfile.open(archive_path, "r|*") as archive:
+                for info in archive:
+                    if not info.isfile() or not info.name.endswith(".js"):
+                        continue
+                    member = archive.extractfile(info)
+                    self.ingest(member, _member_name(info.name))
+        else:
+            print(f"[ERROR] Unsupported archive format: {archive_path}")
+            return
+        self.commit()
+        print(f"[INFO] Finished ingesting archive {archive_path}.")
+
+    def commit(self):
+        """Flush database and cache writes."""
+        self._flush()
+        with metrics.timer("db_commit_seconds", db="hashcache"):
+            self.cache.commit()
+
+    def close(self):
+        """Commit and close the underlying connections."""
+        self.commit()
+        self.conn.close()
+        self.cache.close()
+
+    def report(self):
+        """Print a summary of what this ingestor did."""
+        if self.duplicates:
+            print("[INFO] Duplicate scripts detected and moved:")
+            for dup, original in self.duplicates:
+                print(f"  - Duplicate: {dup}, Original: {original}")
+        else:
+            print("[INFO] No duplicate scripts found.")
+        print(f"[INFO] Ingest completed: {self.counts['new']} new, "
+              f"{self.counts['duplicate']} duplicate, {self.counts['unchanged']} unchanged.")
+
+    def _flush(self):
+        analyze.write_analyses(self.conn, self.pending)
+        self.pending = []
+
+    def _record(self, path, file_hash, placement):
+        rel_path = os.path.relpath(path, self.base_dir)
+        hashcache.record_file(self.cache, self.base_dir, rel_path, file_hash, placement)
+
+    def _record_source(self, source_path, file_hash):
+        if source_path and os.path.exists(source_path):
+            self._record(source_path, file_hash, "raw")
+
+    def _place_duplicate(self, script, source_path, file_hash):
+        dest_path = os.path.join(self.dupe_dir, script)
+        os.makedirs(self.dupe_dir, exist_ok=True)
+        if source_path:
+            with metrics.timer("file_copy_seconds", op="move"):
+                shutil.move(source_path, dest_path)
+            hashcache.forget_file(self.cache, os.path.relpath(source_path, self.base_dir))
+        else:
+            objstore.link_blob(file_hash, dest_path, self.objects_dir)
+        self._record(dest_path, file_hash, "dupe")
+        print(f"[INFO] Moved duplicate script {script} to {self.dupe_dir}.")
+
+def main():
+    """
+    Ingest scripts/raw in a single pass (replaces handler.py followed by analyze.py).
+    Zip/tar bundles given on the command line are streamed in as well.
+    """
+    parser = argparse.ArgumentParser(description="Single-pass script ingest.")
+    parser.add_argument("archives", nargs="*", help="zip/tar bundles of .js scripts to ingest")
+    parser.add_argument("--base-dir", default="scripts", help="script store directory")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.start("ingest", args.metrics, args.profile)
+
+    handler.setup_directories(args.base_dir)
+    ingestor = Ingestor(args.base_dir)
+    try:
+        ingestor.ingest_raw()
+        for archive_path in args.archives:
+            ingestor.ingest_archive(archive_path)
+        ingestor.report()
+    finally:
+        ingestor.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,567 @@
+import os
+import re
+import sys
+import gzip
+import json
+import mmap
+import time
+import queue
+import random
+import struct
+import bisect
+import hashlib
+import argparse
+import resource
+import threading
+import subprocess
+from collections import OrderedDict, namedtuple
+
+try:
+    import zstandard
+except ImportError:  # gzip is used instead
+    zstandard = None
+
+import device
+import metrics
+import sessions
+
+DUMP_DIR = "dumps"
+DUMP_VERSION = 1
+READ_PAGES = 256           # Pages fetched from the target per read (1 MiB with 4 KiB pages)
+CHUNK_PAGES = 1024         # Unique pages per compressed chunk file
+WRITE_QUEUE = 2            # Full chunks waiting for the compressor before reading pauses
+DEDUPE_ENTRIES = 1 << 18   # Page hashes remembered for deduplication (about 30 MB); later new pages are stored as is
+CACHE_CHUNKS = 8           # Decompressed chunks DumpReader keeps
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+ZERO_CHUNK = 0xFFFFFFFF    # Page index entries for pages that are not stored in a chunk
+UNREADABLE_CHUNK = 0xFFFFFFFE
+MAGIC = b"SASHAMD1"
+RANGE_RECORD = struct.Struct("<QQQ")  # base, size, index of the range's first page record
+PAGE_RECORD = struct.Struct("<II")    # chunk number, page slot in the chunk
+
+RangeInfo = namedtuple("RangeInfo", "base size protection file")
+DumpResult = namedtuple("DumpResult", "path ranges pages zero_pages duplicate_pages unique_pages unreadable_pages "
+                                      "bytes stored_bytes seconds")
+
+class DumpError(Exception):
+    """A dump cannot be taken or read."""
+
+AGENT = """
+rpc.exports = {
+  pageSize: function () {
+    return Process.pageSize;
+  },
+  ranges: function (protection) {
+    return Process.enumerateRanges(protection).map(function (range) {
+      return [range.base.toString(), range.size, range.protection, range.file ? range.file.path : null];
+    });
+  },
+  read: function (address, size) {
+    try {
+      return ptr(address).readByteArray(size);
+    } catch (e) {
+      return null;
+    }
+  }
+};
+"""
+
+class ProcSource:
+    """Memory of a local process through /proc/PID/maps and /proc/PID/mem (needs ptrace rights on it)."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        try:
+            self.fd = os.open(f"/proc/{pid}/mem", os.O_RDONLY)
+        except OSError as e:
+            raise DumpError(f"cannot open the memory of {pid}: {e}")
+
+    def ranges(self, protection="r--"):
+        wanted = [flag for flag in protection if flag != "-"]
+        ranges = []
+        with open(f"/proc/{self.pid}/maps") as f:
+            for line in f:
+                fields = line.split(None, 5)
+                start, end = (int(part, 16) for part in fields[0].split("-"))
+                perms = fields[1][:3]
+                if all(flag in perms for flag in wanted):
+                    path = fields[5].strip() if len(fields) > 5 else None
+                    ranges.append(RangeInfo(start, end - start, perms, path or None))
+        return ranges
+
+    def read(self, address, size):
+        try:
+            data = os.pread(self.fd, size, address)
+        except OSError:
+            return None
+        return data if len(data) == size else None
+
+    def close(self):
+        os.close(self.fd)
+
+class FridaSource:
+    """Memory of a process on the device, read by a small agent loaded into a frida session."""
+
+    def __init__(self, frida_session):
+        try:
+            self.script = frida_session.create_script(AGENT, name="memdump")
+            self.script.load()
+            self.api = getattr(self.script, "exports_sync", None) or self.script.exports
+            self.page_size = self.api.page_size()
+        except Exception as e:
+            raise DumpError(f"cannot load the dump agent: {e}")
+
+    def ranges(self, protection="r--"):
+        return [RangeInfo(int(base, 16), size, perms, path) for base, size, perms, path in self.api.ranges(protection)]
+
+    def read(self, address, size):
+        try:
+            data = self.api.read(hex(address), size)
+        except Exception as e:  # The process or the session went away; unreadable memory returns None
+            raise DumpError(f"reading 0x{address:x} failed: {e}")
+        return bytes(data) if data is not None and len(data) == size else None
+
+    def close(self):
+        try:
+            self.script.unload()
+        except Exception as e:  # The process may be gone already
+            print(f"[DEBUG] Unloading the dump agent: {e}")
+
+def _compress(data, compression):
+    if compression == "zst":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+def _decompress(data, compression):
+    if compression == "zst":
+        if zstandard is None:
+            raise DumpError("this dump needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def chunk_path(dump_dir, number, compression):
+    return os.path.join(dump_dir, "chunks", f"{number:06d}.{compression}")
+
+class ChunkWriter:
+    """
+    Packs unique pages into chunks of chunk_pages pages and writes each one
+    compressed, from a thread so that reading continues meanwhile. At most
+    WRITE_QUEUE full chunks wait, so memory stays bounded when the disk or
+    the compressor is the slow side.
+    """
+
+    def __init__(self, dump_dir, chunk_pages=CHUNK_PAGES, compression=None):
+        self.dump_dir = dump_dir
+        self.chunk_pages = chunk_pages
+        self.compression = compression
+        self.number = 0
+        self.pages = []
+        self.stored_bytes = 0
+        self.error = None
+        self.queue = queue.Queue(WRITE_QUEUE)
+        os.makedirs(os.path.join(dump_dir, "chunks"), exist_ok=True)
+        self.thread = threading.Thread(target=self._write_loop, name="dump-writer", daemon=True)
+        self.thread.start()
+
+    def add(self, page):
+        """Store a page; returns its (chunk, slot)."""
+        location = (self.number, len(self.pages))
+        self.pages.append(page)
+        if len(self.pages) == self.chunk_pages:
+            self._submit()
+        return location
+
+    def _submit(self):
+        if self.error is not None:
+            raise DumpError(f"writing chunks failed: {self.error}")
+        self.queue.put((self.number, self.pages))
+        self.number += 1
+        self.pages = []
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            number, pages = item
+            try:
+                with metrics.timer("dump_chunk_write_seconds"):
+                    data = _compress(b"".join(pages), self.compression)
+                    path = chunk_path(self.dump_dir, number, self.compression)
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)
+                self.stored_bytes += len(data)
+            except OSError as e:
+                self.error = e
+
+    def stop(self):
+        """Write the last partial chunk and wait for the writer (only the first call does)."""
+        if not self.thread.is_alive():
+            return
+        if self.pages:
+            self._submit()
+        self.queue.put(None)
+        self.thread.join()
+
+    def close(self):
+        """stop(), then raise DumpError if a chunk could not be written."""
+        self.stop()
+        if self.error is not None:
+            raise DumpError(f"writing chunks failed: {self.error}")
+
+def _write_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def dump(source, dump_dir, protection="r--", read_pages=READ_PAGES, chunk_pages=CHUNK_PAGES,
+         dedupe_entries=DEDUPE_ENTRIES, compression=None, info=None):
+    """
+    Stream the memory ranges of source (a ProcSource or FridaSource) into
+    dump_dir, read_pages pages at a time. Zero pages are only noted in the
+    index; other pages are hashed and stored once (in compressed chunk
+    files), with later copies pointing at the first. The index is two flat
+    files that DumpReader memory-maps: ranges.idx (one record per range)
+    and pages.idx (chunk and slot of every page). meta.json is written last
+    and marks whether the dump finished; an interrupted dump is still
+    readable up to where it stopped. Returns a DumpResult.
+    """
+    compression = compression or ("zst" if zstandard is not None else "gz")
+    if compression == "zst" and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package")
+    started = time.perf_counter()
+    page_size = source.page_size
+    zero_page = bytes(page_size)
+    os.makedirs(dump_dir, exist_ok=True)
+    with metrics.timer("dump_ranges_seconds"):
+        ranges = sorted(source.ranges(protection))
+    counts = dict.fromkeys(("pages", "zero", "duplicate", "unique", "unreadable"), 0)
+    seen = {}  # Page digest -> (chunk, slot)
+    dumped = []  # (RangeInfo, first page record)
+    writer = ChunkWriter(dump_dir, chunk_pages, compression)
+    zero_record = PAGE_RECORD.pack(ZERO_CHUNK, 0)
+    unreadable_record = PAGE_RECORD.pack(UNREADABLE_CHUNK, 0)
+    complete = False
+    try:
+        with open(os.path.join(dump_dir, "pages.idx.tmp"), "wb") as index:
+            index.write(MAGIC)
+            for memory_range in ranges:
+                dumped.append((memory_range, counts["pages"]))
+                end = memory_range.base + memory_range.size
+                for address in range(memory_range.base, end, read_pages * page_size):
+                    size = min(read_pages * page_size, end - address)
+                    with metrics.timer("dump_read_seconds"):
+                        block = source.read(address, size)
+                    records = bytearray()
+                    for offset in range(0, size, page_size):
+                        if block is not None:
+                            page = block[offset:offset + page_size]
+                        else:  # Part of the block is unreadable: retry page by page
+                            page = source.read(address + offset, page_size)
+                        if page is None:
+                            counts["unreadable"] += 1
+                            records += unreadable_record
+                        elif page == zero_page:
+                            counts["zero"] += 1
+                            records += zero_record
+                        else:
+                            digest = hashlib.blake2b(page, digest_size=16).digest()
+                            location = seen.get(digest)
+                            if location is not None:
+                                counts["duplicate"] += 1
+                            else:
+                                counts["unique"] += 1
+                                location = writer.add(page)
+                                if len(seen) < dedupe_entries:
+                                    seen[digest] = location
+                            records += PAGE_RECORD.pack(*location)
+                    index.write(records)
+                    counts["pages"] += size // page_size
+        writer.close()
+        complete = True
+    finally:
+        # Also when reading or writing chunks failed: the index and meta.json
+        # keep the dump readable up to there and mark it incomplete.
+        writer.stop()
+        os.replace(os.path.join(dump_dir, "pages.idx.tmp"), os.path.join(dump_dir, "pages.idx"))
+        _write_atomic(os.path.join(dump_dir, "ranges.idx"),
+                      MAGIC + b"".join(RANGE_RECORD.pack(memory_range.base, memory_range.size, first)
+                                       for memory_range, first in dumped))
+        seconds = time.perf_counter() - started
+        result = DumpResult(dump_dir, len(dumped), counts["pages"], counts["zero"], counts["duplicate"],
+                            counts["unique"], counts["unreadable"], counts["pages"] * page_size,
+                            writer.stored_bytes, seconds)
+        meta = {
+            "version": DUMP_VERSION,
+            "complete": complete,
+            "error": str(writer.error) if writer.error is not None else None,
+            "created": time.time(),
+            "info": info or {},
+            "page_size": page_size,
+            "compression": compression,
+            "chunk_pages": chunk_pages,
+            "chunks": writer.number,
+            "stats": {field: value for field, value in result._asdict().items() if field != "path"},
+            "ranges": [{"base": hex(memory_range.base), "size": memory_range.size,
+                        "protection": memory_range.protection, "file": memory_range.file}
+                       for memory_range, _ in dumped],
+        }
+        _write_atomic(os.path.join(dump_dir, "meta.json"), json.dumps(meta, indent=2).encode())
+        for kind in ("zero", "duplicate", "unique", "unreadable"):
+            metrics.count("dump_pages_total", counts[kind], kind=kind)
+    return result
+
+class DumpReader:
+    """
+    Random access to a dump: read(address, size) finds the pages through
+    the memory-mapped index files and decompresses only the chunks it needs
+    (the last CACHE_CHUNKS are kept).
+    """
+
+    def __init__(self, dump_dir):
+        self.dump_dir = dump_dir
+        try:
+            with open(os.path.join(dump_dir, "meta.json")) as f:
+                self.meta = json.load(f)
+        except (OSError, ValueError) as e:
+            raise DumpError(f"{dump_dir} is not a readable dump: {e}")
+        self.page_size = self.meta["page_size"]
+        self.compression = self.meta["compression"]
+        self.range_map = self._map("ranges.idx")
+        self.page_map = self._map("pages.idx")
+        count = (len(self.range_map) - len(MAGIC)) // RANGE_RECORD.size
+        self.bases = [RANGE_RECORD.unpack_from(self.range_map, len(MAGIC) + index * RANGE_RECORD.size)[0]
+                      for index in range(count)]
+        self.cache = OrderedDict()
+
+    def _map(self, name):
+        try:
+            with open(os.path.join(self.dump_dir, name), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise DumpError(f"cannot map {name} of {self.dump_dir}: {e}")
+        if mapped[:len(MAGIC)] != MAGIC:
+            raise DumpError(f"{name} of {self.dump_dir} is not a dump index")
+        return mapped
+
+    def _range(self, address):
+        index = bisect.bisect_right(self.bases, address) - 1
+        if index >= 0:
+            base, size, first = RANGE_RECORD.unpack_from(self.range_map, len(MAGIC) + index * RANGE_RECORD.size)
+            if address < base + size:
+                return base, size, first
+        raise DumpError(f"0x{address:x} is not in a dumped range")
+
+    def _chunk(self, number):
+        data = self.cache.get(number)
+        if data is None:
+            with open(chunk_path(self.dump_dir, number, self.compression), "rb") as f:
+                data = _decompress(f.read(), self.compression)
+            self.cache[number] = data
+            if len(self.cache) > CACHE_CHUNKS:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(number)
+        return data
+
+    def page(self, address):
+        """The page containing address."""
+        base, _, first = self._range(address)
+        record = first + (address - base) // self.page_size
+        if len(MAGIC) + (record + 1) * PAGE_RECORD.size > len(self.page_map):
+            raise DumpError(f"the page at 0x{address:x} was not reached before the dump stopped")
+        chunk, slot = PAGE_RECORD.unpack_from(self.page_map, len(MAGIC) + record * PAGE_RECORD.size)
+        if chunk == ZERO_CHUNK:
+            return bytes(self.page_size)
+        if chunk == UNREADABLE_CHUNK:
+            raise DumpError(f"the page at 0x{address:x} could not be read when dumping")
+        data = self._chunk(chunk)
+        return data[slot * self.page_size:(slot + 1) * self.page_size]
+
+    def read(self, address, size):
+        """size bytes at address; may span pages and adjacent ranges."""
+        parts = []
+        while size > 0:
+            offset = address % self.page_size
+            part = self.page(address - offset)[offset:offset + size]
+            parts.append(part)
+            address += len(part)
+            size -= len(part)
+        return b"".join(parts)
+
+    def ranges(self):
+        return [RangeInfo(int(entry["base"], 16), entry["size"], entry["protection"], entry["file"])
+                for entry in self.meta["ranges"]]
+
+    def close(self):
+        self.range_map.close()
+        self.page_map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def dump_name(*parts):
+    """A dump directory name from parts (package, PID...) plus a timestamp."""
+    name = "-".join(re.sub(r"[^A-Za-z0-9._-]+", "_", str(part)) for part in parts if part)
+    return os.path.join(DUMP_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+
+def print_result(result):
+    ratio = result.bytes / result.stored_bytes if result.stored_bytes else float("inf")
+    print(f"[INFO] Dumped {result.ranges} ranges ({result.bytes / 1024 / 1024:.1f} MB) in {result.seconds:.1f} s "
+          f"({result.bytes / 1024 / 1024 / max(result.seconds, 1e-9):.0f} MB/s) to {result.path}: "
+          f"{result.zero_pages} zero, {result.duplicate_pages} duplicate, {result.unique_pages} unique and "
+          f"{result.unreadable_pages} unreadable pages; {result.stored_bytes / 1024 / 1024:.1f} MB on disk "
+          f"({ratio:.1f}x smaller).")
+
+def dump_app(manager, package=None, pid=None, dump_dir=None, protection="r--"):
+    """
+    Dump a process on the device through a sessions.SessionManager: the
+    given PID, or the running process of package (spawned when it is not
+    running). Returns the DumpResult.
+    """
+    if pid is None:
+        running = [app.pid for app in device.get_session(manager.serial).applications()
+                   if app.identifier == package and app.pid]
+        session = manager.attach(running[0], package) if running else manager.spawn(package)
+    else:
+        session = manager.attach(pid, package)
+    dump_dir = dump_dir or dump_name(package, session.pid)
+    print(f"[INFO] Dumping {package or session.pid} ({session.pid}) to {dump_dir}...")
+    source = FridaSource(session.frida_session)
+    try:
+        return dump(source, dump_dir, protection, info={"package": package, "pid": session.pid,
+                                                        "serial": manager.serial})
+    finally:
+        source.close()
+
+BENCH_CHILD = """
+import os, sys, time
+zeros = bytearray({zeros})
+block = os.urandom(1 << 20)
+copies = [bytearray(block) for _ in range({copies})]
+unique = bytearray(os.urandom({unique}))
+text = bytearray(b"".join(b"%08d sasha memdump sample line\\n" % n for n in range({text} // 36)))
+print("ready", flush=True)
+time.sleep(3600)
+"""
+
+def bench(dump_dir, mb):
+    """Dump a local child process holding zero, duplicate, unique and text memory; verify samples."""
+    quarter = mb * 1024 * 1024 // 4
+    child = subprocess.Popen([sys.executable, "-c", BENCH_CHILD.format(
+        zeros=quarter * 2, copies=quarter // (1 << 20), unique=quarter // 2, text=quarter // 2)],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        child.stdout.readline()
+        source = ProcSource(child.pid)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = dump(source, dump_dir, "rw-", info={"pid": child.pid, "bench": True})
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print_result(result)
+        print(f"[INFO] Peak RSS {rss_after / 1024:.0f} MB (was {rss_before / 1024:.0f} MB before the dump).")
+        checked = 0
+        rng = random.Random(0)
+        with DumpReader(dump_dir) as reader:
+            for _ in range(2000):
+                memory_range = rng.choice(reader.ranges())
+                address = memory_range.base + rng.randrange(memory_range.size // source.page_size) * source.page_size
+                expected = source.read(address, source.page_size)
+                if expected is None:
+                    continue
+                if reader.read(address, source.page_size) != expected:
+                    print(f"[ERROR] The page at 0x{address:x} does not match the process.")
+                    sys.exit(1)
+                checked += 1
+        source.close()
+        print(f"[INFO] {checked} random pages read back from the dump match the process.")
+    finally:
+        child.kill()
+        child.wait()
+
+def main():
+    """
+    Command line entry point:
+      memdump.py dump (--package P | --pid P | --local-pid P) [--out DIR] [--serial S]
+      memdump.py cat DUMP --address A --size N [--output FILE]
+      memdump.py info DUMP
+      memdump.py bench [--mb N]
+    """
+    parser = argparse.ArgumentParser(description="Stream process memory into deduplicated, compressed dumps.")
+    parser.add_argument("command", choices=["dump", "cat", "info", "bench"])
+    parser.add_argument("dump", nargs="?", help="dump directory (cat, info)")
+    parser.add_argument("--package", help="app to dump (spawned if it is not running)")
+    parser.add_argument("--pid", type=int, help="device process to dump")
+    parser.add_argument("--local-pid", type=int, help="local process to dump through /proc")
+    parser.add_argument("--serial", help="device serial")
+    parser.add_argument("--out", help=f"dump directory (default: under {DUMP_DIR}/)")
+    parser.add_argument("--protection", default="r--", help="ranges to dump, as frida protections (default: r--)")
+    parser.add_argument("--address", type=lambda value: int(value, 0), help="start address (cat)")
+    parser.add_argument("--size", type=lambda value: int(value, 0), help="bytes to read (cat)")
+    parser.add_argument("--output", help="write the bytes here instead of stdout (cat)")
+    parser.add_argument("--mb", type=int, default=512, help="memory the bench process holds (bench)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.start("memdump", args.metrics, args.profile)
+
+    try:
+        if args.command == "dump":
+            if args.local_pid:
+                source = ProcSource(args.local_pid)
+                try:
+                    result = dump(source, args.out or dump_name("local", args.local_pid), args.protection,
+                                  info={"pid": args.local_pid})
+                finally:
+                    source.close()
+            elif args.package or args.pid:
+                manager = sessions.get_manager(args.serial)
+                try:
+                    result = dump_app(manager, args.package, args.pid, args.out, args.protection)
+                finally:
+                    manager.close()
+            else:
+                parser.error("dump needs --package, --pid or --local-pid")
+            print_result(result)
+        elif args.command == "bench":
+            bench(args.out or os.path.join("bench", "memdump"), args.mb)
+        elif not args.dump:
+            parser.error(f"{args.command} needs a dump directory")
+        elif args.command == "info":
+            with DumpReader(args.dump) as reader:
+                meta = reader.meta
+                print(f"[INFO] {args.dump}: {'complete' if meta['complete'] else 'INCOMPLETE'}, "
+                      f"{meta['stats']['bytes'] / 1024 / 1024:.1f} MB in {len(meta['ranges'])} ranges, "
+                      f"{meta['stats']['stored_bytes'] / 1024 / 1024:.1f} MB stored in {meta['chunks']} chunks.")
+                if meta.get("error"):
+                    print(f"[ERROR] The dump stopped on: {meta['error']}")
+                for memory_range in reader.ranges():
+                    print(f"  0x{memory_range.base:x}-0x{memory_range.base + memory_range.size:x} "
+                          f"{memory_range.protection} {memory_range.file or ''}")
+        else:
+            if args.address is None or args.size is None:
+                parser.error("cat needs --address and --size")
+            with DumpReader(args.dump) as reader:
+                data = reader.read(args.address, args.size)
+            if args.output:
+                with open(args.output, "wb") as f:
+                    f.write(data)
+            else:
+                sys.stdout.buffer.write(data)
+    except DumpError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("[INFO] Stopped; the dump so far is readable and marked incomplete.")
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import os
+import sys
+import json
+import time
+import atexit
+import bisect
+import argparse
+import threading
+from collections import Counter
+from functools import wraps
+from multiprocessing import util
+
+PREFIX = "sasha_"
+DEFAULT_DIR = "metrics"
+METRICS_ENV = "SASHA_METRICS"  # Output directory; set it to switch metrics on without a flag
+PROFILE_ENV = "SASHA_PROFILE"  # "sample" or "cprofile"
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+EVENT_BUFFER = 4096       # Span events held in memory before they are appended to the JSONL file
+SAMPLE_INTERVAL = 0.005   # Seconds between stack samples of the sampling profiler
+PROFILE_MODES = ("sample", "cprofile")
+
+enabled = False  # Checked first by every hook, so instrumentation costs one test when off
+_registry = None
+_profiler = None
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+class Registry:
+    """
+    Counters, duration histograms and span events of one process.
+    Span events are appended to metrics.jsonl in batches; on close the
+    process adds a summary line with its counters and histograms. Worker
+    processes forked by multiprocessing get their own registry, and the
+    parent merges their summaries into the Prometheus file it writes.
+    """
+
+    def __init__(self, run, out_dir, run_id=None, parent_pid=None):
+        self.run = run
+        self.out_dir = out_dir
+        self.run_id = run_id or f"{run}-{int(time.time())}-{os.getpid()}"
+        self.pid = os.getpid()
+        self.parent_pid = parent_pid
+        self.counters = Counter()  # (name, label key) -> value
+        self.histograms = {}       # (name, label key) -> [bucket counts..., sum, count]
+        self.events = []
+        self.lock = threading.Lock()
+        self.jsonl_path = os.path.join(out_dir, "metrics.jsonl")
+        self.prom_path = os.path.join(out_dir, f"{run}.prom")
+        os.makedirs(out_dir, exist_ok=True)
+        # Where this run's lines start, so the parent only reads back its own workers' summaries.
+        self.offset = os.path.getsize(self.jsonl_path) if os.path.exists(self.jsonl_path) else 0
+
+    def count(self, name, value, labels):
+        with self.lock:
+            self.counters[name, _label_key(labels)] += value
+
+    def observe(self, name, seconds, labels, span=False, error=False):
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(DURATION_BUCKETS) + 3)
+            histogram[bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            if span:
+                event = {"type": "span", "run_id": self.run_id, "pid": self.pid, "name": name,
+                         "ts": round(time.time() - seconds, 6), "seconds": round(seconds, 6)}
+                if labels:
+                    event["labels"] = labels
+                if error:
+                    event["error"] = True
+                self.events.append(event)
+                if len(self.events) >= EVENT_BUFFER:
+                    self._write(self.events)
+                    self.events = []
+
+    def _write(self, records):
+        data = "".join(json.dumps(record) + "\n" for record in records).encode()
+        # One O_APPEND write per batch, so lines from worker processes never interleave.
+        fd = os.open(self.jsonl_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def summary(self):
+        """This process's counters and histograms as a JSON-ready record."""
+        return {
+            "type": "summary", "run_id": self.run_id, "run": self.run, "pid": self.pid,
+            "parent_pid": self.parent_pid, "ts": round(time.time(), 6),
+            "counters": [{"name": name, "labels": dict(key), "value": value}
+                         for (name, key), value in self.counters.items()],
+            "histograms": [{"name": name, "labels": dict(key), "buckets": histogram[:-2],
+                            "sum": histogram[-2], "count": histogram[-1]}
+                           for (name, key), histogram in self.histograms.items()],
+        }
+
+    def close(self):
+        """Flush pending span events and the summary; the main process also writes the .prom file."""
+        with self.lock:
+            self._write(self.events + [self.summary()])
+            self.events = []
+        if self.parent_pid is None:
+            self._merge_workers()
+            self._write_prometheus()
+
+    def _merge_workers(self):
+        with open(self.jsonl_path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                if b'"summary"' not in line:
+                    continue
+                record = json.loads(line)
+                if record["run_id"] != self.run_id or record["pid"] == self.pid:
+                    continue
+                for counter in record["counters"]:
+                    self.counters[counter["name"], _label_key(counter["labels"])] += counter["value"]
+                for item in record["histograms"]:
+                    key = (item["name"], _label_key(item["labels"]))
+                    histogram = self.histograms.setdefault(key, [0] * (len(DURATION_BUCKETS) + 3))
+                    for index, value in enumerate(item["buckets"]):
+                        histogram[index] += value
+                    histogram[-2] += item["sum"]
+                    histogram[-1] += item["count"]
+
+    def _write_prometheus(self):
+        lines = []
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (other, key), value in sorted(self.counters.items()):
+                if other == name:
+                    lines.append(f"{PREFIX}{name}{_prom_labels(self.run, key)} {value}")
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (other, key), histogram in sorted(self.histograms.items()):
+                if other != name:
+                    continue
+                cumulative = 0
+                for bound, value in zip(DURATION_BUCKETS + ("+Inf",), histogram):
+                    cumulative += value
+                    labels = _prom_labels(self.run, key + (("le", str(bound)),))
+                    lines.append(f"{PREFIX}{name}_bucket{labels} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_prom_labels(self.run, key)} {histogram[-2]:.6f}")
+                lines.append(f"{PREFIX}{name}_count{_prom_labels(self.run, key)} {histogram[-1]}")
+        # Written aside and renamed so a scraping textfile collector never sees half a file.
+        tmp_path = self.prom_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prom_path)
+
+def _prom_labels(run, key):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in (("run", run),) + key) + "}"
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        if _registry is not None:
+            _registry.observe(self.name, elapsed, self.labels, span=True, error=exc_type is not None)
+        return False
+
+def timer(name, **labels):
+    """Context manager timing a block into the name histogram and a span event."""
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+def timed(name, **labels):
+    """Decorator form of timer()."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Timer(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, value=1, **labels):
+    """Add value to a counter."""
+    if enabled:
+        _registry.count(name, value, labels)
+
+def observe(name, seconds, **labels):
+    """Record a duration measured elsewhere (no span event)."""
+    if enabled:
+        _registry.observe(name, seconds, labels)
+
+class SamplingProfiler:
+    """
+    Sample the stack of every thread each interval seconds from a helper
+    thread and count identical stacks. dump() writes them in the folded
+    "frame;frame;frame count" format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self.stopping.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    thread = threading._active.get(thread_id)
+                    names[thread_id] = thread.name if thread else str(thread_id)
+                stack.append(names[thread_id])
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+        return path
+
+class _CProfiler:
+    """cProfile of the main thread; dump() writes a .pstats file (snakeviz, flameprof, gprof2dot)."""
+
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        path = os.path.splitext(path)[0] + ".pstats"
+        self.profile.dump_stats(path)
+        return path
+
+def _after_fork(registry):
+    """In a multiprocessing worker: record into a registry of its own, flushed when the worker exits."""
+    global _registry, _profiler
+    _profiler = None
+    if registry is _registry:
+        _registry = Registry(registry.run, registry.out_dir, registry.run_id, parent_pid=registry.pid)
+        util.Finalize(None, _registry.close, exitpriority=10)
+
+def start(run, out_dir=None, profile=None):
+    """
+    Switch instrumentation on for this run if an output directory or a
+    profiler is asked for (directly or through SASHA_METRICS/SASHA_PROFILE).
+    Span events and summaries go to <out_dir>/metrics.jsonl, the merged
+    counters and histograms to <out_dir>/<run>.prom, and the profile to
+    <out_dir>/<run>-<pid>.folded (or .pstats). Everything is written at exit.
+    """
+    global enabled, _registry, _profiler
+    out_dir = out_dir or os.environ.get(METRICS_ENV)
+    profile = profile or os.environ.get(PROFILE_ENV)
+    if profile and profile not in PROFILE_MODES:
+        print(f"[ERROR] Unknown profiler {profile!r} (known: {', '.join(PROFILE_MODES)}); profiling disabled.")
+        profile = None
+    if not out_dir and not profile:
+        return False
+    if _registry is not None:
+        stop()
+    _registry = Registry(run, out_dir or DEFAULT_DIR)
+    util.register_after_fork(_registry, _after_fork)
+    if profile:
+        _profiler = SamplingProfiler() if profile == "sample" else _CProfiler()
+        _profiler.start()
+    enabled = True
+    atexit.register(stop)
+    print(f"[INFO] Metrics enabled for run {_registry.run_id} in {_registry.out_dir}.")
+    return True
+
+def stop():
+    """Write out everything recorded so far and switch instrumentation off."""
+    global enabled, _registry, _profiler
+    if _registry is None:
+        return
+    enabled = False
+    registry, _registry = _registry, None
+    if _profiler is not None:
+        _profiler.stop()
+        path = _profiler.dump(os.path.join(registry.out_dir, f"{registry.run}-{registry.pid}.folded"))
+        _profiler = None
+        print(f"[INFO] Profile written to {path}.")
+    registry.close()
+    atexit.unregister(stop)
+
+def add_arguments(parser):
+    """Add the --metrics and --profile options to a command line parser."""
+    parser.add_argument("--metrics", metavar="DIR",
+                        help=f"write metrics.jsonl and a Prometheus .prom file to DIR (or set {METRICS_ENV})")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help=f"profile the run: folded stacks (sample) or a .pstats file (or set {PROFILE_ENV})")
+
+def summarize(jsonl_path, run_id=None):
+    """
+    Aggregate span events from a metrics.jsonl file (the last run if
+    run_id is None). Returns [(name, count, total, p50, p95, max)] by total time.
+    """
+    spans = {}
+    last_run = None
+    with open(jsonl_path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["type"] == "summary" and record["parent_pid"] is None:
+                last_run = record["run_id"]
+            if record["type"] == "span":
+                spans.setdefault(record["run_id"], {}).setdefault(record["name"], []).append(record["seconds"])
+    rows = []
+    for name, values in spans.get(run_id or last_run, {}).items():
+        values.sort()
+        rows.append((name, len(values), sum(values), values[len(values) // 2],
+                     values[min(len(values) - 1, int(len(values) * 0.95))], values[-1]))
+    return sorted(rows, key=lambda row: -row[2])
+
+def main():
+    """Command line entry point: metrics.py metrics.jsonl [--run RUN_ID] prints per-span timings."""
+    parser = argparse.ArgumentParser(description="Summarize a metrics.jsonl file.")
+    parser.add_argument("jsonl", help="metrics.jsonl written by a run with --metrics")
+    parser.add_argument("--run", help="run id to summarize (default: the last finished run)")
+    args = parser.parse_args()
+
+    rows = summarize(args.jsonl, args.run)
+    if not rows:
+        print("[INFO] No span events found.")
+        return
+    print(f"{'span':32} {'count':>9} {'total s':>10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, spans, total, p50, p95, longest in rows:
+        print(f"{name:32} {spans:>9} {total:10.3f} {p50 * 1000:9.3f} {p95 * 1000:9.3f} {longest * 1000:9.3f}")
+
+if __name__ == "__main__":
+    main()
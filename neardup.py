@@ -0,0 +1,335 @@
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import hashcache
+
+NUM_PERM = 128         # MinHash signature length
+SHINGLE_SIZE = 5       # Tokens per shingle
+DEFAULT_THRESHOLD = 0.8
+MASK64 = (1 << 64) - 1
+PRIME64 = 0x100000001B3
+
+# Strings, comments and code tokens. Comments and strings are matched first
+# so that quotes inside comments and slashes inside strings are ignored.
+TOKEN_RE = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>"(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?|`(?:\\.|[^`\\])*`?)
+  | (?P<word>[A-Za-z_$][\w$]*|\d[\w.]*)
+  | (?P<punct>\S)
+""", re.VERBOSE | re.DOTALL)
+
+def normalize_tokens(text):
+    """
+    Tokenize a script with comments and whitespace removed and every
+    string literal replaced by an empty one.
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        if kind == "string":
+            tokens.append('""')
+        else:
+            tokens.append(match.group())
+    return tokens
+
+def normalized_hash(tokens):
+    """SHA256 of the normalized token stream."""
+    return hashlib.sha256("\x00".join(tokens).encode()).hexdigest()
+
+def _token_hash(token, memo):
+    value = memo.get(token)
+    if value is None:
+        value = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+        memo[token] = value
+    return value
+
+def minhash_signature(tokens, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE):
+    """
+    One-permutation MinHash over token shingles.
+    Each shingle hash picks a bin and competes for that bin's minimum, so a
+    signature costs one hash per shingle instead of num_perm. Empty bins are
+    filled from the next non-empty bin (rotation densification).
+    """
+    memo = {}
+    hashes = [_token_hash(token, memo) for token in tokens]
+    if len(hashes) < shingle_size:
+        shingle_size = max(len(hashes), 1)
+
+    bins = [None] * num_perm
+    for start in range(max(len(hashes) - shingle_size + 1, 1)):
+        value = 0
+        for token_value in hashes[start:start + shingle_size]:
+            value = ((value ^ token_value) * PRIME64) & MASK64
+        value ^= value >> 29
+        index = value % num_perm
+        rank = value // num_perm
+        if bins[index] is None or rank < bins[index]:
+            bins[index] = rank
+
+    if all(v is None for v in bins):
+        return [0] * num_perm
+    original = list(bins)
+    for i in range(num_perm):
+        if original[i] is None:
+            # Borrow from the next filled bin, offset by the distance so
+            # values borrowed from different bins do not collide.
+            step = 1
+            while original[(i + step) % num_perm] is None:
+                step += 1
+            bins[i] = original[(i + step) % num_perm] + step * (MASK64 // num_perm + 1)
+    return bins
+
+def lsh_params(threshold, num_perm=NUM_PERM):
+    """Pick (bands, rows) whose S-curve is steepest around the threshold."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+def estimate_jaccard(sig_a, sig_b):
+    """Fraction of matching signature slots."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+def script_fingerprint(script_path):
+    """Return (normalized_hash, minhash_signature) for a script file."""
+    try:
+        with open(script_path, "r", encoding="utf-8", errors="replace") as f:
+            tokens = normalize_tokens(f.read())
+    except OSError as e:
+        print(f"[ERROR] Failed to read {script_path}: {e}")
+        tokens = []
+    return normalized_hash(tokens), minhash_signature(tokens)
+
+def _read_fingerprint(script_path):
+    """Return (sha256, normalized_hash, minhash_signature) for a script file, reading it once."""
+    try:
+        with open(script_path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        print(f"[ERROR] Failed to read {script_path}: {e}")
+        return None, None, None
+    tokens = normalize_tokens(data.decode("utf-8", errors="replace"))
+    return hashlib.sha256(data).hexdigest(), normalized_hash(tokens), minhash_signature(tokens)
+
+def _cluster(fingerprints, threshold, new=None):
+    """
+    Union-find over a list of (normalized_hash, signature) pairs.
+    Near-duplicate candidates are only compared when at least one of them
+    is in the index set new (all of them when new is None).
+    Returns the root index of each entry; a group's root is its lowest index.
+    """
+    parent = list(range(len(fingerprints)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    # Tier 1: identical after normalization
+    by_normalized = {}
+    for i, (norm_hash, _) in enumerate(fingerprints):
+        if norm_hash in by_normalized:
+            union(by_normalized[norm_hash], i)
+        else:
+            by_normalized[norm_hash] = i
+
+    # Tier 2: MinHash/LSH near-duplicates
+    bands, rows = lsh_params(threshold)
+    for band in range(bands):
+        buckets = defaultdict(list)
+        for i in by_normalized.values():
+            signature = fingerprints[i][1]
+            buckets[tuple(signature[band * rows:(band + 1) * rows])].append(i)
+        for members in buckets.values():
+            if new is None:
+                pairs = ((members[0], other) for other in members[1:])
+            else:
+                pairs = ((i, other) for i in members if i in new for other in members if other != i)
+            for first, other in pairs:
+                if find(first) != find(other) and \
+                        estimate_jaccard(fingerprints[first][1], fingerprints[other][1]) >= threshold:
+                    union(first, other)
+
+    return [find(i) for i in range(len(fingerprints))]
+
+def cluster_scripts(paths, threshold=DEFAULT_THRESHOLD, workers=None):
+    """
+    Group scripts whose normalized content is identical or whose estimated
+    Jaccard similarity is at least threshold. Candidate pairs come only from
+    LSH band collisions, never from pairwise comparison.
+    Returns a list of clusters (lists of paths, first one is the representative),
+    only for clusters with more than one member.
+    """
+    paths = sorted(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        fingerprints = list(pool.map(script_fingerprint, paths, chunksize=64))
+
+    clusters = defaultdict(list)
+    for path, root in zip(paths, _cluster(fingerprints, threshold)):
+        clusters[root].append(path)
+    return [members for members in clusters.values() if len(members) > 1]
+
+def _fingerprint_files(paths, workers=None):
+    """_read_fingerprint for a list of files across a process pool. Returns {path: result}."""
+    if len(paths) < 2 or workers == 1:
+        return {path: _read_fingerprint(path) for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(_read_fingerprint, paths, chunksize=64)))
+
+def _load_fingerprints(cache, shas):
+    """Return {sha256: (normalized_hash, signature)} for the shas with a cached fingerprint."""
+    shas = list(shas)
+    found = {}
+    for start in range(0, len(shas), 500):
+        chunk = shas[start:start + 500]
+        for sha256, norm_hash, signature in cache.execute(
+                f"SELECT sha256, normalized, signature FROM Fingerprints "
+                f"WHERE sha256 IN ({', '.join('?' * len(chunk))})", chunk):
+            found[sha256] = (norm_hash, json.loads(signature))
+    return found
+
+def _load_report(report_path):
+    try:
+        with open(report_path) as f:
+            report = json.load(f)
+        return report.get("threshold"), report.get("clusters", [])
+    except (OSError, ValueError):
+        return None, []
+
+def _save_report(report_path, threshold, clusters):
+    tmp_path = report_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"threshold": threshold, "clusters": clusters}, f, indent=2)
+    os.replace(tmp_path, report_path)
+
+def handle_near_duplicates(raw_dir="scripts/raw", dupe_dir="scripts/dupe",
+                           threshold=DEFAULT_THRESHOLD, workers=None, cache=None):
+    """
+    Cluster near-duplicate scripts in raw_dir, keep one representative per
+    cluster and move the rest to dupe_dir.
+    Fingerprints are kept in the hash cache (opened from the parent of raw_dir
+    unless given), so only new or changed scripts are read. They are compared
+    with the rest of raw_dir and with the representatives of earlier clusters,
+    and merged into the cluster report in dupe_dir/clusters.json.
+    Returns the clusters of the report.
+    """
+    base_dir = os.path.dirname(raw_dir)
+    own_cache = cache is None
+    if own_cache:
+        cache = hashcache.open_hash_cache(os.path.join(base_dir, "hashcache.db"))
+    try:
+        os.makedirs(dupe_dir, exist_ok=True)
+        report_path = os.path.join(dupe_dir, "clusters.json")
+        previous_threshold, report = _load_report(report_path)
+        clusters = {entry["representative"]: entry for entry in report}
+
+        known = hashcache.cached_hashes(cache, base_dir, raw_dir)
+        fingerprints = _load_fingerprints(
+            cache, set(known.values()) | {entry["sha256"] for entry in report if entry.get("sha256")})
+        hashes = {}
+        stale = []
+        for name in sorted(os.listdir(raw_dir)):
+            path = os.path.join(raw_dir, name)
+            if not name.endswith(".js"):
+                continue
+            if known.get(path) in fingerprints:
+                hashes[path] = known[path]
+            else:
+                stale.append(path)
+
+        if stale:
+            print(f"[INFO] Fingerprinting {len(stale)} new or changed scripts...")
+            rows = []
+            for path, (sha256, norm_hash, signature) in _fingerprint_files(stale, workers).items():
+                if sha256 is None:
+                    continue
+                hashes[path] = sha256
+                fingerprints[sha256] = (norm_hash, signature)
+                rows.append((sha256, norm_hash, json.dumps(signature)))
+                hashcache.record_file(cache, base_dir, os.path.relpath(path, base_dir), sha256, "raw")
+            cache.executemany("INSERT OR REPLACE INTO Fingerprints VALUES (?, ?, ?)", rows)
+            cache.commit()
+
+        # Earlier representatives come first, so they stay the representative
+        # of whatever joins them. Entries are (name, path in raw or None, sha256).
+        raw_paths = {os.path.basename(path): path for path in hashes}
+        entries = []
+        for name in sorted(clusters):
+            path = raw_paths.get(name)
+            sha256 = hashes[path] if path else clusters[name].get("sha256")
+            if sha256 in fingerprints:
+                entries.append((name, path, sha256))
+        listed = {path for _, path, _ in entries}
+        entries.extend((os.path.basename(path), path, sha256)
+                       for path, sha256 in sorted(hashes.items()) if path not in listed)
+
+        # Scripts that were already compared under this threshold are not compared again
+        stale = set(stale)
+        new = None if previous_threshold != threshold else \
+            {i for i, (_, path, _) in enumerate(entries) if path in stale}
+        groups = defaultdict(list)
+        roots = _cluster([fingerprints[sha256] for _, _, sha256 in entries], threshold, new)
+        for i, root in enumerate(roots):
+            if root != i:
+                groups[root].append(i)
+
+        moved = 0
+        for root, others in sorted(groups.items()):
+            representative, _, sha256 = entries[root]
+            entry = clusters.setdefault(representative, {"representative": representative, "members": []})
+            entry["sha256"] = sha256
+            names = []
+            for name, path, other_sha256 in (entries[i] for i in others):
+                merged = clusters.pop(name, None)
+                if merged is not None:
+                    entry["members"].extend(merged["members"])
+                if path is None:
+                    continue  # An earlier representative that has left raw
+                shutil.move(path, os.path.join(dupe_dir, name))
+                hashcache.forget_file(cache, os.path.relpath(path, base_dir))
+                hashcache.record_file(cache, base_dir, os.path.join(os.path.relpath(dupe_dir, base_dir), name),
+                                      other_sha256, "dupe")
+                entry["members"].append(name)
+                names.append(name)
+                moved += 1
+            if names:
+                print(f"[INFO] Near-duplicate cluster of {len(entry['members']) + 1} kept {representative}, "
+                      f"moved {', '.join(names)}.")
+        cache.commit()
+
+        report = sorted(clusters.values(), key=lambda entry: entry["representative"])
+        _save_report(report_path, threshold, report)
+        print(f"[INFO] {len(report)} near-duplicate clusters, {moved} scripts moved to {dupe_dir}.")
+        print(f"[INFO] Cluster report written to {report_path}.")
+        return report
+    finally:
+        if own_cache:
+            cache.close()
+
+def main():
+    """Command line entry point: neardup.py [threshold] [base_dir]."""
+    threshold = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_THRESHOLD
+    base_dir = sys.argv[2] if len(sys.argv) > 2 else "scripts"
+    handle_near_duplicates(os.path.join(base_dir, "raw"), os.path.join(base_dir, "dupe"), threshold)
+
+if __name__ == "__main__":
+    main()
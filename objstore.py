@@ -0,0 +1,167 @@
+import os
+import sys
+import errno
+import shutil
+import hashlib
+
+import hashcache
+import metrics
+
+FICLONE = 0x40049409  # Linux ioctl for copy-on-write clones (btrfs, xfs)
+LINK_FALLBACK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP)
+
+def blob_path(file_hash, objects_dir="scripts/objects"):
+    """Return the path of the blob holding the content with the given SHA256."""
+    return os.path.join(objects_dir, file_hash[:2], file_hash)
+
+def _reflink(source_path, dest_path):
+    """Clone source_path to dest_path without copying data. Raises OSError if unsupported."""
+    import fcntl
+    with open(source_path, "rb") as src, open(dest_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.unlink(dest_path)
+            raise
+
+def _place(source_path, dest_path, hardlink=True):
+    """
+    Materialize source_path at dest_path, atomically replacing it.
+    Tries a hardlink, then a reflink, then falls back to a plain copy.
+    Returns the method that was used.
+    """
+    if hardlink and os.path.exists(dest_path) and os.path.samefile(source_path, dest_path):
+        # Already linked; renaming a hardlink over itself would leave the temp name behind.
+        return "hardlink"
+    tmp_path = f"{dest_path}.tmp{os.getpid()}"
+    method = None
+    if hardlink:
+        try:
+            os.link(source_path, tmp_path)
+            method = "hardlink"
+        except OSError as e:
+            if e.errno not in LINK_FALLBACK_ERRORS:
+                raise
+    if method is None:
+        try:
+            _reflink(source_path, tmp_path)
+            method = "reflink"
+        except (OSError, ImportError):
+            with metrics.timer("file_copy_seconds", op="copy2"):
+                shutil.copy2(source_path, tmp_path)
+            method = "copy"
+    os.replace(tmp_path, dest_path)
+    metrics.count("blob_placements_total", method=method)
+    return method
+
+def store_blob(source_path, file_hash, objects_dir="scripts/objects"):
+    """
+    Add source_path to the object store under its SHA256 if it is not there yet.
+    The blob is a clone or copy (never a hardlink) so later edits to the
+    source cannot change stored content. Returns the blob path.
+    """
+    path = blob_path(file_hash, objects_dir)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _place(source_path, path, hardlink=False)
+        os.chmod(path, 0o444)
+    return path
+
+def commit_blob(tmp_path, file_hash, objects_dir="scripts/objects"):
+    """
+    Move an already written and hashed temp file into the store.
+    The temp file is discarded if the blob already exists. Returns the blob path.
+    """
+    path = blob_path(file_hash, objects_dir)
+    if os.path.exists(path):
+        os.unlink(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+    return path
+
+def link_blob(file_hash, dest_path, objects_dir="scripts/objects"):
+    """Point dest_path at the stored blob. Returns the method that was used."""
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    return _place(blob_path(file_hash, objects_dir), dest_path)
+
+def iter_blobs(objects_dir="scripts/objects"):
+    """Yield (file_hash, path) for every blob in the store."""
+    if not os.path.isdir(objects_dir):
+        return
+    for fanout in sorted(os.listdir(objects_dir)):
+        fanout_dir = os.path.join(objects_dir, fanout)
+        if len(fanout) != 2 or not os.path.isdir(fanout_dir):
+            continue
+        for name in sorted(os.listdir(fanout_dir)):
+            yield name, os.path.join(fanout_dir, name)
+
+def referenced_hashes(base_dir="scripts"):
+    """Return the set of content hashes still used by backup/ or organized/."""
+    cache = hashcache.open_hash_cache(os.path.join(base_dir, "hashcache.db"))
+    from handler import hash_files_parallel
+    store = hashcache.scan_store(cache, hash_files_parallel, base_dir=base_dir)
+    cache.close()
+    return {file_hash for file_hash, placement in store.values()
+            if placement in ("backup", "organized")}
+
+def verify(base_dir="scripts"):
+    """
+    Re-hash every blob and report corrupt and orphaned ones.
+    Returns (corrupt, orphaned) lists of blob paths.
+    """
+    objects_dir = os.path.join(base_dir, "objects")
+    referenced = referenced_hashes(base_dir)
+    corrupt = []
+    orphaned = []
+    total = 0
+    for file_hash, path in iter_blobs(objects_dir):
+        total += 1
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != file_hash:
+            corrupt.append(path)
+            print(f"[ERROR] Corrupt blob: {path}")
+        elif file_hash not in referenced:
+            orphaned.append(path)
+            print(f"[INFO] Orphaned blob: {path}")
+
+    missing = referenced - {file_hash for file_hash, _ in iter_blobs(objects_dir)}
+    for file_hash in sorted(missing):
+        print(f"[INFO] No blob for stored content {file_hash} (plain copy).")
+
+    print(f"[INFO] Verified {total} blobs: {len(corrupt)} corrupt, {len(orphaned)} orphaned.")
+    return corrupt, orphaned
+
+def gc(base_dir="scripts"):
+    """Remove blobs that nothing in backup/ or organized/ refers to any more."""
+    objects_dir = os.path.join(base_dir, "objects")
+    referenced = referenced_hashes(base_dir)
+    removed = 0
+    freed = 0
+    for file_hash, path in iter_blobs(objects_dir):
+        if file_hash not in referenced:
+            freed += os.path.getsize(path)
+            os.chmod(path, 0o644)
+            os.unlink(path)
+            removed += 1
+    print(f"[INFO] Removed {removed} orphaned blobs ({freed / (1024 * 1024):.1f} MB).")
+    return removed
+
+def main():
+    """Command line entry point: objstore.py verify|gc [base_dir]."""
+    if len(sys.argv) < 2 or sys.argv[1] not in ("verify", "gc"):
+        print("Usage: python objstore.py verify|gc [base_dir]")
+        sys.exit(2)
+    base_dir = sys.argv[2] if len(sys.argv) > 2 else "scripts"
+    if sys.argv[1] == "verify":
+        corrupt, _ = verify(base_dir)
+        sys.exit(1 if corrupt else 0)
+    gc(base_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import os
+import re
+import sys
+import glob
+import gzip
+import signal
+import time
+import shlex
+import asyncio
+import argparse
+from collections import deque, namedtuple
+
+try:
+    import zstandard
+except ImportError:  # gzip is used instead
+    zstandard = None
+
+import metrics
+
+LOG_DIR = "logs"
+ROTATE_BYTES = 64 * 1024 * 1024  # Uncompressed bytes per log segment
+RING_LINES = 1000                # Output lines kept in memory for display
+READ_SIZE = 64 * 1024
+QUEUE_CHUNKS = 64                # Chunks read ahead of the log writer before the readers pause
+MAX_LINE = 64 * 1024             # Longer lines are split for the ring buffer and display
+STOP_GRACE = 3                   # Seconds the command gets to exit after SIGTERM
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+STREAMS = ("out", "err")
+
+PumpResult = namedtuple("PumpResult", "exit_code tail bytes log_files seconds")  # bytes: {stream: count}
+
+class RotatingLog:
+    """
+    An append-only log compressed on the fly (zstd when zstandard is
+    installed, gzip otherwise) and split into numbered segments of about
+    max_bytes uncompressed bytes: base.000001.log.zst, base.000002.log.zst...
+    Segments are never deleted, so a long trace keeps everything while
+    memory use stays constant.
+    """
+
+    def __init__(self, base_path, max_bytes=ROTATE_BYTES, compression=None):
+        self.base_path = base_path
+        self.max_bytes = max_bytes
+        self.compression = compression or ("zst" if zstandard is not None else "gz")
+        if self.compression == "zst" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        self.files = []
+        self.index = 0
+        self.size = 0
+        self.raw = None
+        self.stream = None
+
+    def _open(self):
+        self.index += 1
+        path = f"{self.base_path}.{self.index:06d}.log.{self.compression}"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self.compression == "zst":
+            self.raw = open(path, "wb")
+            self.stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self.raw)
+        else:
+            self.stream = gzip.open(path, "wb", compresslevel=GZIP_LEVEL)
+        self.files.append(path)
+        self.size = 0
+
+    def write(self, data):
+        while data:
+            if self.stream is None or self.size >= self.max_bytes:
+                self._close_segment()
+                self._open()
+            part = data[:self.max_bytes - self.size]
+            self.stream.write(part)
+            self.size += len(part)
+            data = data[len(part):]
+
+    def _close_segment(self):
+        if self.stream is not None:
+            self.stream.close()
+            if self.raw is not None:
+                self.raw.close()
+            self.stream = self.raw = None
+
+    def close(self):
+        self._close_segment()
+
+def segments(base_path):
+    """The segment files of a RotatingLog, in order."""
+    return sorted(glob.glob(glob.escape(base_path) + ".[0-9][0-9][0-9][0-9][0-9][0-9].log.*"))
+
+def read_log(base_path):
+    """Yield the decompressed contents of a RotatingLog chunk by chunk."""
+    for path in segments(base_path):
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise ValueError(f"{path} needs the zstandard package")
+            with open(path, "rb") as raw, zstandard.ZstdDecompressor().stream_reader(raw) as f:
+                yield from iter(lambda: f.read(READ_SIZE), b"")
+        else:
+            with gzip.open(path, "rb") as f:
+                yield from iter(lambda: f.read(READ_SIZE), b"")
+
+def log_name(*parts):
+    """A log file name from parts (tool, package...) plus a timestamp, safe for any filesystem."""
+    name = "-".join(re.sub(r"[^A-Za-z0-9._-]+", "_", str(part)) for part in parts if part)
+    return f"{name}-{time.strftime('%Y%m%d-%H%M%S')}"
+
+async def _read(stream_name, reader, queue, ring, on_line, counts):
+    partial = b""
+    while True:
+        chunk = await reader.read(READ_SIZE)
+        if not chunk:
+            break
+        counts[stream_name] += len(chunk)
+        await queue.put((stream_name, chunk))  # Blocks while the writer is behind: the pipe fills, the command waits
+        lines = (partial + chunk).split(b"\n")
+        partial = lines.pop()
+        while len(partial) > MAX_LINE:
+            lines.append(partial[:MAX_LINE])
+            partial = partial[MAX_LINE:]
+        for line in lines:
+            _emit(stream_name, line, ring, on_line)
+    if partial:
+        _emit(stream_name, partial, ring, on_line)
+
+def _emit(stream_name, line, ring, on_line):
+    text = line.decode("utf-8", "replace").rstrip("\r")
+    ring.append((stream_name, text))
+    if on_line is not None:
+        on_line(stream_name, text)
+
+async def _write(queue, logs):
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        batch = [item]
+        while not queue.empty() and batch[-1] is not None:
+            batch.append(queue.get_nowait())
+        done = batch[-1] is None
+        if done:
+            batch.pop()
+        # Compression runs in a thread so the readers keep draining both pipes meanwhile.
+        await asyncio.to_thread(_write_batch, batch, logs)
+        if done:
+            return
+
+def _write_batch(batch, logs):
+    for stream_name, chunk in batch:
+        logs[stream_name].write(chunk)
+
+def echo_line(stream_name, text):
+    """Default on_line: print the line as it arrives, stderr in red."""
+    print(f"\033[31m{text}\033[0m" if stream_name == "err" else text, flush=True)
+
+async def _stop(process, readers, group):
+    """Stop the command (its whole process group if it has one) and let the readers reach EOF."""
+    for sig, grace in ((signal.SIGTERM, STOP_GRACE), (signal.SIGKILL, None)):
+        if process.returncode is not None:
+            break
+        try:
+            if group:
+                os.killpg(process.pid, sig)
+            else:
+                process.send_signal(sig)
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(process.wait(), grace)
+        except asyncio.TimeoutError:
+            pass
+    _, pending = await asyncio.wait(readers, timeout=STOP_GRACE)
+    for reader in pending:  # A leftover child still holds the pipe open
+        reader.cancel()
+
+async def pump(command, name=None, log_dir=LOG_DIR, shell=False, on_line=echo_line, ring_lines=RING_LINES,
+               rotate_bytes=ROTATE_BYTES, compression=None, timeout=None, interactive=False):
+    """
+    Run command and drain its stdout and stderr concurrently. Every line
+    goes to on_line (printed by default) and to a ring buffer of the last
+    ring_lines lines; the raw bytes go to RotatingLogs under log_dir named
+    <name>.out and <name>.err (no logs when name is None). A bounded queue
+    between the readers and the log writer keeps memory constant: when the
+    disk falls behind, reading pauses and the command blocks on its pipe.
+    stdin stays attached to the terminal. The command is stopped after
+    timeout seconds or when the pump is cancelled; unless interactive (a
+    REPL reading the terminal), it runs in its own session so that
+    everything it started is stopped with it. Returns a PumpResult.
+    """
+    started = time.perf_counter()
+    options = dict(stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=not interactive)
+    if shell:
+        process = await asyncio.create_subprocess_shell(command, **options)
+    else:
+        process = await asyncio.create_subprocess_exec(*command, **options)
+    ring = deque(maxlen=ring_lines)
+    counts = dict.fromkeys(STREAMS, 0)
+    logs = {}
+    if name is not None:
+        logs = {stream_name: RotatingLog(os.path.join(log_dir, f"{name}.{stream_name}"), rotate_bytes, compression)
+                for stream_name in STREAMS}
+    queue = asyncio.Queue(QUEUE_CHUNKS)
+    writer = asyncio.create_task(_write(queue, logs) if logs else _discard(queue))
+    readers = [asyncio.create_task(_read("out", process.stdout, queue, ring, on_line, counts)),
+               asyncio.create_task(_read("err", process.stderr, queue, ring, on_line, counts))]
+    try:
+        _, pending = await asyncio.wait(readers, timeout=timeout)
+        if pending:
+            raise asyncio.TimeoutError
+        for reader in readers:
+            reader.result()
+        await process.wait()
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        await _stop(process, readers, not interactive)
+        raise
+    finally:
+        await queue.put(None)
+        await writer
+        for log in logs.values():
+            log.close()
+        for stream_name, count in counts.items():
+            metrics.count("pump_bytes_total", count, stream=stream_name)
+    return PumpResult(process.returncode, list(ring), counts,
+                      [path for log in logs.values() for path in log.files], time.perf_counter() - started)
+
+async def _discard(queue):
+    while await queue.get() is not None:
+        pass
+
+def run(command, **kwargs):
+    """
+    Synchronous pump() for the menus. Ctrl-C stops the command, flushes the
+    logs and re-raises KeyboardInterrupt; a timeout raises TimeoutError.
+    """
+    try:
+        return asyncio.run(pump(command, **kwargs))
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"command did not finish within {kwargs.get('timeout')} s")
+
+def main():
+    """Command line entry point: outpump.py [--name N] COMMAND... or outpump.py --cat NAME."""
+    parser = argparse.ArgumentParser(description="Run a command with its output pumped to rotating compressed logs.")
+    parser.add_argument("command", nargs="*", help="command to run")
+    parser.add_argument("--name", help="log name (default: the program name plus a timestamp)")
+    parser.add_argument("--log-dir", default=LOG_DIR, help=f"log directory (default: {LOG_DIR})")
+    parser.add_argument("--rotate-mb", type=float, default=ROTATE_BYTES / 1024 / 1024, help="segment size in MiB")
+    parser.add_argument("--quiet", action="store_true", help="do not echo the output")
+    parser.add_argument("--timeout", type=float, help="stop the command after this many seconds")
+    parser.add_argument("--cat", metavar="NAME", help="print the log <log-dir>/NAME (e.g. trace-20240101-120000.out)")
+    args = parser.parse_args()
+
+    if args.cat:
+        for chunk in read_log(os.path.join(args.log_dir, args.cat)):
+            sys.stdout.buffer.write(chunk)
+        return
+    if not args.command:
+        parser.error("no command given")
+    name = args.name or log_name(os.path.basename(args.command[0]))
+    try:
+        result = run(args.command, name=name, log_dir=args.log_dir, on_line=None if args.quiet else echo_line,
+                     rotate_bytes=int(args.rotate_mb * 1024 * 1024), timeout=args.timeout)
+    except KeyboardInterrupt:
+        print("[INFO] Stopped.")
+        sys.exit(130)
+    except TimeoutError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(124)
+    print(f"[INFO] {shlex.join(args.command)} exited with {result.exit_code} after {result.seconds:.1f} s; "
+          f"{result.bytes['out']} bytes out, {result.bytes['err']} bytes err in {len(result.log_files)} log files.")
+    sys.exit(result.exit_code)
+
+if __name__ == "__main__":
+    main()
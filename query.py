@@ -0,0 +1,157 @@
+import sys
+import time
+import shlex
+import sqlite3
+import argparse
+
+import analyze
+
+DEFAULT_LIMIT = 50
+
+def parse_query(text):
+    """
+    Parse a search string into find_scripts keyword arguments.
+      tag:NAME      script has the tag (tag:A,B means A or B)
+      -tag:NAME     script does not have the tag
+      action:NAME   script has the action (action:A,B means A or B)
+      -action:NAME  script does not have the action
+      hooks:NAME    script hooks the class, method or native symbol
+                    (hooks:okhttp3.CertificatePinner, hooks:check, hooks:SSL_read);
+                    it cannot be negated
+      anything else is a full-text term; all terms must occur
+    Quote names with spaces: tag:"SSL Pinning Bypass".
+    Raises ValueError for a negated hooks: term.
+    """
+    query = {"tags": [], "no_tags": [], "actions": [], "no_actions": [], "hooks": [], "text": []}
+    for term in shlex.split(text):
+        negate = term.startswith("-") and ":" in term
+        field, _, value = term.lstrip("-").partition(":") if ":" in term else ("", "", term)
+        if negate and field == "hooks":
+            raise ValueError("hooks: cannot be negated")
+        if field in ("tag", "action", "hooks") and value:
+            names = [name.strip() for name in value.split(",") if name.strip()]
+            key = ("no_" if negate else "") + field.rstrip("s") + "s"
+            if negate:
+                query[key].extend(names)
+            else:
+                query[key].append(names)
+        else:
+            query["text"].append(term)
+    return query
+
+def _fts_phrase(term):
+    """Quote a search term as an FTS5 phrase so punctuation is not query syntax."""
+    return '"' + term.replace('"', '""') + '"'
+
+def find_scripts(conn, tags=(), no_tags=(), actions=(), no_actions=(), hooks=(), text=(),
+                 limit=DEFAULT_LIMIT):
+    """
+    Find scripts by tag, action and content.
+    tags and actions are lists of groups: a script must have at least one
+    name from every group. no_tags/no_actions are names it must not have.
+    hooks is a list of groups of hook targets: class names, method names or
+    native symbols, matched against the HookTargets indexes.
+    text is a list of terms that must all occur in the script body; each
+    term is matched on its own because a body is split over several rows.
+    Returns a list of dicts with id, filename, filepath and tags, by filename.
+    """
+    parts = []
+    params = []
+    for group in tags:
+        marks = ",".join("?" * len(group))
+        parts.append(("INTERSECT", "SELECT script_id FROM ScriptTags WHERE tag_id IN "
+                      f"(SELECT id FROM Tags WHERE name IN ({marks}))"))
+        params.extend(group)
+    for group in actions:
+        marks = ",".join("?" * len(group))
+        parts.append(("INTERSECT", f"SELECT script_id FROM Actions WHERE action_name IN ({marks})"))
+        params.extend(group)
+    for group in hooks:
+        marks = ",".join("?" * len(group))
+        parts.append(("INTERSECT", "SELECT script_id FROM HookTargets "
+                                   f"WHERE target IN ({marks}) OR member IN ({marks})"))
+        params.extend(group)
+        params.extend(group)
+    if text:
+        if not analyze.has_text_index(conn):
+            raise sqlite3.OperationalError("full-text search needs SQLite with FTS5")
+        for term in text:
+            parts.append(("INTERSECT", f"SELECT rowid >> {analyze.TEXT_CHUNK_SHIFT} "
+                                       "FROM ScriptText WHERE ScriptText MATCH ?"))
+            params.append(_fts_phrase(term))
+    if no_tags:
+        marks = ",".join("?" * len(no_tags))
+        parts.append(("EXCEPT", "SELECT script_id FROM ScriptTags WHERE tag_id IN "
+                      f"(SELECT id FROM Tags WHERE name IN ({marks}))"))
+        params.extend(no_tags)
+    if no_actions:
+        marks = ",".join("?" * len(no_actions))
+        parts.append(("EXCEPT", f"SELECT script_id FROM Actions WHERE action_name IN ({marks})"))
+        params.extend(no_actions)
+
+    # Set operations run on the small id lists; only the page is joined to Scripts.
+    if not parts or parts[0][0] == "EXCEPT":
+        parts.insert(0, ("", "SELECT id FROM Scripts"))
+    matching = parts[0][1] + "".join(f" {op} {sql}" for op, sql in parts[1:])
+    sql = f"""
+    SELECT id, filename, filepath, tags FROM Scripts
+    WHERE id IN ({matching})
+    ORDER BY filename
+    """
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [{"id": row[0], "filename": row[1], "filepath": row[2], "tags": row[3]}
+            for row in conn.execute(sql, params)]
+
+def search(conn, text, limit=DEFAULT_LIMIT):
+    """Run a parse_query search string."""
+    return find_scripts(conn, limit=limit, **parse_query(text))
+
+def list_tags(conn):
+    """Return (tag, script count) pairs for every tag in use."""
+    return conn.execute("""
+    SELECT Tags.name, COUNT(*) FROM ScriptTags JOIN Tags ON Tags.id = ScriptTags.tag_id
+    GROUP BY Tags.name ORDER BY Tags.name
+    """).fetchall()
+
+def hook_targets(conn, script_id):
+    """Return the (kind, target, member) hook targets recorded for a script."""
+    return conn.execute("""
+    SELECT kind, target, member FROM HookTargets WHERE script_id = ? ORDER BY kind, target, member
+    """, (script_id,)).fetchall()
+
+def main():
+    """Command line entry point: query.py [--db path] [--limit N] [terms...]."""
+    parser = argparse.ArgumentParser(description="Search the script library.")
+    parser.add_argument("terms", nargs="*",
+                        help='tag:NAME, -tag:NAME, action:NAME, -action:NAME, hooks:NAME or full-text words')
+    parser.add_argument("--db", default="scripts/scripts.db", help="script database")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="maximum results (0 for all)")
+    # -tag:/-action: filters look like options to argparse (and -hooks: like -h), so they
+    # are set aside; -hooks: is passed on so that parse_query reports it cannot be negated
+    argv = sys.argv[1:]
+    negated = [arg for arg in argv if arg.startswith(("-tag:", "-action:", "-hooks:"))]
+    args = parser.parse_args([arg for arg in argv if arg not in negated])
+    args.terms += negated
+
+    conn = analyze.connect(args.db)
+    try:
+        if not args.terms:
+            for tag, count in list_tags(conn):
+                print(f"{tag}: {count}")
+            return
+        started = time.perf_counter()
+        try:
+            results = search(conn, shlex.join(args.terms), args.limit)
+        except (ValueError, sqlite3.OperationalError) as e:
+            print(f"[ERROR] Invalid query: {e}")
+            sys.exit(2)
+        for result in results:
+            print(f"{result['filename']}  [{result['tags']}]  {result['filepath']}")
+        print(f"[INFO] {len(results)} scripts found in {(time.perf_counter() - started) * 1000:.1f} ms.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
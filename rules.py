@@ -0,0 +1,243 @@
+import os
+import re
+import json
+import hashlib
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+REGEX_OVERLAP = 256             # Bytes kept between chunks for regex patterns when streaming
+LOWER_WINDOW = 4 * 1024 * 1024  # Bytes lowercased at a time while scanning
+
+def load_rules(path=RULES_PATH):
+    """
+    Load the declarative rule file.
+    Each rule has an id, a tag, its actions, and literal and/or regex
+    patterns; a rule fires when any of its patterns occurs in the script.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    rules = []
+    for rule in data["rules"]:
+        rules.append({
+            "id": rule["id"],
+            "tag": rule["tag"],
+            "actions": list(rule.get("actions", [])),
+            "literals": list(rule.get("literals", [])),
+            "regex": list(rule.get("regex", [])),
+            "case_sensitive": rule.get("case_sensitive", True),
+        })
+    return rules
+
+def rule_fingerprint(rule):
+    """Stable hash of a single rule definition."""
+    return hashlib.sha256(json.dumps(rule, sort_keys=True).encode()).hexdigest()[:16]
+
+def rules_version(rules):
+    """Version string for a rule set; changes whenever any rule changes."""
+    digest = hashlib.sha256()
+    for fingerprint in sorted(rule_fingerprint(rule) for rule in rules):
+        digest.update(fingerprint.encode())
+    return digest.hexdigest()[:12]
+
+def _match_key(rule):
+    """The parts of a rule that decide whether it matches a script."""
+    return (sorted(rule["literals"]), sorted(rule["regex"]), rule["case_sensitive"])
+
+def plan_rescan(old_rules, new_rules):
+    """
+    Work out what a change from old_rules to new_rules means for a script
+    analysed under old_rules. Returns {new rule index: mode} where mode is
+      "keep"           the rule matches exactly as before (only outputs changed),
+      "keep-if-hit"    patterns were only added, so an old hit is still a hit,
+      "keep-if-miss"   patterns were only removed, so an old miss is still a miss,
+      "rescan"         the rule is new or changed in a way that needs the content.
+    """
+    old_by_id = {rule["id"]: rule for rule in old_rules}
+    plan = {}
+    for index, rule in enumerate(new_rules):
+        old = old_by_id.get(rule["id"])
+        if old is None or old["case_sensitive"] != rule["case_sensitive"]:
+            plan[index] = "rescan"
+            continue
+        if _match_key(old) == _match_key(rule):
+            plan[index] = "keep"
+            continue
+        old_patterns = set(old["literals"]) | {("re", r) for r in old["regex"]}
+        new_patterns = set(rule["literals"]) | {("re", r) for r in rule["regex"]}
+        if old_patterns <= new_patterns:
+            plan[index] = "keep-if-hit"
+        elif new_patterns <= old_patterns:
+            plan[index] = "keep-if-miss"
+        else:
+            plan[index] = "rescan"
+    return plan
+
+def resolve_plan(plan, new_rules, old_hit_ids):
+    """
+    Apply a plan_rescan result to one script's old hits.
+    Returns (known_hits, to_scan): rule indexes already known to match, and
+    rule indexes that still have to be checked against the content.
+    """
+    known = set()
+    to_scan = set()
+    for index, mode in plan.items():
+        hit = new_rules[index]["id"] in old_hit_ids
+        if mode == "keep" or (mode == "keep-if-hit" and hit):
+            if hit:
+                known.add(index)
+        elif mode == "keep-if-miss" and not hit:
+            continue
+        else:
+            to_scan.add(index)
+    return known, to_scan
+
+def _trie_pattern(literals):
+    """
+    Build a regex that walks a trie of the given byte literals, so all of
+    them are tried in one step per position instead of one pass each.
+    Longer literals win over their prefixes.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for byte in literal:
+            node = node.setdefault(byte, {})
+        node[None] = True
+
+    def build(node):
+        branches = [re.escape(bytes([byte])) + build(child)
+                    for byte, child in sorted((k, v) for k, v in node.items() if k is not None)]
+        if not branches:
+            return b""
+        body = branches[0] if len(branches) == 1 else b"(?:" + b"|".join(branches) + b")"
+        if None in node:
+            body = b"(?:" + body + b")?"
+        return body
+
+    return build(trie)
+
+class CompiledRules:
+    """
+    A rule set compiled for single-pass matching.
+    Every literal, lowercased, goes into one trie automaton that is run once
+    over a lowercased window of the script; hits for case-sensitive literals
+    are then confirmed against the original bytes. Regex patterns are
+    searched individually and stop at their first hit, so keep them for
+    what literals cannot express.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.version = rules_version(rules)
+
+        # lowercased literal -> [(rule index, exact literal or None if case-insensitive)]
+        self.owners = {}
+        self.regexes = []  # (compiled, rule index)
+        for index, rule in enumerate(rules):
+            for literal in rule["literals"]:
+                exact = literal.encode() if rule["case_sensitive"] else None
+                self.owners.setdefault(literal.lower().encode(), []).append((index, exact))
+            flags = 0 if rule["case_sensitive"] else re.IGNORECASE
+            for regex in rule["regex"]:
+                self.regexes.append((re.compile(regex.encode(), flags), index))
+
+        # Literals that are prefixes of a longer literal match at the same position.
+        self.prefixes = {key: [other for other in self.owners if other != key and key.startswith(other)]
+                         for key in self.owners}
+        self.automaton = re.compile(_trie_pattern(self.owners)) if self.owners else None
+        self.literal_rules = {index for owners in self.owners.values() for index, _ in owners}
+        self.max_literal = max((len(key) for key in self.owners), default=1)
+        self.has_regex = bool(self.regexes)
+
+    def _scan_window(self, window, found):
+        lowered = window.lower()
+        position = 0
+        while not self.literal_rules <= found:
+            match = self.automaton.search(lowered, position)
+            if match is None:
+                break
+            start = match.start()
+            key = match.group()
+            for literal in [key] + self.prefixes[key]:
+                for index, exact in self.owners[literal]:
+                    if exact is None or window.startswith(exact, start):
+                        found.add(index)
+            # Step one byte so overlapping literals are still seen.
+            position = start + 1
+
+    def scan(self, data, found=None):
+        """
+        Return the set of rule indexes that match anywhere in data
+        (bytes, bytearray, memoryview or mmap), adding to found if given.
+        Data is lowercased LOWER_WINDOW bytes at a time, never as a whole.
+        """
+        found = set() if found is None else found
+        if self.automaton is not None:
+            overlap = self.max_literal - 1
+            for offset in range(0, len(data), LOWER_WINDOW):
+                if self.literal_rules <= found:
+                    break
+                start = max(offset - overlap, 0)
+                self._scan_window(bytes(data[start:offset + LOWER_WINDOW]), found)
+        for compiled, index in self.regexes:
+            if index not in found and compiled.search(data):
+                found.add(index)
+        return found
+
+    def result(self, found):
+        """Turn matched rule indexes into the analysis dictionary."""
+        tags = set()
+        actions = set()
+        for index in found:
+            rule = self.rules[index]
+            tags.add(rule["tag"])
+            actions.update(rule["actions"])
+        return {
+            "tags": sorted(tags),
+            "actions": sorted(actions),
+            "rules_version": self.version,
+            "rule_hits": sorted(self.rules[index]["id"] for index in found)
+        }
+
+    def subset(self, indexes):
+        """
+        Compile only the given rules. Returns (compiled, mapping) where mapping
+        turns the subset's rule indexes back into indexes of this rule set.
+        """
+        indexes = sorted(indexes)
+        return CompiledRules([self.rules[i] for i in indexes]), dict(enumerate(indexes))
+
+_default_rules = None
+
+def default_rules():
+    """Return the compiled default rule set, loading rules.json on first use."""
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = CompiledRules(load_rules())
+    return _default_rules
+
+class ActionScanner:
+    """
+    Match a compiled rule set against a script fed in byte chunks.
+    A tail of the previous chunk is kept so patterns split across chunk
+    boundaries are still found.
+    """
+
+    def __init__(self, compiled=None):
+        self.compiled = compiled or default_rules()
+        overlap = self.compiled.max_literal - 1
+        if self.compiled.has_regex:
+            overlap = max(overlap, REGEX_OVERLAP)
+        self.overlap = overlap
+        self.tail = b""
+        self.matched = set()
+
+    def feed(self, chunk):
+        """Scan the next chunk of the script."""
+        window = self.tail + chunk if self.tail else chunk
+        if len(self.matched) < len(self.compiled.rules):
+            self.compiled.scan(window, self.matched)
+        self.tail = window[-self.overlap:] if self.overlap else b""
+
+    def result(self):
+        """Return a dictionary with the tags and actions found so far."""
+        return self.compiled.result(self.matched)
@@ -0,0 +1,392 @@
+import os
+import sys
+import time
+import atexit
+import hashlib
+import argparse
+import threading
+from collections import namedtuple
+
+import device
+import events
+import metrics
+
+WATCH_INTERVAL = 0.25  # Seconds between checks of the loaded script files
+
+ScriptInfo = namedtuple("ScriptInfo", "path sha256 loaded_at reloads")
+
+class SessionError(Exception):
+    """A session cannot be opened or a script cannot be (re)loaded."""
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def _read_script(path):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        raise SessionError(f"cannot read {path}: {e}")
+    return data.decode("utf-8", "replace"), hashlib.sha256(data).hexdigest()
+
+def print_message(session, path, message, data):
+    """Default on_message: print send() payloads and script errors."""
+    name = os.path.basename(path)
+    if message.get("type") == "send":
+        print(f"[{session.pid}] [{name}] {message.get('payload')}")
+    elif message.get("type") == "error":
+        print(f"[ERROR] [{session.pid}] [{name}] {message.get('stack') or message.get('description')}")
+    else:
+        print(f"[{session.pid}] [{name}] {message}")
+
+def print_log(session, path, level, text):
+    """Default on_log: print console.log() output."""
+    prefix = "" if level == "info" else f"[{level.upper()}] "
+    print(f"{prefix}[{session.pid}] [{os.path.basename(path)}] {text}")
+
+class _LoadedScript:
+
+    def __init__(self, path, script, source, sha256, stat_key):
+        self.path = path
+        self.script = script
+        self.source = source  # Kept to restore this version when a reload fails to load
+        self.sha256 = sha256
+        self.stat_key = stat_key  # (size, mtime) the loaded source was read at
+        self.seen_key = stat_key  # (size, mtime) of the last poll
+        self.loaded_at = time.time()
+        self.reloads = 0
+
+class AttachedSession:
+    """
+    One frida session attached to a process, kept open across menu
+    actions. Scripts are layered on it in load order, each in its own
+    frida Script; load() of a path that is already loaded reloads it.
+    A reload compiles the new source before unloading the old script, so
+    an edit that does not compile leaves the working hooks in place. An
+    edit that compiles but fails to load puts the previous version back.
+    """
+
+    def __init__(self, frida_session, pid, identifier, on_message=print_message, on_log=print_log):
+        self.frida_session = frida_session
+        self.pid = pid
+        self.identifier = identifier  # Package name, when known
+        self.on_message = on_message
+        self.on_log = on_log
+        self.lock = threading.RLock()
+        self.scripts = {}  # path -> _LoadedScript, in load order
+        self.alive = True
+        self.detach_reason = None
+        frida_session.on("detached", self._on_detached)
+
+    def _on_detached(self, reason, crash=None):
+        self.alive = False
+        self.detach_reason = reason
+        print(f"[INFO] Session with {self.identifier or self.pid} ({self.pid}) ended: {reason}.")
+
+    def _create(self, path, source):
+        try:
+            script = self.frida_session.create_script(source, name=os.path.basename(path))
+        except Exception as e:
+            raise SessionError(f"{path} does not compile: {e}")
+        script.on("message", lambda message, data: self.on_message(self, path, message, data))
+        script.set_log_handler(lambda level, text: self.on_log(self, path, level, text))
+        return script
+
+    def load(self, path):
+        """Load the script at path (or reload it if loaded). Returns the seconds it took."""
+        path = os.path.abspath(path)
+        with self.lock:
+            if not self.alive:
+                raise SessionError(f"session with {self.pid} has ended ({self.detach_reason})")
+            started = time.perf_counter()
+            stat_key = _stat_key(path)
+            source, sha256 = _read_script(path)
+            loaded = self.scripts.get(path)
+            script = self._create(path, source)
+            with metrics.timer("script_load_seconds", op="reload" if loaded else "load"):
+                if loaded is not None:
+                    self._unload_script(loaded)
+                try:
+                    script.load()
+                except Exception as e:
+                    if loaded is not None and self._restore(loaded):
+                        raise SessionError(f"{path} failed to load, previous version restored: {e}")
+                    self.scripts.pop(path, None)
+                    raise SessionError(f"{path} failed to load: {e}")
+            if loaded is not None:
+                loaded.script, loaded.source, loaded.sha256 = script, source, sha256
+                loaded.stat_key = loaded.seen_key = stat_key
+                loaded.loaded_at = time.time()
+                loaded.reloads += 1
+            else:
+                self.scripts[path] = _LoadedScript(path, script, source, sha256, stat_key)
+            return time.perf_counter() - started
+
+    def _restore(self, loaded):
+        """Load the previous source of a script again after a failed reload. Returns whether it worked."""
+        try:
+            script = self._create(loaded.path, loaded.source)
+            script.load()
+        except Exception as e:
+            print(f"[ERROR] Restoring the previous version of {loaded.path} failed: {e}")
+            return False
+        loaded.script = script
+        return True
+
+    def _unload_script(self, loaded):
+        try:
+            loaded.script.unload()
+        except Exception as e:  # Already destroyed with the process; nothing left to undo
+            print(f"[DEBUG] Unloading {loaded.path}: {e}")
+
+    def unload(self, path):
+        """Unload a script. Returns False if it was not loaded."""
+        path = os.path.abspath(path)
+        with self.lock:
+            loaded = self.scripts.pop(path, None)
+            if loaded is None:
+                return False
+            if self.alive:
+                self._unload_script(loaded)
+            return True
+
+    def reload_changed(self):
+        """
+        Reload every script whose file changed. A file counts as changed once
+        its size and mtime are the same on two checks in a row (so half
+        written files are skipped) and its content hash differs from the
+        loaded source. Returns the reloaded paths.
+        """
+        reloaded = []
+        with self.lock:
+            candidates = []
+            for loaded in self.scripts.values():
+                key = _stat_key(loaded.path)
+                if key is not None and key != loaded.stat_key and key == loaded.seen_key:
+                    candidates.append(loaded)
+                loaded.seen_key = key
+            for loaded in candidates:
+                _, sha256 = _read_script(loaded.path)
+                if sha256 == loaded.sha256:
+                    loaded.stat_key = loaded.seen_key  # Touched, not edited
+                    continue
+                try:
+                    seconds = self.load(loaded.path)
+                except SessionError as e:
+                    loaded.stat_key = loaded.seen_key  # Report a broken edit once, retry on the next save
+                    if self.scripts.get(loaded.path) is loaded:
+                        print(f"[ERROR] Reload failed, keeping the previous version: {e}")
+                    else:
+                        print(f"[ERROR] Reload failed and the previous version could not be restored, so "
+                              f"{os.path.basename(loaded.path)} is no longer loaded; load it again once fixed: {e}")
+                    continue
+                print(f"[INFO] Reloaded {os.path.basename(loaded.path)} into {self.pid} in {seconds * 1000:.1f} ms.")
+                reloaded.append(loaded.path)
+        return reloaded
+
+    def script_info(self):
+        """ScriptInfo for each loaded script, in load order."""
+        with self.lock:
+            return [ScriptInfo(loaded.path, loaded.sha256, loaded.loaded_at, loaded.reloads)
+                    for loaded in self.scripts.values()]
+
+    def detach(self):
+        """Unload every script and detach from the process."""
+        with self.lock:
+            if self.alive:
+                for loaded in reversed(list(self.scripts.values())):
+                    self._unload_script(loaded)
+                try:
+                    self.frida_session.detach()
+                except Exception as e:
+                    print(f"[DEBUG] Detaching from {self.pid}: {e}")
+            self.scripts.clear()
+            self.alive = False
+
+class SessionManager:
+    """
+    The attached sessions of one device, by PID. attach() reuses a live
+    session instead of attaching again and spawn() keeps the spawned app
+    suspended until its scripts are loaded. A background thread reloads
+    scripts whose files change (see AttachedSession.reload_changed).
+    Needs frida's Python bindings (or a fake device passed as frida_device).
+    """
+
+    def __init__(self, serial=None, frida_device=None, watch_interval=WATCH_INTERVAL,
+                 on_message=print_message, on_log=print_log):
+        self.serial = serial
+        self._frida_device = frida_device
+        self.watch_interval = watch_interval
+        self.on_message = on_message
+        self.on_log = on_log
+        self.lock = threading.Lock()
+        self.sessions = {}  # pid -> AttachedSession
+        self.watcher = None
+        self.stopping = threading.Event()
+
+    def frida_device(self):
+        if self._frida_device is None:
+            self._frida_device = device.get_session(self.serial).frida_device()
+            if self._frida_device is None:
+                raise SessionError("live sessions need frida's Python bindings (pip install frida) "
+                                   "and a reachable frida-server")
+        return self._frida_device
+
+    def _attach(self, pid, identifier):
+        try:
+            with metrics.timer("frida_attach_seconds"):
+                frida_session = self.frida_device().attach(pid)
+        except SessionError:
+            raise
+        except Exception as e:
+            raise SessionError(f"cannot attach to {pid}: {e}")
+        session = AttachedSession(frida_session, pid, identifier, self.on_message, self.on_log)
+        self.sessions[pid] = session
+        return session
+
+    def attach(self, pid, identifier=None):
+        """Return the live session for pid, attaching if there is none."""
+        with self.lock:
+            session = self.sessions.get(pid)
+            if session is not None and session.alive:
+                return session
+            return self._attach(pid, identifier)
+
+    def spawn(self, identifier, scripts=()):
+        """
+        Spawn an app, attach, load scripts before any app code runs, then
+        resume it. Returns the AttachedSession.
+        """
+        frida_device = self.frida_device()
+        try:
+            with metrics.timer("frida_spawn_seconds"):
+                pid = frida_device.spawn([identifier])
+        except Exception as e:
+            raise SessionError(f"cannot spawn {identifier}: {e}")
+        with self.lock:
+            session = self._attach(pid, identifier)
+        try:
+            for path in scripts:
+                session.load(path)
+        finally:
+            frida_device.resume(pid)
+        return session
+
+    def find(self, identifier):
+        """The live session of an app by package name, or None."""
+        with self.lock:
+            for session in self.sessions.values():
+                if session.alive and session.identifier == identifier:
+                    return session
+        return None
+
+    def live_sessions(self):
+        with self.lock:
+            for pid in [pid for pid, session in self.sessions.items() if not session.alive]:
+                del self.sessions[pid]
+            return list(self.sessions.values())
+
+    def start_watching(self):
+        """Start the background thread that hot-reloads changed scripts."""
+        with self.lock:
+            if self.watcher is not None:
+                return
+            self.stopping.clear()
+            self.watcher = threading.Thread(target=self._watch, name="script-watch", daemon=True)
+            self.watcher.start()
+
+    def _watch(self):
+        while not self.stopping.wait(self.watch_interval):
+            for session in self.live_sessions():
+                try:
+                    session.reload_changed()
+                except Exception as e:
+                    print(f"[ERROR] Hot reload in {session.pid} failed: {e}")
+
+    def close(self):
+        """Stop watching and detach every session."""
+        self.stopping.set()
+        watcher, self.watcher = self.watcher, None
+        if watcher is not None:
+            watcher.join()
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.detach()
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_manager(serial=None):
+    """
+    Return the shared SessionManager for a device (see device.get_session),
+    watching for edits. With SASHA_EVENTS set, hook output goes to the event
+    sink (see events.py) instead of the terminal.
+    """
+    with _managers_lock:
+        manager = _managers.get(serial)
+        if manager is None:
+            sink = events.get_sink()
+            if sink is not None:
+                print(f"[INFO] Recording hook events to {sink.db_path}.")
+                manager = SessionManager(serial, on_message=sink.on_message, on_log=sink.on_log)
+            else:
+                manager = SessionManager(serial)
+            _managers[serial] = manager
+            manager.start_watching()
+        return manager
+
+def close_managers():
+    with _managers_lock:
+        managers = list(_managers.values())
+        _managers.clear()
+    for manager in managers:
+        manager.close()
+
+atexit.register(close_managers)
+
+def main():
+    """Command line entry point: sessions.py (--pid P | --package P [--spawn]) SCRIPT... keeps them hot-reloaded."""
+    parser = argparse.ArgumentParser(description="Attach once and hot-reload Frida scripts as they are edited.")
+    parser.add_argument("scripts", nargs="+", help="scripts to layer on the process")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--pid", type=int, help="attach to this PID")
+    target.add_argument("--package", help="attach to (or with --spawn, spawn) this app")
+    parser.add_argument("--spawn", action="store_true", help="spawn the app with the scripts loaded")
+    parser.add_argument("--serial", help="device serial")
+    args = parser.parse_args()
+
+    manager = get_manager(args.serial)
+    try:
+        if args.package and args.spawn:
+            session = manager.spawn(args.package, args.scripts)
+        else:
+            pid, identifier = args.pid, None
+            if args.package:
+                running = [app for app in device.get_session(args.serial).applications()
+                           if app.identifier == args.package and app.pid]
+                if not running:
+                    print(f"[ERROR] {args.package} is not running; use --spawn.")
+                    sys.exit(1)
+                pid, identifier = running[0].pid, args.package
+            session = manager.attach(pid, identifier)
+            for path in args.scripts:
+                session.load(path)
+    except (SessionError, device.AdbError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    print(f"[INFO] {len(args.scripts)} scripts loaded into {session.pid}; edits are reloaded. Ctrl-C to detach.")
+    try:
+        while session.alive:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print("[INFO] Detaching.")
+    manager.close()
+
+if __name__ == "__main__":
+    main()
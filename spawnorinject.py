@@ -1,4 +1,20 @@
+import os
 import subprocess
+import sqlite3
+
+import analyze
+import appregistry
+import bundle
+import device
+import events
+import memdump
+import metrics
+import outpump
+import query
+import sessions
+
+SCRIPT_DB = "scripts/scripts.db"
+_listed_apps = None  # {identifier: App} of the previous list_running_apps, to report what changed
 
 def bold(text):
     return f"\033[1m{text}\033[0m"
@@ -14,36 +30,163 @@ def colorize(text, color):
 
 def execute_command(command, shell=False):
     """Execute a command and return the result, with error handling."""
+    tool = (command.split() if isinstance(command, str) else command)[0]
     try:
-        result = subprocess.check_output(command, shell=shell).decode('utf-8').strip()
+        with metrics.timer("command_seconds", tool=tool):
+            result = subprocess.check_output(command, shell=shell).decode('utf-8').strip()
+        metrics.count("commands_total", tool=tool, outcome="ok")
         return result
     except subprocess.CalledProcessError as e:
+        metrics.count("commands_total", tool=tool, outcome="failed")
         print(f"[ERROR] Command failed: {e}")
         return None
 
+def run_tool(command, *log_parts, interactive=False, script=None, target=None, pid=None):
+    """
+    Run a Frida tool with its stdout and stderr pumped to the terminal and
+    to rotating compressed logs named after log_parts. With SASHA_EVENTS set,
+    the send() messages and JSON console lines of script also go to the
+    event sink (see events.py). Ctrl-C stops the tool and returns to the
+    menu. Returns the PumpResult, or None if stopped.
+    """
+    tool = command.split()[0]
+    name = outpump.log_name(tool, *log_parts)
+    on_line = outpump.echo_line
+    sink = events.get_sink() if script else None
+    if sink is not None:
+        on_line = sink.line_handler(sink.script_source(pid, target, script), echo=outpump.echo_line)
+        print(f"[INFO] Recording hook events to {sink.db_path}.")
+    print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
+    try:
+        with metrics.timer("command_seconds", tool=tool):
+            result = outpump.run(command, shell=True, name=name, on_line=on_line, interactive=interactive)
+    except KeyboardInterrupt:
+        metrics.count("commands_total", tool=tool, outcome="interrupted")
+        print(f"\n[INFO] Stopped. Output so far is in {outpump.LOG_DIR}/{name}.out.*")
+        return None
+    metrics.count("commands_total", tool=tool, outcome="ok" if result.exit_code == 0 else "failed")
+    if result.exit_code != 0:
+        print(f"[ERROR] Command exited with {result.exit_code}.")
+    print(f"[INFO] Output saved to {outpump.LOG_DIR}/{name}.out.* and .err.*")
+    return result
+
+def bundle_scripts(script_choice):
+    """
+    Turn a comma-separated list of scripts (paths or script DB names) into
+    one cached bundle so they load as a single agent. Returns the path to
+    load, or None if the scripts cannot be bundled.
+    """
+    if "," not in script_choice:
+        return script_choice
+    try:
+        built = bundle.build([part.strip() for part in script_choice.split(",") if part.strip()])
+    except bundle.BundleError as e:
+        print(f"[ERROR] {e}")
+        return None
+    print(f"[INFO] {'Reusing' if built.cached else 'Built'} bundle of {', '.join(built.scripts)}: {built.path}")
+    return built.path
+
+def is_system_app(app):
+    return app.identifier.startswith(("com.android", "com.google.android"))
+
+def format_app(app):
+    """One app as a frida-ps style line: PID, name and identifier."""
+    return f"{app.pid or '-':>6}  {app.name:30}  {app.identifier}"
+
+def frida_target():
+    """Device selection options for the frida tools (the pooled session's device)."""
+    return device.get_session().frida_args()
+
+def choose_device():
+    """
+    With several devices attached and no ANDROID_SERIAL, ask which one to
+    use and pin it for the rest of the run (farm.py drives all of them).
+    """
+    if os.environ.get("ANDROID_SERIAL"):
+        return
+    try:
+        serials = [info.serial for info in device.AdbClient().devices() if info.state == "device"]
+    except device.AdbError as e:
+        print(f"[ERROR] {e}")
+        return
+    if len(serials) < 2:
+        return
+    print("\nAttached devices:")
+    for idx, serial in enumerate(serials, 1):
+        print(f"{idx}. {serial}")
+    choice = input("\nEnter the number of the device to use: ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(serials):
+        os.environ["ANDROID_SERIAL"] = serials[int(choice) - 1]
+    else:
+        print("[ERROR] Invalid choice. Using the first device.")
+        os.environ["ANDROID_SERIAL"] = serials[0]
+
 def list_running_apps(show_system_apps=False):
-    """List all running apps on the emulator, with an option to exclude system apps."""
-    command = "frida-ps -Uia"
-    output = execute_command(command, shell=True)
-    apps = []
-    
-    if not output:
-        print("[ERROR] Failed to retrieve the list of running apps. Ensure Frida is running and try again.")
-        return apps
+    """
+    List all apps on the emulator as device.App tuples, with an option to exclude system apps.
+    The list comes from the app registry, so it only waits for the device on first use.
+    Apps started, stopped, installed or removed since the previous list are reported first.
+    """
+    global _listed_apps
+    try:
+        found = appregistry.get_registry().snapshot()
+    except device.AdbError as e:
+        print(f"[ERROR] Failed to retrieve the list of running apps ({e}). Ensure the device is connected and try again.")
+        return []
+
+    current = {app.identifier: app for app in found}
+    if _listed_apps is not None:
+        diff = appregistry.diff_snapshots(_listed_apps, current)
+        for label, changed in zip(("Started", "Stopped", "Installed", "Removed"), diff):
+            changed = [app for app in changed if show_system_apps or not is_system_app(app)]
+            if changed:
+                print(f"[INFO] {label} since the last list: "
+                      + ", ".join(f"{app.identifier} ({app.pid})" if app.pid else app.identifier for app in changed))
+    _listed_apps = current
 
     print(f"[INFO] Running apps:")
-    lines = output.splitlines()
-    for index, line in enumerate(lines[1:], start=1):  # Skipping the header line
-        if "com.android" not in line and "com.google.android" not in line:  # Exclude system apps
-            formatted_line = f"{index}. {line}"
-            if index % 2 == 0:  # Alternate between regular and bold text
-                print(formatted_line)
-            else:
-                print(bold(formatted_line))
-            apps.append(line)
-    
+    apps = [app for app in found if show_system_apps or not is_system_app(app)]
+    for index, app in enumerate(apps, start=1):
+        formatted_line = f"{index}. {format_app(app)}"
+        if index % 2 == 0:  # Alternate between regular and bold text
+            print(formatted_line)
+        else:
+            print(bold(formatted_line))
     return apps
 
+def choose_app(apps, prompt="\nEnter the number (or part of the package name) of the app: "):
+    """Ask for one of apps by its list number or part of its package/name. Returns the App or None."""
+    choice = input(prompt).strip()
+    if choice.isdigit():
+        if 1 <= int(choice) <= len(apps):
+            return apps[int(choice) - 1]
+        print("[ERROR] Invalid selection. Please try again.")
+        return None
+    matches = appregistry.get_registry().find(choice, apps)
+    if len(matches) == 1:
+        return matches[0]
+    if not matches:
+        print(f"[ERROR] No app matches '{choice}'. Please try again.")
+    else:
+        print(f"[ERROR] '{choice}' matches {len(matches)} apps: {', '.join(app.identifier for app in matches)}")
+    return None
+
+def choose_pid(apps, prompt):
+    """Ask for a PID, or part of a running app's package/name. Returns the PID or None."""
+    choice = input(prompt).strip()
+    if choice.isdigit():
+        return int(choice)
+    running = [app for app in apps if app.pid is not None]
+    matches = appregistry.get_registry().find(choice, running) if choice else []
+    if len(matches) == 1:
+        return matches[0].pid
+    if not matches:
+        print("[ERROR] Invalid PID. Please enter a valid number or the name of a running app.")
+    else:
+        print(f"[ERROR] '{choice}' matches {len(matches)} running apps: "
+              f"{', '.join(f'{app.identifier} ({app.pid})' for app in matches)}")
+    return None
+
 def spawn_app_with_script():
     """Allow the user to select an app package to spawn and run a script."""
     print("[INFO] Listing running apps (excluding system apps)...")
@@ -54,33 +197,35 @@ def spawn_app_with_script():
         print("[ERROR] No apps found to spawn.")
         return
 
-    try:
-        app_index = int(input("\nEnter the number corresponding to the app you want to spawn: ").strip())
-        selected_app = apps[app_index - 1]
-        package_name = selected_app.split()[-1]  # Extract package name
-    except (ValueError, IndexError):
-        print("[ERROR] Invalid selection. Please try again.")
+    selected_app = choose_app(apps, "\nEnter the number (or part of the package name) of the app you want to spawn: ")
+    if selected_app is None:
         return
+    package_name = selected_app.identifier
 
     # Prompt for script file or CodeShare URL
-    script_choice = input("Enter the script file path or CodeShare URL: ").strip()
+    script_choice = input("Enter the script file path or CodeShare URL (several scripts: comma-separated): ").strip()
     if not script_choice:
         print("[ERROR] No script provided. Please try again.")
         return
+    script_choice = bundle_scripts(script_choice)
+    if script_choice is None:
+        return
 
     # Construct and execute the spawn command
-    command = f"frida -U -f {package_name} -l {script_choice}"
-    print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
+    command = f"frida {frida_target()} -f {package_name} -l {script_choice}"
 
-    # Use Popen to avoid blocking and provide continuous output
+    # Both pipes are drained as the session runs and kept in rotating logs
     try:
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("[INFO] App is being spawned. Output will be displayed below:\n")
-        for line in process.stdout:
-            print(line.strip())
-        process.wait()
+        with metrics.timer("frida_session_seconds", mode="spawn"):
+            print("[INFO] App is being spawned. Output will be displayed below:\n")
+            appregistry.get_registry().invalidate()  # The app gets a new PID
+            result = run_tool(command, "spawn", package_name, interactive=True,
+                              script=script_choice, target=package_name)
+        metrics.count("frida_sessions_total", mode="spawn", exit_code=result.exit_code if result else "stopped")
     except Exception as e:
+        metrics.count("frida_sessions_total", mode="spawn", exit_code="error")
         print(f"[ERROR] Failed to spawn the app: {e}")
+    appregistry.get_registry().invalidate()  # The session may have killed the app
 def inject_app_with_pid():
     """Allow the user to select an app by PID and inject a script."""
     print("[INFO] Listing running processes on the emulator...")
@@ -90,34 +235,147 @@ def inject_app_with_pid():
         print("[ERROR] No processes found to inject.")
         return
 
-    for idx, app in enumerate(apps, start=1):
-        print(f"{bold(f'[{idx}] {app}')}")
-
-    pid_input = input("\nEnter the PID of the process to inject: ").strip()
-    if not pid_input.isdigit():
-        print("[ERROR] Invalid PID. Please enter a valid number.")
+    pid_input = choose_pid(apps, "\nEnter the PID (or part of the name) of the process to inject: ")
+    if pid_input is None:
         return
 
     # Prompt for script file or CodeShare URL
-    script_choice = input("Enter the script file path or CodeShare URL: ").strip()
+    script_choice = input("Enter the script file path or CodeShare URL (several scripts: comma-separated): ").strip()
     if not script_choice:
         print("[ERROR] No script provided. Please try again.")
         return
+    script_choice = bundle_scripts(script_choice)
+    if script_choice is None:
+        return
 
     # Construct and execute the inject command
-    command = f"frida -U -p {pid_input} -l {script_choice}"
-    print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
+    command = f"frida {frida_target()} -p {pid_input} -l {script_choice}"
 
-    # Use Popen to avoid blocking and provide continuous output
+    # Both pipes are drained as the session runs and kept in rotating logs
     try:
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print("[INFO] Injecting script. Output will be displayed below:\n")
-        for line in process.stdout:
-            print(line.strip())
-        process.wait()
+        with metrics.timer("frida_session_seconds", mode="inject"):
+            print("[INFO] Injecting script. Output will be displayed below:\n")
+            result = run_tool(command, "inject", pid_input, interactive=True,
+                              script=script_choice, pid=pid_input)
+        metrics.count("frida_sessions_total", mode="inject", exit_code=result.exit_code if result else "stopped")
     except Exception as e:
+        metrics.count("frida_sessions_total", mode="inject", exit_code="error")
         print(f"[ERROR] Failed to inject the script: {e}")
 
+def view_available_scripts():
+    """Search the script DB by tag, action, or content and list the matches."""
+    try:
+        conn = analyze.connect(SCRIPT_DB)
+        tags = query.list_tags(conn)
+    except sqlite3.Error as e:
+        print(f"[ERROR] Script DB not available ({e}). Run ingest.py or analyze.py first.")
+        return
+
+    try:
+        if tags:
+            print("[INFO] Tags: " + ", ".join(f"{tag} ({count})" for tag, count in tags))
+        print("[INFO] Search with tag:NAME, -tag:NAME, action:NAME, -action:NAME, hooks:NAME and/or words in the script.")
+        print("[INFO] Example: tag:\"SSL Pinning Bypass\" action:Interceptor.attach okhttp")
+        text = input("Search (leave empty to list all): ").strip()
+        try:
+            results = query.search(conn, text, limit=0)
+        except (ValueError, sqlite3.OperationalError) as e:
+            print(f"[ERROR] Invalid search: {e}")
+            return
+    finally:
+        conn.close()
+
+    if not results:
+        print("[INFO] No matching scripts found.")
+        return
+    for index, result in enumerate(results, start=1):
+        line = f"{index}. {result['filename']} [{result['tags']}] - {result['filepath']}"
+        print(bold(line) if index % 2 else line)
+    print(f"[INFO] {len(results)} scripts found.")
+
+def show_live_session_menu():
+    """
+    Work on one attached session: scripts are loaded into the running app
+    in milliseconds and reloaded whenever their file is saved, instead of
+    respawning the app for every script. Sessions stay open after leaving
+    the menu.
+    """
+    try:
+        manager = sessions.get_manager()
+        manager.frida_device()
+    except (sessions.SessionError, device.AdbError) as e:
+        print(f"[ERROR] {e}")
+        return
+    current = None
+    while True:
+        if current is not None and not current.alive:
+            current = None
+        print("\nLive Session Menu:")
+        if current is not None:
+            names = ", ".join(os.path.basename(info.path) for info in current.script_info()) or "no scripts"
+            print(f"Session: {current.identifier or '-'} ({current.pid}) with {names}; edits are reloaded.")
+        print("[1] Spawn an app and keep it attached.")
+        print("[2] Attach to a running app.")
+        print("[3] Load (or reload) a script into the session.")
+        print("[4] Unload a script.")
+        print("[5] List sessions.")
+        print("[6] Detach from the session.")
+        print("[7] Back to Main Menu (sessions stay open).")
+
+        choice = input("Enter your choice: ").strip()
+        try:
+            if choice == "1":
+                apps = list_running_apps()
+                app = choose_app(apps) if apps else None
+                if app is None:
+                    continue
+                script = input("Enter a script file path to load before the app starts (optional): ").strip()
+                current = manager.spawn(app.identifier, [script] if script else [])
+                appregistry.get_registry().invalidate()  # The app gets a new PID
+                print(f"[INFO] Spawned {app.identifier} ({current.pid}).")
+            elif choice == "2":
+                apps = [app for app in list_running_apps() if app.pid]
+                pid = choose_pid(apps, "Enter the PID (or part of the name) of the process to attach to: ") if apps else None
+                if pid is None:
+                    continue
+                app = next((app for app in apps if app.pid == int(pid)), None)
+                current = manager.attach(int(pid), app.identifier if app else None)
+                print(f"[INFO] Attached to {current.pid}.")
+            elif choice in ("3", "4") and current is None:
+                print("[ERROR] Spawn or attach first.")
+            elif choice == "3":
+                script = input("Enter the script file path: ").strip()
+                if script:
+                    seconds = current.load(script)
+                    print(f"[INFO] Loaded {os.path.basename(script)} in {seconds * 1000:.1f} ms.")
+            elif choice == "4":
+                loaded = current.script_info()
+                for index, info in enumerate(loaded, 1):
+                    print(f"{index}. {info.path}")
+                index = input("Enter the number of the script to unload: ").strip()
+                if index.isdigit() and 1 <= int(index) <= len(loaded):
+                    current.unload(loaded[int(index) - 1].path)
+                else:
+                    print("[ERROR] Invalid choice.")
+            elif choice == "5":
+                live = manager.live_sessions()
+                if not live:
+                    print("[INFO] No live sessions.")
+                for session in live:
+                    print(f"{session.pid:>6}  {session.identifier or '-'}")
+                    for info in session.script_info():
+                        print(f"          {info.path} (reloaded {info.reloads} times)")
+            elif choice == "6":
+                if current is not None:
+                    current.detach()
+                    current = None
+            elif choice == "7":
+                return
+            else:
+                print("[ERROR] Invalid choice. Please try again.")
+        except sessions.SessionError as e:
+            print(f"[ERROR] {e}")
+
 def show_main_menu():
     """Display the main menu after setting up Frida."""
     while True:
@@ -125,9 +383,10 @@ def show_main_menu():
         print("[1] Start an app with a script from process (from script DB, file path, or CodeShare link).")
         print("[2] Inject an app with script using PID.")
         print("[3] Advanced Commands Menu (execute specific Frida commands).")
-        print("[4] View available scripts (coming soon).")
+        print("[4] Search available scripts (by tag, action, or content).")
         print("[5] Add a new script to the script DB (coming soon).")
-        print("[6] Exit.")
+        print("[6] Live session: keep an app attached and load, unload or hot-reload scripts.")
+        print("[7] Exit.")
         
         choice = input("Enter your choice: ").strip()
         if choice == "1":
@@ -137,10 +396,12 @@ def show_main_menu():
         elif choice == "3":
             show_advanced_menu()
         elif choice == "4":
-            print("[INFO] This feature is not yet implemented. Stay tuned!")
+            view_available_scripts()
         elif choice == "5":
             print("[INFO] This feature is not yet implemented. Stay tuned!")
         elif choice == "6":
+            show_live_session_menu()
+        elif choice == "7":
             print("[INFO] Exiting. Goodbye!")
             exit()
         else:
@@ -158,7 +419,7 @@ def show_advanced_menu():
         print("[6] Attach to an app and trace a function by PID (-U -p <pid> -i <function>).")
         print("[7] Discover all exported functions (-U -f <package_name>).")
         print("[8] Connect to a remote Frida server (-R <ip>:<port> -f <package_name>).")
-        print("[9] Dump app memory (-U -f <package_name> -l dump_memory.js).")
+        print("[9] Dump app memory to a deduplicated, compressed dump (see memdump.py).")
         print("[10] Execute JavaScript directly on the app (-U -p <pid> -e <js_code>).")
         print("[11] Back to Main Menu.")
         
@@ -174,154 +435,111 @@ def run_advanced_command(choice):
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        app_index = input("\nEnter the number corresponding to the app: ").strip()
-        try:
-            app_index = int(app_index)
-            package_name = apps[app_index - 1].split()[-1]
-        except (ValueError, IndexError):
-            print("[ERROR] Invalid selection.")
+        app = choose_app(apps)
+        if app is None:
             return
-        command = f"frida -U -f {package_name}"
+        package_name = app.identifier
+        command = f"frida {frida_target()} -f {package_name}"
     elif choice == "2":
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        pid = input("Enter the PID of the process to attach to: ").strip()
-        if not pid.isdigit():
-            print("[ERROR] Invalid PID.")
+        pid = choose_pid(apps, "Enter the PID (or part of the name) of the process to attach to: ")
+        if pid is None:
             return
-        command = f"frida -U -p {pid}"
+        command = f"frida {frida_target()} -p {pid}"
     elif choice == "3":
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        app_index = input("\nEnter the number corresponding to the app: ").strip()
-        try:
-            app_index = int(app_index)
-            package_name = apps[app_index - 1].split()[-1]
-        except (ValueError, IndexError):
-            print("[ERROR] Invalid selection.")
+        app = choose_app(apps)
+        if app is None:
             return
+        package_name = app.identifier
         script_path = input("Enter the script file path: ").strip()
-        command = f"frida -U -f {package_name} -l {script_path}"
+        command = f"frida {frida_target()} -f {package_name} -l {script_path}"
     elif choice == "4":
-        command = "frida-ps -Uia"
-        print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
-        result = execute_command(command, shell=True)
-        print(result if result else "[ERROR] Command failed or returned no output.")
+        list_running_apps(show_system_apps=True)
     elif choice == "5":
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        app_index = input("\nEnter the number corresponding to the app: ").strip()
-        try:
-            app_index = int(app_index)
-            package_name = apps[app_index - 1].split()[-1]
-        except (ValueError, IndexError):
-            print("[ERROR] Invalid selection.")
+        app = choose_app(apps)
+        if app is None:
             return
+        package_name = app.identifier
         function_name = input("Enter the function to trace (e.g., 'open'): ").strip()
-        command = f"frida-trace -U -i \"{function_name}\" -f {package_name}"
-        print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
-        result = execute_command(command, shell=True)
-        print(result if result else "[ERROR] Command failed or returned no output.")
+        command = f"frida-trace {frida_target()} -i \"{function_name}\" -f {package_name}"
+        run_tool(command, "trace", package_name)
     elif choice == "6":
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        pid = input("Enter the PID of the process to attach to: ").strip()
-        if not pid.isdigit():
-            print("[ERROR] Invalid PID.")
+        pid = choose_pid(apps, "Enter the PID (or part of the name) of the process to attach to: ")
+        if pid is None:
             return
         function_name = input("Enter the function to trace (e.g., 'open'): ").strip()
-        command = f"frida-trace -U -p {pid} -i \"{function_name}\""
-        print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
-        result = execute_command(command, shell=True)
-        print(result if result else "[ERROR] Command failed or returned no output.")
+        command = f"frida-trace {frida_target()} -p {pid} -i \"{function_name}\""
+        run_tool(command, "trace", pid)
     elif choice == "7":
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        app_index = input("\nEnter the number corresponding to the app: ").strip()
-        try:
-            app_index = int(app_index)
-            package_name = apps[app_index - 1].split()[-1]
-        except (ValueError, IndexError):
-            print("[ERROR] Invalid selection.")
+        app = choose_app(apps)
+        if app is None:
             return
-        command = f"frida-discover -U -f {package_name}"
-        print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
-        result = execute_command(command, shell=True)
-        print(result if result else "[ERROR] Command failed or returned no output.")
+        package_name = app.identifier
+        command = f"frida-discover {frida_target()} -f {package_name}"
+        run_tool(command, "discover", package_name)
     elif choice == "8":
         ip = input("Enter the remote server IP: ").strip()
         port = input("Enter the remote server port (default: 27042): ").strip() or "27042"
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        app_index = input("\nEnter the number corresponding to the app: ").strip()
-        try:
-            app_index = int(app_index)
-            package_name = apps[app_index - 1].split()[-1]
-        except (ValueError, IndexError):
-            print("[ERROR] Invalid selection.")
+        app = choose_app(apps)
+        if app is None:
             return
+        package_name = app.identifier
         command = f"frida -R {ip}:{port} -f {package_name}"
-        print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
-        result = execute_command(command, shell=True)
-        print(result if result else "[ERROR] Command failed or returned no output.")
+        run_tool(command, "remote", package_name, interactive=True)
     elif choice == "9":
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        app_index = input("\nEnter the number corresponding to the app: ").strip()
-        try:
-            app_index = int(app_index)
-            package_name = apps[app_index - 1].split()[-1]
-        except (ValueError, IndexError):
-            print("[ERROR] Invalid selection.")
+        app = choose_app(apps)
+        if app is None:
             return
-        command = f"frida -U -f {package_name} -l dump_memory.js"
-        print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
-        result = execute_command(command, shell=True)
-        print(result if result else "[ERROR] Command failed or returned no output.")
+        # Streamed chunk by chunk into dumps/, so large processes never sit in memory here
+        try:
+            with metrics.timer("frida_session_seconds", mode="dump"):
+                result = memdump.dump_app(sessions.get_manager(), app.identifier, app.pid)
+            memdump.print_result(result)
+        except (sessions.SessionError, memdump.DumpError) as e:
+            print(f"[ERROR] Memory dump failed: {e}")
+        except KeyboardInterrupt:
+            print("\n[INFO] Stopped; the dump so far is readable and marked incomplete.")
     elif choice == "10":
         apps = list_running_apps()
         if not apps:
             return
-        for idx, app in enumerate(apps, start=1):
-            print(f"{bold(f'[{idx}] {app}')}")
-        pid = input("Enter the PID of the process to attach to: ").strip()
-        if not pid.isdigit():
-            print("[ERROR] Invalid PID.")
+        pid = choose_pid(apps, "Enter the PID (or part of the name) of the process to attach to: ")
+        if pid is None:
             return
         js_code = input("Enter the JavaScript code to execute: ").strip()
-        command = f"frida -U -p {pid} -e \"{js_code}\""
-        print(f"[INFO] Executing: {colorize(bold(command), 'cyan')}")
-        result = execute_command(command, shell=True)
-        print(result if result else "[ERROR] Command failed or returned no output.")
+        command = f"frida {frida_target()} -p {pid} -e \"{js_code}\""
+        run_tool(command, "eval", pid, interactive=True)
     else:
         print("[ERROR] Invalid choice. Please try again.")
+    if choice in ("5", "7", "9"):
+        appregistry.get_registry().invalidate()  # These spawned the app afresh
 
 def main():
     """Main function to coordinate the Frida setup and script execution."""
+    metrics.start("spawnorinject")  # Off unless SASHA_METRICS or SASHA_PROFILE is set
     print("[INFO] Welcome to the Frida Helper Script!")
+    choose_device()
+    appregistry.get_registry().refresh()  # Fetch the app list while the menu is shown
     show_main_menu()
 
 if __name__ == "__main__":
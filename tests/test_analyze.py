@@ -0,0 +1,66 @@
+import os
+import time
+
+import analyze
+import handler
+import query
+
+PINNING = """Java.perform(function () {
+  var P = Java.use("okhttp3.CertificatePinner");
+  P.check.overload("java.lang.String", "java.util.List").implementation = function () { console.log("okhttp3"); };
+});
+"""
+OPEN_TRACE = """Interceptor.attach(Module.getExportByName(null, "open"), {
+  onEnter: function (args) { console.log(args[0].readUtf8String()); }
+});
+"""
+
+def _run(base_dir):
+    db_path = os.path.join(base_dir, "scripts.db")
+    handler.process_scripts(base_dir)
+    analyze.setup_database(db_path)
+    analyze.analyze_scripts(os.path.join(base_dir, "organized", "general"), db_path)
+    return analyze.connect(db_path)
+
+def _names(conn, text):
+    return [row["filename"] for row in query.search(conn, text)]
+
+def test_edited_script_replaces_its_old_row(tmp_path):
+    base_dir = str(tmp_path / "scripts")
+    os.makedirs(os.path.join(base_dir, "raw"))
+    script_path = os.path.join(base_dir, "raw", "a.js")
+    with open(script_path, "w") as f:
+        f.write(PINNING)
+    conn = _run(base_dir)
+    assert _names(conn, "hooks:okhttp3.CertificatePinner") == ["a.js"]
+    conn.close()
+
+    time.sleep(0.01)
+    with open(script_path, "w") as f:
+        f.write(OPEN_TRACE)
+    conn = _run(base_dir)
+    assert _names(conn, "hooks:okhttp3.CertificatePinner") == []
+    assert _names(conn, 'tag:"Java Hooks"') == []
+    assert _names(conn, "okhttp3") == []
+    assert _names(conn, "-tag:Generic-Hook") == ["a.js"]
+    assert conn.execute("SELECT COUNT(*) FROM Scripts").fetchone()[0] == 1
+    for table in ("Actions", "ScriptTags", "HookTargets"):
+        orphans = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE script_id NOT IN (SELECT id FROM Scripts)")
+        assert orphans.fetchone()[0] == 0
+    conn.close()
+
+def test_setup_removes_rows_without_a_hash(tmp_path):
+    db_path = str(tmp_path / "scripts.db")
+    analyze.setup_database(db_path)
+    conn = analyze.connect(db_path)
+    for _ in range(2):
+        script_id = conn.execute("INSERT INTO Scripts (filename, filepath) VALUES ('a.js', 'x/a.js')").lastrowid
+        conn.execute("INSERT INTO Actions (action_name, script_id) VALUES ('hook', ?)", (script_id,))
+    conn.commit()
+    conn.close()
+
+    analyze.setup_database(db_path)
+    conn = analyze.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM Scripts").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM Actions").fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+import appregistry
+import device
+import fakeadb
+
+@pytest.fixture(autouse=True)
+def no_frida_bindings(monkeypatch):
+    monkeypatch.setattr(device, "frida", None)
+
+@pytest.fixture
+def fake():
+    return fakeadb.FakeDevice("emulator-5554", packages=["com.example.bank"])
+
+@pytest.fixture
+def session(fake):
+    with fakeadb.FakeAdbServer([fake]) as server:
+        session = device.DeviceSession("emulator-5554", server.client())
+        yield session
+        session.close()
+
+def test_snapshot_after_invalidate_waits_for_refresh(fake, session):
+    registry = appregistry.AppRegistry(lambda: session)
+    assert registry.get("com.example.bank").pid is None
+    pid = fake.start("com.example.bank")
+    registry.invalidate()
+    assert registry.get("com.example.bank").pid == pid
+
+def test_invalidate_during_running_refresh(fake, session):
+    # A refresh that read the app list before the app started is still running at invalidate()
+    entered, release = threading.Event(), threading.Event()
+    before = session.applications()
+
+    class SlowSession:
+        def applications(self):
+            entered.set()
+            release.wait(5)
+            return before
+
+    registry = appregistry.AppRegistry(SlowSession)
+    registry.refresh()
+    assert entered.wait(5)
+    registry.session_factory = lambda: session
+    pid = fake.start("com.example.bank")
+    registry.invalidate()
+    release.set()
+    assert registry.get("com.example.bank").pid == pid
+
+def test_diff_snapshots():
+    old = {"a": device.App(10, "A", "a"), "b": device.App(None, "B", "b"), "c": device.App(30, "C", "c")}
+    new = {"a": device.App(11, "A", "a"), "b": device.App(20, "B", "b"), "d": device.App(None, "D", "d")}
+    diff = appregistry.diff_snapshots(old, new)
+    assert [app.pid for app in diff.started] == [11, 20]
+    assert [app.pid for app in diff.stopped] == [10, 30]
+    assert [app.identifier for app in diff.installed] == ["d"]
+    assert [app.identifier for app in diff.removed] == ["c"]
@@ -0,0 +1,23 @@
+import json
+
+import pytest
+
+import batch
+
+def write_manifest(tmp_path, jobs):
+    (tmp_path / "hook.js").write_text("send('hi');")
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"jobs": jobs}))
+    return str(path)
+
+def test_pid_job_needs_serial(tmp_path):
+    path = write_manifest(tmp_path, [{"pid": 1234, "scripts": "hook.js"}])
+    with pytest.raises(batch.ManifestError, match="serial"):
+        batch.load_manifest(path)
+
+def test_pid_job_with_serial(tmp_path):
+    path = write_manifest(tmp_path, [{"pid": 1234, "serial": "emulator-5554", "scripts": "hook.js"},
+                                     {"package": "com.example.bank", "scripts": "hook.js"}])
+    pinned, free = batch.load_manifest(path)
+    assert (pinned.pid, pinned.serial) == (1234, "emulator-5554")
+    assert (free.package, free.serial) == ("com.example.bank", None)
@@ -0,0 +1,70 @@
+import pytest
+
+import bootstrap
+import device
+import fakeadb
+import fridasetup
+
+@pytest.fixture(autouse=True)
+def no_frida_bindings(monkeypatch):
+    # Process and app lists then come over adb, which the fake server answers.
+    monkeypatch.setattr(device, "frida", None)
+
+@pytest.fixture
+def server():
+    fake = fakeadb.FakeDevice("emulator-5554", packages=["com.example.bank", "com.example.shop"],
+                              running=["com.example.bank"])
+    with fakeadb.FakeAdbServer([fake]) as server:
+        yield server
+
+@pytest.fixture
+def session(server):
+    session = device.DeviceSession("emulator-5554", server.client())
+    yield session
+    session.close()
+
+def test_devices(server):
+    assert [info.serial for info in server.client().devices()] == ["emulator-5554"]
+    assert device.DeviceSession(client=server.client()).serial == "emulator-5554"
+
+def test_shell(session):
+    assert session.shell("echo hello") == device.ShellResult("hello", 0)
+    assert session.shell("no-such-tool").exit_code == 127
+    assert session.properties()["ro.serialno"] == "emulator-5554"
+
+def test_applications(session, server):
+    bank_pid = server.devices["emulator-5554"].pids("com.example.bank")[0]
+    apps = {app.identifier: app.pid for app in session.applications()}
+    assert apps == {"com.example.bank": bank_pid, "com.example.shop": None}
+    assert session.kill("com.example.bank")
+    assert all(app.pid is None for app in session.applications())
+
+def test_root(session, server):
+    assert session.shell("id -u").output == "2000"
+    session.reverse("tcp:8080", "tcp:8080")
+    assert "restarting" in session.root()
+    assert session.shell("id -u").output == "0"
+    assert session.reverse_list() == []  # Dropped with the old adbd
+    assert "already running as root" in session.root()
+
+def test_frida_server_bootstrap(session, server):
+    fake = server.devices["emulator-5554"]
+    steps = fridasetup.setup_steps(session, frida_version=fakeadb.FRIDA_VERSION)
+    results = bootstrap.run_steps(steps)
+    assert {name: result.status for name, result in results.items()} == {
+        "frida_version": "done", "adb_root": "done", "server_version": "done", "frida_server": "done"}
+    assert results["server_version"].value == fakeadb.FRIDA_VERSION
+    assert results["frida_server"].value == fake.pids("frida-server")
+    assert device.FRIDA_PORT in session.listening_ports()
+
+    # A second run finds everything in place and changes nothing.
+    again = bootstrap.run_steps(fridasetup.setup_steps(session, frida_version=fakeadb.FRIDA_VERSION))
+    assert again["adb_root"].status == "skipped"
+    assert again["frida_server"].status == "skipped"
+    assert again["frida_server"].value == results["frida_server"].value
+
+def test_frida_server_bootstrap_without_binary(session, server):
+    server.devices["emulator-5554"].files.clear()
+    results = bootstrap.run_steps(fridasetup.setup_steps(session, frida_version=fakeadb.FRIDA_VERSION))
+    assert results["server_version"].status == "failed"
+    assert results["frida_server"].status == "blocked"
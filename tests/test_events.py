@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import time
+
+import events
+
+def count_events(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM Events").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_failed_commit_is_retried(tmp_path, capsys):
+    db_path = str(tmp_path / "events.db")
+    sink = events.EventSink(db_path, script_db=str(tmp_path / "scripts.db"))
+    sink.conn.execute("PRAGMA busy_timeout=0")  # Fail at once instead of waiting for the lock
+    source_id = sink.source(pid=1, target="com.example.bank", path="hook.js")
+
+    # Another writer holds the DB, so the sink's next commit fails with "database is locked"
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    for index in range(100):
+        sink.record(source_id, "send", {"index": index})
+    sink.wakeup.set()
+    for _ in range(500):
+        if "Could not write" in capsys.readouterr().out:
+            break
+        time.sleep(0.01)
+    other.execute("ROLLBACK")
+    other.close()
+
+    for index in range(100, 150):
+        sink.record(source_id, "send", {"index": index})
+    sink.flush()
+    assert sink.writer.is_alive()
+    sink.close()
+    assert count_events(db_path) == 150
+
+def test_sources_while_writing(tmp_path):
+    db_path = str(tmp_path / "events.db")
+    sink = events.EventSink(db_path, script_db=str(tmp_path / "scripts.db"))
+
+    def produce(pid):
+        for index in range(2000):
+            sink.record(sink.source(pid=pid, path=f"hook{index % 50}.js"), "send", index)
+    producers = [threading.Thread(target=produce, args=(pid,)) for pid in range(4)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    sink.close()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM EventSources").fetchone()[0] == 200
+        assert conn.execute("SELECT COUNT(*) FROM Events").fetchone()[0] == 8000
+    finally:
+        conn.close()
@@ -0,0 +1,141 @@
+import threading
+import time
+
+import pytest
+
+import device
+import fakeadb
+import farm
+import fridasetup
+
+SERIALS = ["emulator-5554", "emulator-5556", "emulator-5558"]
+
+@pytest.fixture(autouse=True)
+def local_frida(monkeypatch):
+    monkeypatch.setattr(device, "frida", None)
+    monkeypatch.setattr(fridasetup, "check_frida_version", lambda: fakeadb.FRIDA_VERSION)
+
+@pytest.fixture
+def server():
+    with fakeadb.FakeAdbServer([fakeadb.FakeDevice(serial) for serial in SERIALS]) as server:
+        yield server
+
+def make_farm(server, slots=1):
+    client = server.client()
+    sessions = []
+
+    def session_factory(serial):
+        sessions.append(device.DeviceSession(serial, client))
+        return sessions[-1]
+
+    device_farm = farm.DeviceFarm(client, session_factory, slots)
+    assert device_farm.discover() == SERIALS
+    device_farm.bootstrap()
+    return device_farm
+
+def test_bootstrap_leaves_a_device_without_frida_server_down(server):
+    server.devices["emulator-5556"].files.clear()
+    device_farm = make_farm(server)
+    assert {serial: state.healthy for serial, state in device_farm.devices.items()} == {
+        "emulator-5554": True, "emulator-5556": False, "emulator-5558": True}
+    results = device_farm.run_jobs([farm.FarmJob(f"job{index}", lambda session: session.serial)
+                                    for index in range(4)])
+    assert {result.serial for result in results} == {"emulator-5554", "emulator-5558"}
+
+def test_jobs_are_spread_over_devices_within_slots(server):
+    device_farm = make_farm(server, slots=2)
+    lock = threading.Lock()
+    active = {serial: 0 for serial in SERIALS}
+    peak = dict(active)
+
+    def run(session):
+        with lock:
+            active[session.serial] += 1
+            peak[session.serial] = max(peak[session.serial], active[session.serial])
+        time.sleep(0.05)
+        with lock:
+            active[session.serial] -= 1
+        return session.serial
+
+    results = device_farm.run_jobs([farm.FarmJob(f"job{index}", run) for index in range(12)])
+    assert all(result.status == "done" and result.attempts == 1 for result in results)
+    per_device = {serial: sum(result.serial == serial for result in results) for serial in SERIALS}
+    assert per_device == {serial: 4 for serial in SERIALS}
+    assert max(peak.values()) <= 2
+
+def test_pinned_job_runs_on_its_device(server):
+    device_farm = make_farm(server)
+    results = device_farm.run_jobs([farm.FarmJob(f"job{index}", lambda session: session.serial, "emulator-5558")
+                                    for index in range(3)])
+    assert [result.value for result in results] == ["emulator-5558"] * 3
+
+def test_failed_job_is_retried_on_another_device(server):
+    device_farm = make_farm(server)
+    tried = []
+
+    def run(session):
+        tried.append(session.serial)
+        if len(tried) == 1:
+            raise device.AdbError("shell died")
+        return "ok"
+
+    result = device_farm.run_job(farm.FarmJob("flaky", run))
+    assert result.status == "done"
+    assert result.attempts == 2
+    assert tried[0] != tried[1]
+    assert device_farm.devices[tried[0]].failed == 1
+
+def test_job_failing_everywhere_tries_each_device_once(server):
+    device_farm = make_farm(server)
+
+    def run(session):
+        raise device.AdbError(f"broken on {session.serial}")
+
+    result = device_farm.run_job(farm.FarmJob("broken", run), attempts=3)
+    assert result.status == "failed"
+    assert result.attempts == 3
+    assert all(state.failed == 1 for state in device_farm.devices.values())
+
+def test_device_that_keeps_failing_is_taken_out_of_rotation(server):
+    device_farm = make_farm(server)
+    bad = "emulator-5556"
+
+    def run(session):
+        if session.serial == bad:
+            raise device.AdbError("device offline")
+        return session.serial
+
+    for index in range(farm.MAX_FAILURES):
+        result = device_farm.run_job(farm.FarmJob(f"pinned{index}", run, bad), attempts=1)
+        assert result.status == "failed"
+    assert not device_farm.devices[bad].healthy
+    results = device_farm.run_jobs([farm.FarmJob(f"job{index}", run) for index in range(6)])
+    assert all(result.status == "done" and result.serial != bad for result in results)
+
+    # The device itself is fine (frida-server still listens), so a health check brings it back.
+    assert device_farm.check_health()[bad]
+    assert device_farm.devices[bad].healthy
+
+def test_script_failures_do_not_mark_the_device_unhealthy(server):
+    device_farm = make_farm(server)
+
+    def run(session):
+        raise farm.JobFailed("markers not seen: ready", farm.FridaOutput(0, [], []))
+
+    for index in range(farm.MAX_FAILURES + 1):
+        device_farm.run_job(farm.FarmJob(f"job{index}", run, "emulator-5554"), attempts=1)
+    assert device_farm.devices["emulator-5554"].healthy
+
+def test_cancel_stops_waiting_jobs(server):
+    device_farm = make_farm(server)
+    started = threading.Event()
+
+    def run(session):
+        started.set()
+        time.sleep(0.2)
+        return session.serial
+
+    threading.Thread(target=lambda: (started.wait(), device_farm.cancel()), daemon=True).start()
+    results = device_farm.run_jobs([farm.FarmJob(f"job{index}", run, "emulator-5554") for index in range(5)])
+    assert results[0].status == "done"
+    assert [result.status for result in results[1:]] == ["cancelled"] * 4
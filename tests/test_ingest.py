@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+import zipfile
+
+import ingest
+
+def test_archive_members_do_not_collide(tmp_path):
+    archive_path = str(tmp_path / "bundle.zip")
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("ssl/pin.js", "send('nested');")
+        archive.writestr("ssl_pin.js", "send('flat');")
+        archive.writestr("100%/pin.js", "send('percent');")
+    ingestor = ingest.Ingestor(str(tmp_path / "scripts"))
+    try:
+        ingestor.ingest_archive(archive_path)
+    finally:
+        ingestor.close()
+    assert sorted(os.listdir(ingestor.organized_dir)) == ["100%25%2Fpin.js", "ssl%2Fpin.js", "ssl_pin.js"]
+    assert ingestor.counts["new"] == 3
+
+def test_leftover_tmp_files_are_swept(tmp_path):
+    tmp_dir = tmp_path / "scripts" / "objects" / "tmp"
+    tmp_dir.mkdir(parents=True)
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                          capture_output=True, text=True, check=True).stdout.strip()
+    for name in (f"ingest-{dead}-abc", "ingest-xyz", f"ingest-{os.getpid()}-live"):
+        (tmp_dir / name).write_bytes(b"partial")
+    ingest.Ingestor(str(tmp_path / "scripts")).close()
+    assert os.listdir(tmp_dir) == [f"ingest-{os.getpid()}-live"]
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import memdump
+
+PAGE = 4096
+
+class FakeSource:
+    """One range of distinct pages, readable like a ProcSource."""
+    page_size = PAGE
+
+    def __init__(self, pages=16, base=0x10000):
+        self.base = base
+        self.memory = b"".join(bytes([index + 1]) * PAGE for index in range(pages))
+
+    def ranges(self, protection):
+        return [memdump.RangeInfo(self.base, len(self.memory), "r--", None)]
+
+    def read(self, address, size):
+        return self.memory[address - self.base:address - self.base + size]
+
+def test_dump_round_trip(tmp_path):
+    source = FakeSource()
+    dump_dir = str(tmp_path / "dump")
+    result = memdump.dump(source, dump_dir, read_pages=4, chunk_pages=4, compression="gz")
+    assert result.unique_pages == 16
+    with memdump.DumpReader(dump_dir) as reader:
+        assert reader.meta["complete"] and reader.meta["error"] is None
+        assert reader.read(source.base, len(source.memory)) == source.memory
+
+def test_failed_chunk_write_leaves_readable_incomplete_dump(tmp_path, monkeypatch):
+    compress = memdump._compress
+
+    def failing_compress(data, compression):
+        if data[0] == 9:  # The third chunk (pages 9 to 12)
+            raise OSError(28, "No space left on device")
+        return compress(data, compression)
+    monkeypatch.setattr(memdump, "_compress", failing_compress)
+
+    source = FakeSource()
+    dump_dir = str(tmp_path / "dump")
+    with pytest.raises(memdump.DumpError, match="No space left"):
+        memdump.dump(source, dump_dir, read_pages=4, chunk_pages=4, compression="gz")
+    assert not os.path.exists(os.path.join(dump_dir, "pages.idx.tmp"))
+    with memdump.DumpReader(dump_dir) as reader:
+        assert reader.meta["complete"] is False
+        assert "No space left" in reader.meta["error"]
+        assert reader.read(source.base, 8 * PAGE) == source.memory[:8 * PAGE]
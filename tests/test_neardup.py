@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+import neardup
+
+HOOK = """
+Java.perform(function () {
+    var Pinner = Java.use("okhttp3.CertificatePinner");
+    Pinner.check.overload("java.lang.String", "java.util.List").implementation = function (host, certs) {
+        console.log("[+] Bypassing pinning for " + host);
+        return;
+    };
+    var Trust = Java.use("com.android.org.conscrypt.TrustManagerImpl");
+    Trust.verifyChain.implementation = function (untrusted, anchors, host, auth, ocsp, sct) {
+        console.log("[+] Trusting chain for " + host);
+        return untrusted;
+    };
+    var Activity = Java.use("android.app.Activity");
+    Activity.onResume.implementation = function () {
+        console.log("[+] Resumed " + this.getClass().getName());
+        this.onResume();
+    };
+});
+"""
+
+@pytest.fixture
+def dirs(tmp_path):
+    raw_dir, dupe_dir = tmp_path / "raw", tmp_path / "dupe"
+    raw_dir.mkdir()
+    return str(raw_dir), str(dupe_dir)
+
+def write(raw_dir, name, text):
+    with open(os.path.join(raw_dir, name), "w") as f:
+        f.write(text)
+
+def run(raw_dir, dupe_dir):
+    clusters = neardup.handle_near_duplicates(raw_dir, dupe_dir, workers=1)
+    with open(os.path.join(dupe_dir, "clusters.json")) as f:
+        assert json.load(f)["clusters"] == clusters
+    return {entry["representative"]: sorted(entry["members"]) for entry in clusters}
+
+def test_new_scripts_merge_into_existing_clusters(dirs, capsys):
+    raw_dir, dupe_dir = dirs
+    write(raw_dir, "a.js", HOOK)
+    write(raw_dir, "b.js", HOOK.replace("Bypassing", "Skipping"))
+    write(raw_dir, "other.js", "send(Process.enumerateModules().map(function (m) { return m.name; }));")
+    assert run(raw_dir, dupe_dir) == {"a.js": ["b.js"]}
+    assert sorted(os.listdir(raw_dir)) == ["a.js", "other.js"]
+    capsys.readouterr()
+
+    # Only the new script is read, and it joins the cluster of a.js
+    write(raw_dir, "c.js", HOOK + "// fork\n")
+    assert run(raw_dir, dupe_dir) == {"a.js": ["b.js", "c.js"]}
+    assert "Fingerprinting 1 new or changed scripts" in capsys.readouterr().out
+
+    # Nothing new: nothing is read or moved
+    assert run(raw_dir, dupe_dir) == {"a.js": ["b.js", "c.js"]}
+    assert "Fingerprinting" not in capsys.readouterr().out
+    assert sorted(os.listdir(raw_dir)) == ["a.js", "other.js"]
+
+def test_representative_that_left_raw(dirs):
+    raw_dir, dupe_dir = dirs
+    write(raw_dir, "a.js", HOOK)
+    write(raw_dir, "b.js", HOOK.replace("Resumed", "Back in"))
+    assert run(raw_dir, dupe_dir) == {"a.js": ["b.js"]}
+    os.remove(os.path.join(raw_dir, "a.js"))
+    write(raw_dir, "d.js", HOOK.replace("Trusting", "Accepting"))
+    assert run(raw_dir, dupe_dir) == {"a.js": ["b.js", "d.js"]}
+    assert os.listdir(raw_dir) == []
@@ -0,0 +1,14 @@
+import pytest
+
+import query
+
+def test_parse_query():
+    parsed = query.parse_query('tag:"SSL Pinning Bypass",Root -tag:Generic-Hook hooks:SSL_read okhttp')
+    assert parsed["tags"] == [["SSL Pinning Bypass", "Root"]]
+    assert parsed["no_tags"] == ["Generic-Hook"]
+    assert parsed["hooks"] == [["SSL_read"]]
+    assert parsed["text"] == ["okhttp"]
+
+def test_negated_hooks_is_rejected():
+    with pytest.raises(ValueError, match="hooks: cannot be negated"):
+        query.parse_query("-hooks:SSL_read")
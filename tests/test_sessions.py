@@ -0,0 +1,133 @@
+import os
+import time
+
+import pytest
+
+import fakeadb
+import sessions
+
+@pytest.fixture
+def fake():
+    return fakeadb.FakeDevice("emulator-5554", packages=["com.example.bank"])
+
+@pytest.fixture
+def messages():
+    return []
+
+@pytest.fixture
+def manager(fake, messages):
+    def on_message(session, path, message, data):
+        messages.append((os.path.basename(path), message.get("payload"), session.pid in fake.suspended))
+
+    manager = sessions.SessionManager(frida_device=fakeadb.FakeFridaDevice(fake), watch_interval=0.01,
+                                      on_message=on_message, on_log=lambda *args: None)
+    yield manager
+    manager.close()
+
+def write(path, source, bump=1):
+    with open(path, "w") as f:
+        f.write(source)
+    # Edits in tests come faster than the mtime resolution of some filesystems.
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + bump * 1000000))
+
+def test_spawn_loads_scripts_before_resuming(manager, fake, messages, tmp_path):
+    script = tmp_path / "hook.js"
+    write(script, 'send("hooked");')
+    session = manager.spawn("com.example.bank", [str(script)])
+    assert messages == [("hook.js", "hooked", True)]
+    assert session.pid not in fake.suspended
+    assert manager.find("com.example.bank") is session
+    assert manager.attach(session.pid) is session
+
+def test_scripts_are_layered_and_unloaded(manager, tmp_path):
+    first, second = tmp_path / "a.js", tmp_path / "b.js"
+    write(first, 'send("a");')
+    write(second, 'send("b");')
+    session = manager.spawn("com.example.bank", [str(first)])
+    session.load(str(second))
+    assert [info.path for info in session.script_info()] == [str(first), str(second)]
+    script = session.scripts[str(first)].script
+    assert session.unload(str(first))
+    assert script.unloaded
+    assert not session.unload(str(first))
+
+def test_changed_script_is_reloaded_once_stable(manager, messages, tmp_path):
+    script = tmp_path / "hook.js"
+    write(script, 'send("v1");')
+    session = manager.spawn("com.example.bank", [str(script)])
+    old = session.scripts[str(script)].script
+
+    write(script, 'send("v2");', bump=2)
+    assert session.reload_changed() == []  # Seen once: may still be being written
+    assert session.reload_changed() == [str(script)]
+    assert old.unloaded
+    assert messages[-1][1] == "v2"
+    assert session.script_info()[0].reloads == 1
+    assert session.reload_changed() == []
+
+def test_touched_script_is_not_reloaded(manager, tmp_path):
+    script = tmp_path / "hook.js"
+    write(script, 'send("v1");')
+    session = manager.spawn("com.example.bank", [str(script)])
+    write(script, 'send("v1");', bump=2)
+    session.reload_changed()
+    assert session.reload_changed() == []
+    assert session.script_info()[0].reloads == 0
+
+def test_edit_that_does_not_compile_keeps_the_old_script(manager, tmp_path, capsys):
+    script = tmp_path / "hook.js"
+    write(script, 'send("v1");')
+    session = manager.spawn("com.example.bank", [str(script)])
+    loaded = session.scripts[str(script)]
+    old, sha256 = loaded.script, loaded.sha256
+
+    write(script, 'send("v2";', bump=2)
+    session.reload_changed()
+    assert session.reload_changed() == []
+    assert loaded.script is old and old.loaded
+    assert loaded.sha256 == sha256
+    assert "keeping the previous version" in capsys.readouterr().out
+
+def test_edit_that_fails_to_load_restores_the_old_script(manager, messages, tmp_path, capsys):
+    script = tmp_path / "hook.js"
+    write(script, 'send("v1");')
+    session = manager.spawn("com.example.bank", [str(script)])
+    loaded = session.scripts[str(script)]
+    sha256 = loaded.sha256
+
+    write(script, 'throw new Error("boom");', bump=2)
+    session.reload_changed()
+    assert session.reload_changed() == []
+    assert session.scripts[str(script)] is loaded
+    assert loaded.script.loaded and loaded.sha256 == sha256
+    assert messages[-1][1] == "v1"  # The old version ran again
+    assert "keeping the previous version" in capsys.readouterr().out
+
+    write(script, 'send("v3");', bump=3)  # Fixed: the next save is picked up
+    session.reload_changed()
+    assert session.reload_changed() == [str(script)]
+    assert messages[-1][1] == "v3"
+
+def test_watcher_reloads_in_the_background(manager, messages, tmp_path):
+    script = tmp_path / "hook.js"
+    write(script, 'send("v1");')
+    manager.spawn("com.example.bank", [str(script)])
+    manager.start_watching()
+    write(script, 'send("v2");', bump=2)
+    deadline = time.monotonic() + 5
+    while messages[-1][1] != "v2" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert messages[-1][1] == "v2"
+
+def test_killed_process_ends_the_session(manager, fake, tmp_path):
+    script = tmp_path / "hook.js"
+    write(script, 'send("v1");')
+    session = manager.spawn("com.example.bank", [str(script)])
+    fake.kill(session.pid)
+    assert not session.alive
+    assert session.detach_reason == "process-terminated"
+    assert manager.live_sessions() == []
+    with pytest.raises(sessions.SessionError):
+        session.load(str(script))
+    assert manager.find("com.example.bank") is None
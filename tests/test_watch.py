@@ -0,0 +1,46 @@
+import os
+import threading
+
+import pytest
+
+import watch
+from ingest import Ingestor
+
+def next_batch(batches, timeout=5):
+    """The next batch, or None if none comes within timeout seconds."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(next(batches)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return result[0] if result else None
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+@pytest.fixture(params=["inotify", "polling"])
+def make_watcher(request, monkeypatch):
+    monkeypatch.setattr(watch, "DEBOUNCE", 0.01)
+    monkeypatch.setattr(watch, "MAX_BATCH_AGE", 0.05)
+    if request.param == "polling":
+        return lambda raw_dir: watch.watch_polling(raw_dir, interval=0.01)
+    libc = watch._load_inotify()
+    if libc is None:
+        pytest.skip("no inotify here")
+    return lambda raw_dir: watch.watch_inotify(raw_dir, libc)
+
+def test_file_landing_after_setup_is_reported(make_watcher, tmp_path):
+    write(tmp_path / "old.js", "send('old');")
+    batches = make_watcher(str(tmp_path))
+    # Lands before anyone asks for the first batch (e.g. during the startup pass).
+    write(tmp_path / "new.js", "send('new');")
+    assert next_batch(batches) == ["new.js"]
+
+def test_vanished_file_is_skipped(tmp_path, capsys):
+    base_dir = str(tmp_path / "scripts")
+    ingestor = Ingestor(base_dir)
+    try:
+        assert watch._ingest(ingestor, os.path.join(ingestor.raw_dir, "gone.js")) == "error"
+    finally:
+        ingestor.close()
+    assert "Could not ingest" in capsys.readouterr().out
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+import handler
+from ingest import Ingestor
+
+DEBOUNCE = 0.2       # Seconds of quiet before a batch is flushed
+MAX_BATCH_AGE = 0.5  # Flush a batch at least this often while events keep coming
+POLL_INTERVAL = 0.5  # Polling fallback interval
+
+# inotify event flags (from <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+EVENT_HEADER = struct.Struct("iIII")
+
+def _load_inotify():
+    """Return the libc handle if inotify is available, otherwise None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+def _debounce(read_events):
+    """
+    Group names from read_events(timeout) into batches.
+    A batch is yielded after DEBOUNCE seconds without new events, or once
+    it is MAX_BATCH_AGE old.
+    """
+    pending = set()
+    first_event = last_event = 0.0
+    while True:
+        timeout = None
+        if pending:
+            deadline = min(last_event + DEBOUNCE, first_event + MAX_BATCH_AGE)
+            timeout = max(0.0, deadline - time.monotonic())
+        names = read_events(timeout)
+        now = time.monotonic()
+        if names:
+            if not pending:
+                first_event = now
+            pending.update(names)
+            last_event = now
+        if pending and (now - last_event >= DEBOUNCE or now - first_event >= MAX_BATCH_AGE):
+            yield sorted(pending)
+            pending = set()
+
+def watch_inotify(raw_dir, libc):
+    """
+    Return an iterator of batches of script names that were closed after
+    writing or moved into raw_dir. The watch is in place when this returns,
+    so nothing that lands afterwards is missed. Files still being written
+    never produce IN_CLOSE_WRITE, so partial files are not picked up.
+    """
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    wd = libc.inotify_add_watch(fd, os.fsencode(raw_dir), IN_CLOSE_WRITE | IN_MOVED_TO)
+    if wd < 0:
+        os.close(fd)
+        raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {raw_dir}")
+
+    def read_events(timeout):
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                print("[ERROR] inotify queue overflowed; rescanning raw directory.")
+                names.extend(f for f in os.listdir(raw_dir) if f.endswith(".js"))
+            elif name.endswith(".js"):
+                names.append(name)
+        return names
+
+    return _batches(read_events, fd)
+
+def _batches(read_events, fd):
+    try:
+        yield from _debounce(read_events)
+    finally:
+        os.close(fd)
+
+def watch_polling(raw_dir, interval=POLL_INTERVAL):
+    """
+    Return an iterator of batches of new or changed script names, found by
+    polling raw_dir against a snapshot taken when this is called.
+    A file is only reported once its size and mtime are unchanged across
+    two polls, so partially written files are not picked up.
+    """
+    def snapshot():
+        state = {}
+        for entry in os.scandir(raw_dir):
+            if entry.name.endswith(".js") and entry.is_file():
+                st = entry.stat()
+                state[entry.name] = (st.st_size, st.st_mtime_ns)
+        return state
+
+    reported = snapshot()
+    previous = dict(reported)
+
+    def read_events(timeout):
+        time.sleep(interval if timeout is None else min(interval, timeout))
+        nonlocal previous
+        current = snapshot()
+        names = [name for name, key in current.items()
+                 if previous.get(name) == key and reported.get(name) != key]
+        for name in names:
+            reported[name] = current[name]
+        for name in list(reported):
+            if name not in current:
+                del reported[name]
+        previous = current
+        return names
+
+    return _debounce(read_events)
+
+def _ingest(ingestor, path):
+    """Ingest one raw file; a file that vanished or cannot be read is reported and skipped."""
+    try:
+        return ingestor.ingest_path(path)
+    except OSError as e:
+        print(f"[ERROR] Could not ingest {path}: {e}")
+        return "error"
+
+def watch(base_dir="scripts", use_inotify=True):
+    """Ingest scripts as they land in raw/, without rescanning the whole tree."""
+    handler.setup_directories(base_dir)
+    ingestor = Ingestor(base_dir)
+    raw_dir = ingestor.raw_dir
+
+    # Watch first, then one full pass: a file landing in between is seen by
+    # both (and then found unchanged) instead of by neither.
+    libc = _load_inotify() if use_inotify else None
+    if libc is not None:
+        print(f"[INFO] Watching {raw_dir} with inotify.")
+        batches = watch_inotify(raw_dir, libc)
+    else:
+        print(f"[INFO] Watching {raw_dir} by polling every {POLL_INTERVAL}s.")
+        batches = watch_polling(raw_dir)
+
+    try:
+        ingestor.ingest_raw()
+        ingestor.report()
+        for names in batches:
+            started = time.monotonic()
+            results = {}
+            for name in names:
+                path = os.path.join(raw_dir, name)
+                if not os.path.isfile(path):
+                    continue  # Moved away or deleted before the batch flushed
+                results[name] = _ingest(ingestor, path)
+            ingestor.commit()
+            if results:
+                print(f"[INFO] Ingested batch of {len(results)} scripts in "
+                      f"{time.monotonic() - started:.3f}s: "
+                      + ", ".join(f"{name} ({status})" for name, status in results.items()))
+    except KeyboardInterrupt:
+        print("[INFO] Stopping watch mode.")
+    finally:
+        batches.close()
+        ingestor.close()
+
+def main():
+    """Command line entry point: watch.py [base_dir] [--poll]."""
+    args = [arg for arg in sys.argv[1:] if arg != "--poll"]
+    base_dir = args[0] if args else "scripts"
+    watch(base_dir, use_inotify="--poll" not in sys.argv)
+
+if __name__ == "__main__":
+    main()